@@ -1,35 +1,110 @@
-import pandas as pd
-import numpy as np
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+import click
+from flask import Flask, Blueprint, current_app, render_template, request, jsonify, session, redirect, url_for, Response, stream_with_context, g, send_file
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import defer
 from datetime import datetime, timedelta
 import json
 import os
-import psycopg2
+import time
+import threading
+import uuid
+from functools import wraps
 from urllib.parse import urlparse
+from werkzeug.middleware.proxy_fix import ProxyFix
 import re
-from collections import OrderedDict
-
-app = Flask(__name__)
-app.secret_key = os.environ.get("SECRET_KEY", "dev-secret-key-12345")
-
-# Configuração do banco de dados
-database_url = os.environ.get("DATABASE_URL")
-
-if database_url:
-    parsed_url = urlparse(database_url)
-    app.config["SQLALCHEMY_DATABASE_URI"] = f"postgresql+psycopg2://{parsed_url.username}:{parsed_url.password}@{parsed_url.hostname}:{parsed_url.port}{parsed_url.path}"
-else:
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///users.db"
-
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-
-db = SQLAlchemy(app)
+from planejamento import PlanejamentoCaixa, normalizar_dados, calcular_em_blocos, sensibilidade, chave_entrada, formatar_resultados, VERSAO_MOTOR, NUM_MESES_PADRAO
+from cache_resultados import CacheResultados
+from plano_compilado import PlanoCompilado
+from simulacao import simular, MAX_SIMULACOES_SINCRONO
+from busca_meta import buscar_meta
+from diario import calcular_diario
+from consolidacao import consolidar
+import tarefas
+from exportacao import gerar_csv, gerar_xlsx, MIMETYPE_XLSX
+from previsao import prever_lote, preencher_previsoes, MODELO_PADRAO, PERIODO_SAZONAL, JANELA_PADRAO
+from importacao import agregar_por_mes, montar_dados, ler_mes
+from metricas import (
+    duracao_requisicoes, consultas_banco, exportar_metricas, registrar_medidores,
+    medir, registrar_tempo, iniciar_requisicao, encerrar_requisicao, tempos_requisicao, server_timing,
+)
+try:
+    import orjson
+except ImportError:  # orjson é opcional; sem ele a resposta bruta usa o json da biblioteca padrão
+    orjson = None
+from senhas import gerar_hash, verificar_senha, precisa_atualizar, LimitadorTentativas, ServicoOcupado
+
+MAX_CENARIOS_LOTE = int(os.environ.get("MAX_CENARIOS_LOTE", 1000))
+MAX_CENARIOS_PAGINA = 100
+MAX_CENARIOS_CARREGAR = 200
+
+# Tarefas em segundo plano: quantas rodam ao mesmo tempo por usuário e quantas
+# podem estar abertas (pendentes + em execução) antes de novas serem recusadas
+MAX_TAREFAS_SIMULTANEAS = int(os.environ.get("MAX_TAREFAS_SIMULTANEAS", 2))
+MAX_TAREFAS_ABERTAS = int(os.environ.get("MAX_TAREFAS_ABERTAS", 10))
+# Tarefas em execução sem progresso por mais que isso (segundos) são dadas como interrompidas
+# no próximo despacho do usuário; pode ser alterado por app.config["TAREFA_SEM_PROGRESSO"]
+TAREFA_SEM_PROGRESSO = int(os.environ.get("TAREFA_SEM_PROGRESSO", 120))
+# Cada conexão de eventos ocupa uma thread do worker enquanto dura: poucas por worker e
+# curtas, com o cliente reconectando (ou consultando GET /tarefas/<id>) até a tarefa terminar
+INTERVALO_EVENTOS_TAREFA = 0.5
+DURACAO_MAXIMA_EVENTOS = 10
+MAX_EVENTOS_SIMULTANEOS = int(os.environ.get("MAX_EVENTOS_SIMULTANEOS", 1))
+eventos_abertos = threading.BoundedSemaphore(MAX_EVENTOS_SIMULTANEOS)
+
+# Por quanto tempo (segundos) a assinatura guardada na sessão vale sem consultar o banco
+ASSINATURA_TTL = int(os.environ.get("ASSINATURA_TTL", 60))
+
+# Limites de tentativas de login/cadastro que falharam (janela em segundos). O IP é o do
+# cliente só quando PROXIES_CONFIAVEIS diz quantos proxies (ex.: o do Render) ficam na frente
+JANELA_TENTATIVAS = int(os.environ.get("JANELA_TENTATIVAS", 300))
+PROXIES_CONFIAVEIS = int(os.environ.get("PROXIES_CONFIAVEIS", 0))
+falhas_por_ip = LimitadorTentativas(int(os.environ.get("MAX_FALHAS_IP", 30)), JANELA_TENTATIVAS)
+falhas_por_email = LimitadorTentativas(int(os.environ.get("MAX_FALHAS_EMAIL", 5)), JANELA_TENTATIVAS)
+
+cache_resultados = CacheResultados(
+    tamanho_maximo=int(os.environ.get("CACHE_RESULTADOS_TAMANHO", 1024)),
+    ttl=int(os.environ.get("CACHE_RESULTADOS_TTL", 300)),
+)
+
+# Planos compilados ficam na memória do processo, por usuário e id. O /calcular/incremental
+# recebe os dados completos do cliente: o worker que não tem o plano compila na hora
+planos_compilados = CacheResultados(
+    tamanho_maximo=int(os.environ.get("PLANOS_COMPILADOS_TAMANHO", 256)),
+    ttl=int(os.environ.get("PLANOS_COMPILADOS_TTL", 1800)),
+)
+
+db = SQLAlchemy()
+rotas = Blueprint("rotas", __name__)
+
+# Tempo e contagem de consultas ao banco, somados na etapa "db" da requisição
+@event.listens_for(Engine, "before_cursor_execute")
+def iniciar_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info["inicio_consulta"] = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def encerrar_consulta(conn, cursor, statement, parameters, context, executemany):
+    registrar_tempo("db", time.perf_counter() - conn.info.pop("inicio_consulta", time.perf_counter()))
+    consultas_banco.somar()
+
+def iniciar_medicao():
+    g.inicio_requisicao = time.perf_counter()
+    g.token_metricas = iniciar_requisicao()
+
+def registrar_medicao(resposta):
+    # Respostas em streaming são medidas até o envio dos cabeçalhos
+    total = time.perf_counter() - g.inicio_requisicao
+    rota = request.url_rule.rule if request.url_rule else "desconhecida"
+    duracao_requisicoes.observar(total, rota, request.method, str(resposta.status_code))
+    resposta.headers["Server-Timing"] = server_timing(tempos_requisicao(), total)
+    return resposta
+
+def encerrar_medicao(erro=None):
+    token = g.pop("token_metricas", None)
+    if token is not None:
+        encerrar_requisicao(token)
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -39,10 +114,10 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = gerar_hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verificar_senha(self.password_hash, password)
 
     def has_active_subscription(self):
         if not self.subscription_end:
@@ -55,382 +130,235 @@ class User(db.Model):
         else:
             self.subscription_end = datetime.utcnow() + timedelta(days=days)
 
-class PlanejamentoCaixa:
-    def __init__(self, num_meses=6):
-        self.num_meses = num_meses
-        self.setup = {
-            "vendas_vista": 0.3,
-            "vendas_parcelamento": 5,
-            "plus_vendas": 0,
-            "cmv": 0.4480,
-            "percent_compras": 0.2,
-            "compras_vista": 0.2,
-            "compras_parcelamento": 6,
-            "desp_variaveis_impostos": 0.0613,
-            "desp_variaveis_parcelamento": 0.1313
-        }
-        self.previsao_vendas = [0] * self.num_meses
-        self.contas_receber_anteriores = [0] * self.num_meses
-        self.contas_pagar_anteriores = [0] * self.num_meses
-        self.desp_fixas_manuais = [0] * self.num_meses
-        self.desp_variaveis_manuais = [0]
-        self.venda_mes0 = 0  # Vendas do mês anterior
-        self.saldo_caixa_mes0 = 0  # Saldo de caixa inicial (Mês 0)
-
-    def calcular(self, dados):
-        for key in self.setup:
-            if key in dados.get("setup", {}):
-                self.setup[key] = float(dados["setup"][key])
-
-        # Obter venda_mes0 e saldo_caixa_mes0 dos dados recebidos
-        if "venda_mes0" in dados:
-            self.venda_mes0 = float(dados["venda_mes0"])
-        else:
-            self.venda_mes0 = 0
+# JSONB no Postgres, JSON comum no SQLite
+JSONCompacto = db.JSON().with_variant(JSONB(), "postgresql")
 
-        if "saldo_caixa_mes0" in dados:
-            self.saldo_caixa_mes0 = float(dados["saldo_caixa_mes0"])
-        else:
-            self.saldo_caixa_mes0 = 0
-
-        if "previsao_vendas" in dados:
-            self.previsao_vendas = [float(x) for x in dados["previsao_vendas"]]
-        if "contas_receber_anteriores" in dados:
-            self.contas_receber_anteriores = [float(x) for x in dados["contas_receber_anteriores"]]
-        if "contas_pagar_anteriores" in dados:
-            self.contas_pagar_anteriores = [float(x) for x in dados["contas_pagar_anteriores"]]
-        if "desp_fixas_manuais" in dados:
-            self.desp_fixas_manuais = [float(x) for x in dados["desp_fixas_manuais"]]
-        if "desp_variaveis_manuais" in dados:
-            self.desp_variaveis_manuais = [float(x) for x in dados["desp_variaveis_manuais"][:1]]
-
-        # 1. Escalonamento das Vendas com Plus
-        plus = self.setup["plus_vendas"]
-        self.vendas_escalonadas = [
-            venda * (1 + plus) if plus > 0 else venda
-            for venda in self.previsao_vendas
-        ]
+class Scenario(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    name = db.Column(db.String(120), nullable=False)
+    payload = db.Column(JSONCompacto, nullable=False)
+    results = db.Column(JSONCompacto, nullable=True)
+    input_hash = db.Column(db.String(64), nullable=True)
+    engine_version = db.Column(db.String(16), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Listagem por usuário com paginação por chave (user_id, id)
+    __table_args__ = (db.Index("ix_scenario_user_id_id", "user_id", "id"),)
+
+    def results_outdated(self):
+        # Resultados gravados antes do formato bruto também são refeitos
+        return self.results is None or self.engine_version != VERSAO_MOTOR or self.results.get("formato") != "raw"
+
+    def store_results(self, entrada, resultados):
+        self.results = resultados
+        self.input_hash = chave_entrada(entrada)
+        self.engine_version = VERSAO_MOTOR
+
+    def to_dict(self, include_data=True, bruto=False):
+        # Os resultados ficam guardados no formato bruto (format=raw, sem arredondar em centavos)
+        # e são formatados na leitura
+        dados = {
+            "id": self.id,
+            "nome": self.name,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+        if include_data:
+            dados["dados"] = self.payload
+            dados["resultados"] = self.results if bruto or self.results is None else formatar_resultados(self.results)
+        return dados
+
+class Job(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default=tarefas.PENDENTE)
+    progress = db.Column(db.Float, nullable=False, default=0.0)
+    payload = db.Column(JSONCompacto, nullable=False)
+    result = db.Column(JSONCompacto, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (db.Index("ix_job_user_id_status", "user_id", "status"),)
+
+    def to_dict(self, include_result=False):
+        dados = {
+            "id": self.id,
+            "tipo": self.kind,
+            "status": self.status,
+            "progresso": self.progress,
+            "erro": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+        if include_result:
+            dados["resultado"] = self.result
+        return dados
+
+def despachar_tarefas(user_id):
+    # Coloca em execução as tarefas pendentes do usuário até o limite de simultâneas.
+    # A linha do usuário fica travada durante a contagem (FOR UPDATE no Postgres; no
+    # SQLite as escritas já são serializadas), então workers diferentes não passam do limite.
+    # Roda só na submissão, no cancelamento e no fim de cada tarefa: as consultas não travam nada.
+    url_banco = db.engine.url.render_as_string(hide_password=False)
+    app = current_app._get_current_object()
+    sem_progresso = timedelta(seconds=app.config["TAREFA_SEM_PROGRESSO"])
+    while True:
+        db.session.query(User.id).filter_by(id=user_id).with_for_update().one()
+        Job.query.filter(
+            Job.user_id == user_id,
+            Job.status == tarefas.EXECUTANDO,
+            Job.updated_at < datetime.utcnow() - sem_progresso,
+        ).update({"status": tarefas.ERRO, "error": "Tarefa interrompida.", "finished_at": datetime.utcnow()})
+        executando = Job.query.filter_by(user_id=user_id, status=tarefas.EXECUTANDO).count()
+        proxima = None
+        if executando < MAX_TAREFAS_SIMULTANEAS:
+            proxima = Job.query.filter_by(user_id=user_id, status=tarefas.PENDENTE) \
+                .order_by(Job.created_at, Job.id).first()
+        if proxima is None:
+            db.session.commit()
+            return
+        proxima.status = tarefas.EXECUTANDO
+        proxima.started_at = proxima.updated_at = datetime.utcnow()
+        tarefa_id, tipo, dados = proxima.id, proxima.kind, proxima.payload
+        db.session.commit()
+        try:
+            tarefas.submeter(url_banco, tarefa_id, tipo, dados, lambda future, tarefa_id=tarefa_id: threading.Thread(
+                target=tarefa_encerrada, args=(app, user_id, tarefa_id, future), daemon=True
+            ).start())
+        except Exception as e:
+            # Sem isso a tarefa ficaria "executando" sem processo até TAREFA_SEM_PROGRESSO
+            Job.query.filter_by(id=tarefa_id, status=tarefas.EXECUTANDO).update(
+                {"status": tarefas.ERRO, "error": f"Falha ao iniciar a tarefa: {e}", "finished_at": datetime.utcnow()}
+            )
+            db.session.commit()
 
-        # 2. Fluxo de recebimentos
-        n_parcelas = int(self.setup["vendas_parcelamento"])
-        self.vendas_vista = [
-            venda * self.setup["vendas_vista"]
-            for venda in self.vendas_escalonadas
-        ]
+def tarefa_encerrada(app, user_id, tarefa_id, future):
+    # Roda fora da requisição quando o processo devolve a tarefa: registra falhas do
+    # próprio processo (ex.: morto pelo sistema) e libera a vaga para a próxima pendente
+    with app.app_context():
+        try:
+            erro = future.exception()
+            if erro is not None:
+                Job.query.filter_by(id=tarefa_id, status=tarefas.EXECUTANDO).update(
+                    {"status": tarefas.ERRO, "error": f"Falha no processo da tarefa: {erro}", "finished_at": datetime.utcnow()}
+                )
+                db.session.commit()
+            despachar_tarefas(user_id)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception("Erro ao despachar tarefas do usuário %s", user_id)
+
+def atualizar_resultados(cenarios, forcar=False):
+    # Recalcula, num único lote, só os cenários sem resultado ou de outra versão do motor
+    pendentes = [cenario for cenario in cenarios if forcar or cenario.results_outdated()]
+    if not pendentes:
+        return False
+    payloads = preencher_previsoes([cenario.payload for cenario in pendentes], NUM_MESES_PADRAO)
+    entradas = [normalizar_dados(payload) for payload in payloads]
+    for posicao, planejamento in calcular_em_blocos(entradas):
+        pendentes[posicao].store_results(entradas[posicao], planejamento.gerar_resultados_brutos(centavos=False))
+    return True
+
+def com_previsao(dados):
+    # Dados só com "historico_vendas" recebem a previsão de vendas, como no /calcular
+    return preencher_previsoes([dados], NUM_MESES_PADRAO)[0]
+
+def json_compacto(dados):
+    # Serialização rápida e sem espaços para o formato bruto (format=raw)
+    if orjson is not None:
+        return orjson.dumps(dados, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(dados, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def formato_bruto():
+    return request.args.get("format") == "raw"
+
+class UsuarioSessao:
+    # Cópia do usuário guardada na sessão assinada; evita ir ao banco a cada requisição
+    def __init__(self, dados):
+        self.id = dados["id"]
+        self.email = dados["email"]
+        self.subscription_end = datetime.fromisoformat(dados["subscription_end"]) if dados["subscription_end"] else None
 
-        self.duplicatas_receber = [[0] * self.num_meses for _ in range(n_parcelas)]
-
-        # CALCULAR CONTAS A RECEBER PARCELADO REFERENTE AO MÊS 1 COM BASE NO MÊS 0
-        # Para o primeiro mês, usar venda_mes0 como base
-        if self.venda_mes0 > 0:
-            valor_parcelado_mes0 = (self.venda_mes0 - (self.venda_mes0 * self.setup["vendas_vista"])) / n_parcelas
-            for parcela_idx in range(n_parcelas):
-                mes_recebimento = parcela_idx  # Mês 0, 1, 2, ... (ajustado para índice 0-based)
-                if mes_recebimento < self.num_meses:
-                    self.duplicatas_receber[parcela_idx][mes_recebimento] += valor_parcelado_mes0
-
-        # Para os demais meses, usar as vendas escalonadas normalmente
-        for mes in range(self.num_meses):
-            valor_parcelado = (self.vendas_escalonadas[mes] - self.vendas_vista[mes]) / n_parcelas
-            for parcela_idx in range(n_parcelas):
-                mes_recebimento = mes + parcela_idx + 1
-                if mes_recebimento < self.num_meses:
-                    self.duplicatas_receber[parcela_idx][mes_recebimento] += valor_parcelado
-
-        self.total_recebimentos = []
-        for mes in range(self.num_meses):
-            total = self.vendas_vista[mes]
-            for p in range(n_parcelas):
-                total += self.duplicatas_receber[p][mes]
-            total += self.contas_receber_anteriores[mes]
-            self.total_recebimentos.append(total)
-
-        # 3. Planejamento de Compras - CÁLCULO CORRIGIDO
-        # LINHA MÃE: Compras (CMV * % Compras sobre CMV)
-        self.compras_totais = [0] * self.num_meses
-        
-        # CALCULAR COMPRAS REFERENTE AO MÊS 1 COM BASE NO MÊS 0
-        # Para o primeiro mês, usar venda_mes0 como base
-        if self.venda_mes0 > 0 and self.num_meses > 0:
-            self.compras_totais[0] = self.venda_mes0 * self.setup["cmv"] * self.setup["percent_compras"]
-        
-        # Para os demais meses, usar as vendas do mês anterior normalmente
-        for mes in range(1, self.num_meses):
-            self.compras_totais[mes] = self.vendas_escalonadas[mes - 1] * self.setup["cmv"] * self.setup["percent_compras"]
-
-        # LINHA FILHA: Fornecedores à Vista (Compras * % Compras a Vista)
-        self.fornecedores_vista = [
-            compra_total * self.setup["compras_vista"]
-            for compra_total in self.compras_totais
-        ]
+    def has_active_subscription(self):
+        if not self.subscription_end:
+            return False
+        return self.subscription_end > datetime.utcnow()
 
-        n_parcelas_compras = int(self.setup["compras_parcelamento"])
-        self.duplicatas_pagar = [[0] * self.num_meses for _ in range(n_parcelas_compras)]
-
-        # CALCULAR FORNECEDORES PARCELADOS REFERENTE AO MÊS 1 COM BASE NO MÊS 0
-        # Para o primeiro mês, usar venda_mes0 como base
-        if self.venda_mes0 > 0:
-            compra_total_mes0 = self.venda_mes0 * self.setup["cmv"] * self.setup["percent_compras"]
-            fornecedor_vista_mes0 = compra_total_mes0 * self.setup["compras_vista"]
-            # Fornecedores Parcelados = (Compras totais - Fornecedores à vista) / N parcelas
-            valor_parcelado_fornecedor_mes0 = (compra_total_mes0 - fornecedor_vista_mes0) / n_parcelas_compras
-            for parcela_idx in range(n_parcelas_compras):
-                mes_pagamento = parcela_idx  # Mês 0, 1, 2, ... (ajustado para índice 0-based)
-                if mes_pagamento < self.num_meses:
-                    self.duplicatas_pagar[parcela_idx][mes_pagamento] += valor_parcelado_fornecedor_mes0
-
-        # Para os demais meses, usar as compras normalmente
-        for mes in range(self.num_meses):
-            # Fornecedores Parcelados = (Compras totais - Fornecedores à vista) / N parcelas
-            valor_parcelado = (self.compras_totais[mes] - self.fornecedores_vista[mes]) / n_parcelas_compras
-            for parcela_idx in range(n_parcelas_compras):
-                mes_pagamento = mes + parcela_idx + 1
-                if mes_pagamento < self.num_meses:
-                    self.duplicatas_pagar[parcela_idx][mes_pagamento] += valor_parcelado
-
-        self.total_pagamento_compras = []
-        for mes in range(self.num_meses):
-            total = self.fornecedores_vista[mes]
-            for p in range(n_parcelas_compras):
-                total += self.duplicatas_pagar[p][mes]
-            total += self.contas_pagar_anteriores[mes]
-            self.total_pagamento_compras.append(total)
-
-        # 4.1 Despesas variáveis s/ Vendas
-        self.desp_variaveis = [0] * self.num_meses
-        
-        # DESPESAS VARIÁVEIS REFERENTE AO MÊS 1 COM BASE NO MÊS 0
-        # Para o primeiro mês, usar venda_mes0 como base
-        if self.venda_mes0 > 0 and self.num_meses > 0:
-            self.desp_variaveis[0] = self.venda_mes0 * self.setup["desp_variaveis_impostos"]
-        
-        # Se houver valor manual, substituir
-        if self.desp_variaveis_manuais and self.desp_variaveis_manuais[0] > 0:
-            self.desp_variaveis[0] = self.desp_variaveis_manuais[0]
-        
-        # Para os demais meses, usar as vendas do mês anterior normalmente
-        for mes in range(1, self.num_meses):
-            self.desp_variaveis[mes] = self.vendas_escalonadas[mes - 1] * self.setup["desp_variaveis_impostos"]
-
-        # 4.2 NOVAS DESPESAS VARIÁVEIS S/ PARCELAMENTO DAS VENDAS
-        percent_desp_var_parcelamento = self.setup["desp_variaveis_parcelamento"]
-        n_parcelas_vendas = int(self.setup["vendas_parcelamento"])
-
-        # 2.1) Despesas Variáveis à Vista (% Despesas variáveis s/ Parcelamento das Vendas * % Vendas a Vista)
-        # CORREÇÃO: Considerar referência às vendas do mês atual
-        self.desp_variaveis_vista = [
-            venda * percent_desp_var_parcelamento * self.setup["vendas_vista"]
-            for venda in self.vendas_escalonadas
-        ]
+def guardar_usuario_sessao(user):
+    session["user_id"] = user.id
+    session["usuario"] = {
+        "id": user.id,
+        "email": user.email,
+        "subscription_end": user.subscription_end.isoformat() if user.subscription_end else None,
+        "verificado_em": time.time(),
+    }
+    return UsuarioSessao(session["usuario"])
+
+def limpar_sessao():
+    session.pop("user_id", None)
+    session.pop("usuario", None)
 
-        # 2.2) Despesas Variáveis Parceladas
-        self.desp_variaveis_parceladas = [[0] * self.num_meses for _ in range(n_parcelas_vendas)]
-
-        # Para o primeiro mês, usar venda_mes0 como base
-        if self.venda_mes0 > 0:
-            # CORREÇÃO: Usar venda_mes0 como referência para o mês anterior
-            total_desp_var_mes0 = self.venda_mes0 * percent_desp_var_parcelamento
-            desp_vista_mes0 = total_desp_var_mes0 * self.setup["vendas_vista"]
-            valor_parcelado_desp_mes0 = (total_desp_var_mes0 - desp_vista_mes0) / n_parcelas_vendas
-            for parcela_idx in range(n_parcelas_vendas):
-                mes_pagamento = parcela_idx
-                if mes_pagamento < self.num_meses:
-                    self.desp_variaveis_parceladas[parcela_idx][mes_pagamento] += valor_parcelado_desp_mes0
-
-        # Para os demais meses
-        for mes in range(self.num_meses):
-            # CORREÇÃO: Usar vendas do mês atual como referência
-            total_desp_var_mes = self.vendas_escalonadas[mes] * percent_desp_var_parcelamento
-            desp_vista_mes = total_desp_var_mes * self.setup["vendas_vista"]
-            valor_parcelado_desp = (total_desp_var_mes - desp_vista_mes) / n_parcelas_vendas
-            for parcela_idx in range(n_parcelas_vendas):
-                mes_pagamento = mes + parcela_idx + 1
-                if mes_pagamento < self.num_meses:
-                    self.desp_variaveis_parceladas[parcela_idx][mes_pagamento] += valor_parcelado_desp
-
-        # Total Despesas Variáveis Parceladas por mês
-        self.total_desp_variaveis_parceladas = [0] * self.num_meses
-        for p in range(n_parcelas_vendas):
-            for mes in range(self.num_meses):
-                self.total_desp_variaveis_parceladas[mes] += self.desp_variaveis_parceladas[p][mes]
-
-        # 2.3) Total Despesas Variáveis s/ Parcelamento das Vendas
-        self.total_desp_variaveis_parcelamento = [
-            self.desp_variaveis_vista[i] + self.total_desp_variaveis_parceladas[i]
-            for i in range(self.num_meses)
-        ]
+def usuario_atual():
+    if "user_id" not in session:
+        return None
 
-        # 5. Despesas fixas
-        self.desp_fixas = self.desp_fixas_manuais
-
-        # 6. Saldo operacional
-        self.saldo_operacional = []
-        for mes in range(self.num_meses):
-            saldo = (self.total_recebimentos[mes] -
-                     self.total_pagamento_compras[mes] -
-                     self.desp_variaveis[mes] -
-                     self.total_desp_variaveis_parcelamento[mes] -
-                     self.desp_fixas[mes])
-            self.saldo_operacional.append(saldo)
-
-        # 7. Saldo final de caixa - COMEÇANDO COM SALDO MÊS 0
-        self.saldo_final_caixa = [self.saldo_caixa_mes0 + self.saldo_operacional[0]]
-        for mes in range(1, self.num_meses):
-            self.saldo_final_caixa.append(self.saldo_final_caixa[-1] + self.saldo_operacional[mes])
-
-        return self.gerar_resultados()
-
-    def gerar_resultados(self):
-        meses = [f"Mês {i+1}" for i in range(self.num_meses)] + ["TOTAL"]
-
-        # Calcular totais agrupados CORRETAMENTE
-        n_parcelas_vendas = int(self.setup["vendas_parcelamento"])
-        n_parcelas_compras = int(self.setup["compras_parcelamento"])
-
-        # 1. CONTAS A RECEBER PARCELADO - Somar TODAS as parcelas (da 1ª à última)
-        total_receber_parcelado = [0] * self.num_meses
-        for p in range(n_parcelas_vendas):
-            for mes in range(self.num_meses):
-                total_receber_parcelado[mes] += self.duplicatas_receber[p][mes]
-        
-        # 2. FORNECEDORES PARCELADOS - Somar TODAS as parcelas (da 1ª à última)
-        total_fornecedores_parcelados = [0] * self.num_meses
-        for p in range(n_parcelas_compras):
-            for mes in range(self.num_meses):
-                total_fornecedores_parcelados[mes] += self.duplicatas_pagar[p][mes]
-
-        # Calcular totais
-        total_contas_receber = [
-            self.vendas_vista[i] + total_receber_parcelado[i] + self.contas_receber_anteriores[i] 
-            for i in range(self.num_meses)
-        ]
+    # Revalida no banco no máximo uma vez a cada ASSINATURA_TTL segundos
+    dados = session.get("usuario")
+    if dados and dados["id"] == session["user_id"] and time.time() - dados["verificado_em"] < ASSINATURA_TTL:
+        return UsuarioSessao(dados)
 
-        # Criar resultados na ordem EXATA solicitada usando OrderedDict
-        resultados_ordenados = OrderedDict()
-        
-        # 1: PREVISÃO DE VENDAS
-        resultados_ordenados["PREVISÃO DE VENDAS"] = [""] * (self.num_meses + 1)
-        
-        # 2: Recebimento de vendas à vista
-        resultados_ordenados["Recebimento de vendas à vista"] = self.vendas_vista
-        
-        # 3: Contas a receber Parcelado (total) - TODAS as parcelas
-        resultados_ordenados["Contas a receber Parcelado"] = total_receber_parcelado
-        
-        # 4: Contas a receber anteriores
-        resultados_ordenados["Contas a receber anteriores"] = self.contas_receber_anteriores
-        
-        # 5: Total de Contas a Receber (negrito)
-        resultados_ordenados["Total de Contas a Receber"] = total_contas_receber
-        
-        # 6: Despesas Variáveis à Vista
-        resultados_ordenados["Despesas Variáveis s/ a receber à Vista"] = self.desp_variaveis_vista
-        
-        # 7: Despesas Variáveis Parceladas
-        resultados_ordenados["Despesas Variáveis a receber Parcelados"] = self.total_desp_variaveis_parceladas
-        
-        # 8: Despesas variáveis s/ Parcelamento das Vendas
-        resultados_ordenados["Total Despesas variáveis s/ Parcelamento das Vendas"] = self.total_desp_variaveis_parcelamento
-        
-        resultados_ordenados[""] = [""] * (self.num_meses + 1)
-        
-        # 9: LINHA MÃE: COMPRAS (CMV * % Compras sobre CMV)
-        resultados_ordenados["Planejamento de Compras"] = self.compras_totais
-        
-        # 10: LINHA FILHA: FORNECEDORES À VISTA (Compras * % Compras a Vista)
-        resultados_ordenados["Fornecedores à vista"] = self.fornecedores_vista
-        
-        # 11: Fornecedores Parcelados (total) - TODAS as parcelas
-        resultados_ordenados["Fornecedores Parcelados"] = total_fornecedores_parcelados
-        
-        # 12: Fornecedores Anteriores
-        resultados_ordenados["Contas a Pagar Anteriores"] = self.contas_pagar_anteriores
-        
-        # 13: Total Pagamento de Fornecedores (negrito)
-        resultados_ordenados["Total Pagamento de Fornecedores e Contas a Pagar"] = self.total_pagamento_compras
-        
-        resultados_ordenados[""] = [""] * (self.num_meses + 1)
-        
-        # 14: Despesas variáveis s/ Vendas (negrito)
-        resultados_ordenados["Despesas variáveis s/ Vendas"] = self.desp_variaveis
-        
-        # 15: Despesas fixas (negrito)
-        resultados_ordenados["Despesas fixas"] = self.desp_fixas
-        
-        resultados_ordenados[""] = [""] * (self.num_meses + 1)
-        
-        # 16: SALDO OPERACIONAL (negrito)
-        resultados_ordenados["SALDO OPERACIONAL"] = self.saldo_operacional
-
-        # 17: SALDO FINAL DE CAIXA PREVISTO (negrito)
-        resultados_ordenados["SALDO FINAL DE CAIXA PREVISTO"] = self.saldo_final_caixa
-
-        # Formatar resultados
-        resultados_formatados = OrderedDict()
-        for key, values in resultados_ordenados.items():
-            if key == "":
-                resultados_formatados[key] = [""] * (self.num_meses + 1) + ["TOTAL"]
-            else:
-                if values and key != "PREVISÃO DE VENDAS":
-                    total = sum(values) if len(values) == self.num_meses else values[-1]
-                    valores_formatados = [f"R$ {x:,.0f}" for x in values] + [f"R$ {total:,.0f}"]
-                else:
-                    valores_formatados = [""] * (self.num_meses + 1)
-                resultados_formatados[key] = valores_formatados
-
-        indicadores = {
-            "Total de Vendas": f"R$ {sum(self.previsao_vendas):,.0f}",
-            "Total de Recebimentos": f"R$ {sum(self.total_recebimentos):,.0f}",
-            "Total de Despesas": f"R$ {sum(self.total_pagamento_compras) + sum(self.desp_variaveis) + sum(self.desp_fixas) + sum(self.total_desp_variaveis_parcelamento):,.0f}",
-            "Saldo Final Acumulado": f"R$ {self.saldo_final_caixa[-1]:,.0f}",
-            "Margem de Fluxo de Caixa (Geração de Caixa / Vendas)": f"{(sum(self.saldo_operacional) / sum(self.previsao_vendas)) * 100:.1f}%" if sum(self.previsao_vendas) > 0 else "0%"
-        }
+    user = User.query.get(session["user_id"])
+    if not user:
+        limpar_sessao()
+        return None
+    return guardar_usuario_sessao(user)
 
-        dados_graficos = {
-            "meses": [f"Mês {i+1}" for i in range(self.num_meses)],
-            "saldo_final_caixa": self.saldo_final_caixa,
-            "receitas": self.total_recebimentos,
-            "despesas": [
-                a + b + c + d for a, b, c, d in zip(
-                    self.total_pagamento_compras,
-                    self.desp_variaveis,
-                    self.total_desp_variaveis_parcelamento,
-                    self.desp_fixas
-                )
-            ]
-        }
+def assinatura_requerida(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        try:
+            if "user_id" not in session:
+                return jsonify({"error": "Usuário não autenticado."}), 401
+            usuario = usuario_atual()
+            if not usuario or not usuario.has_active_subscription():
+                return jsonify({"error": "Assinatura inativa ou inválida."}), 403
+        except Exception as e:
+            return jsonify({"error": str(e)}), 400
+        g.usuario = usuario
+        return view(*args, **kwargs)
+    return wrapper
 
-        return {
-            "resultados": resultados_formatados,
-            "indicadores": indicadores,
-            "graficos": dados_graficos,
-            "meses": meses
-        }
+def chave_email(email):
+    # Variações de caixa e espaços do mesmo email dividem o mesmo limite de tentativas
+    return email.strip().lower()
 
 def validate_email(email):
     pattern = r"^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$"
     return re.match(pattern, email) is not None
 
-@app.route("/")
+@rotas.route("/")
 def index():
     try:
-        if "user_id" not in session:
-            return redirect(url_for("login"))
+        usuario = usuario_atual()
+        if not usuario:
+            return redirect(url_for(".login"))
 
-        user = User.query.get(session["user_id"])
-        if not user:
-            session.pop("user_id", None)
-            return redirect(url_for("login"))
-
-        if not user.has_active_subscription():
-            return redirect(url_for("payment"))
+        if not usuario.has_active_subscription():
+            return redirect(url_for(".payment"))
 
         return render_template("calculadora.html")
 
     except Exception as e:
-        return redirect(url_for("login"))
+        return redirect(url_for(".login"))
 
-@app.route("/login", methods=["GET", "POST"])
+@rotas.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         email = request.form.get("email")
@@ -439,20 +367,41 @@ def login():
         if not email or not password:
             return render_template("login.html", error="Email e senha são obrigatórios")
 
+        # Recusa rápida antes do hash, que é a parte cara do login
+        if falhas_por_ip.bloqueado(request.remote_addr) or falhas_por_email.bloqueado(chave_email(email)):
+            return render_template("login.html", error="Muitas tentativas. Aguarde alguns minutos."), 429
+
         user = User.query.filter_by(email=email).first()
 
-        if user and user.check_password(password):
-            session["user_id"] = user.id
+        try:
+            senha_correta = user is not None and user.check_password(password)
+        except ServicoOcupado as e:
+            return render_template("login.html", error=str(e)), 503
+
+        if senha_correta:
+            falhas_por_email.limpar(chave_email(email))
+
+            # Hashes antigos (outro método ou custo) são refeitos com a configuração atual
+            if precisa_atualizar(user.password_hash):
+                try:
+                    user.set_password(password)
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+
+            guardar_usuario_sessao(user)
             if user.has_active_subscription():
-                return redirect(url_for("index"))
+                return redirect(url_for(".index"))
             else:
-                return redirect(url_for("payment"))
+                return redirect(url_for(".payment"))
 
+        falhas_por_email.registrar(chave_email(email))
+        falhas_por_ip.registrar(request.remote_addr)
         return render_template("login.html", error="Email ou senha inválidos")
 
     return render_template("login.html")
 
-@app.route("/register", methods=["GET", "POST"])
+@rotas.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
         email = request.form.get("email")
@@ -464,18 +413,27 @@ def register():
         if not validate_email(email):
             return render_template("register.html", error="Email inválido")
 
+        if falhas_por_ip.bloqueado(request.remote_addr):
+            return render_template("register.html", error="Muitas tentativas. Aguarde alguns minutos."), 429
+
         if User.query.filter_by(email=email).first():
+            # Conta como falha: limita a descoberta de emails cadastrados por tentativa
+            falhas_por_ip.registrar(request.remote_addr)
             return render_template("register.html", error="Email já cadastrado")
 
         try:
-            password_hash = generate_password_hash(password)
+            password_hash = gerar_hash(password)
+        except ServicoOcupado as e:
+            return render_template("register.html", error=str(e)), 503
+
+        try:
             user = User(email=email, password_hash=password_hash)
 
             db.session.add(user)
             db.session.commit()
 
-            session["user_id"] = user.id
-            return redirect(url_for("payment"))
+            guardar_usuario_sessao(user)
+            return redirect(url_for(".payment"))
 
         except Exception as e:
             db.session.rollback()
@@ -484,79 +442,602 @@ def register():
 
     return render_template("register.html")
 
-@app.route("/payment")
+@rotas.route("/payment")
 def payment():
-    if "user_id" not in session:
-        return redirect(url_for("login"))
-    user = User.query.get(session["user_id"])
-    if not user:
-        session.pop("user_id", None)
-        return redirect(url_for("login"))
-    return render_template("payment.html", user=user)
+    usuario = usuario_atual()
+    if not usuario:
+        return redirect(url_for(".login"))
+    return render_template("payment.html", user=usuario)
 
-@app.route("/subscribe", methods=["POST"])
+@rotas.route("/subscribe", methods=["POST"])
 def subscribe():
     if "user_id" not in session:
         return jsonify({"success": False, "message": "Usuário não logado"}), 401
     user = User.query.get(session["user_id"])
     if not user:
-        session.pop("user_id", None)
+        limpar_sessao()
         return jsonify({"success": False, "message": "Usuário não encontrado"}), 404
     try:
         user.add_subscription_days(30) # Adiciona 30 dias de assinatura
         db.session.commit()
+        guardar_usuario_sessao(user) # Atualiza a assinatura guardada na sessão
         return jsonify({"success": True, "message": "Assinatura ativada com sucesso!"})
     except Exception as e:
         db.session.rollback()
         return jsonify({"success": False, "message": f"Erro ao ativar assinatura: {str(e)}"}), 500
 
-@app.route("/subscription_info")
+@rotas.route("/subscription_info")
 def subscription_info():
-    if "user_id" not in session:
-        return jsonify({"active": False, "end_date": None})
-    user = User.query.get(session["user_id"])
-    if not user:
-        session.pop("user_id", None)
+    usuario = usuario_atual()
+    if not usuario:
         return jsonify({"active": False, "end_date": None})
-    return jsonify({"active": user.has_active_subscription(), "end_date": user.subscription_end.isoformat() if user.subscription_end else None})
+    return jsonify({"active": usuario.has_active_subscription(), "end_date": usuario.subscription_end.isoformat() if usuario.subscription_end else None})
 
-@app.route("/user_info")
+@rotas.route("/user_info")
 def user_info():
-    if "user_id" not in session:
-        return jsonify({"email": None})
-    user = User.query.get(session["user_id"])
-    if not user:
-        session.pop("user_id", None)
+    usuario = usuario_atual()
+    if not usuario:
         return jsonify({"email": None})
-    return jsonify({"email": user.email})
-
-@app.route("/logout")
+    return jsonify({"email": usuario.email})
+
+@rotas.route("/cache_info")
+@assinatura_requerida
+def cache_info():
+    return jsonify(cache_resultados.estatisticas())
+
+@rotas.route("/metrics")
+def metrics():
+    # Formato texto do Prometheus. Com METRICAS_DIR (gunicorn.conf.py) a coleta soma todos
+    # os workers; sem ele os valores são do processo que atender a coleta
+    token = os.environ.get("METRICAS_TOKEN")
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return Response(status=401)
+    return Response("\n".join(exportar_metricas()) + "\n", mimetype="text/plain; version=0.0.4")
+
+@rotas.route("/logout")
 def logout():
-    session.pop("user_id", None)
-    return redirect(url_for("login"))
+    limpar_sessao()
+    return redirect(url_for(".login"))
 
-@app.route("/calcular", methods=["POST"])
+@rotas.route("/calcular", methods=["POST"])
+@assinatura_requerida
 def calcular_projecao():
     try:
-        if "user_id" not in session:
-            return jsonify({"error": "Usuário não autenticado."}), 401
-        user = User.query.get(session["user_id"])
-        if not user or not user.has_active_subscription():
-            return jsonify({"error": "Assinatura inativa ou inválida."}), 403
+        with medir("entrada"):
+            dados = request.get_json()
+            entrada = normalizar_dados(com_previsao(dados))
+
+            # O ETag é o hash dos dados normalizados: mesmo payload, mesmo resultado
+            chave = chave_entrada(entrada)
+        bruto = formato_bruto()
+        if bruto:
+            chave += "-raw"
+
+        def serializar():
+            resultado = PlanejamentoCaixa().calcular_entrada(entrada, bruto=bruto)
+            with medir("json"):
+                return json_compacto(resultado) if bruto else current_app.json.dumps(resultado)
+
+        if request.if_none_match.contains(chave):
+            resposta = Response(status=304)
+        else:
+            corpo = cache_resultados.obter(chave, serializar)
+            resposta = Response(corpo, mimetype="application/json")
+        resposta.set_etag(chave)
+        resposta.headers["Cache-Control"] = "private, no-cache"
+        return resposta
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@rotas.route("/calcular/lote", methods=["POST"])
+@assinatura_requerida
+def calcular_lote_projecao():
+    try:
+        # Mesma preparação das tarefas do tipo "lote"
+        erros, validos = tarefas.preparar_lote(tarefas.cenarios_lote(request.get_json(), MAX_CENARIOS_LOTE))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
 
-        dados = request.get_json()
-        planejamento = PlanejamentoCaixa()
-        resultados = planejamento.calcular(dados)
+    if formato_bruto():
+        serializar = lambda linha: json_compacto(linha) + b"\n"
+        gerar = lambda planejamento: planejamento.gerar_resultados_brutos()
+    else:
+        serializar = lambda linha: current_app.json.dumps(linha) + "\n"
+        gerar = lambda planejamento: planejamento.gerar_resultados()
+
+    def gerar_linhas():
+        for erro in erros:
+            yield serializar(erro)
+        entradas = [entrada for _, _, entrada in validos]
+        for posicao, planejamento in calcular_em_blocos(entradas):
+            indice, cenario_id = validos[posicao][:2]
+            linha = {"indice": indice, "id": cenario_id, **gerar(planejamento)}
+            yield serializar(linha)
+
+    return Response(stream_with_context(gerar_linhas()), mimetype="application/x-ndjson")
+
+@rotas.route("/calcular/sensibilidade", methods=["POST"])
+@assinatura_requerida
+def calcular_sensibilidade():
+    try:
+        dados = com_previsao(request.get_json())
+        resultados = sensibilidade(dados, dados.get("parametros", []))
         return jsonify(resultados)
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
-# Criar tabelas do banco de dados
-print("🔄 Criando tabelas do banco de dados...")
-with app.app_context():
-    db.create_all()
+@rotas.route("/calcular/simulacao", methods=["POST"])
+@assinatura_requerida
+def calcular_simulacao():
+    try:
+        dados = com_previsao(request.get_json())
+        resultados = simular(dados, maximo=MAX_SIMULACOES_SINCRONO)
+        return jsonify(resultados)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@rotas.route("/calcular/meta", methods=["POST"])
+@assinatura_requerida
+def calcular_meta():
+    # Ex.: {"meta": {"tipo": "saldo_minimo", "valor": 0}, "parametro": "vendas_vista", ...dados}
+    try:
+        dados = com_previsao(request.get_json())
+        resultados = buscar_meta(dados, dados.get("meta", {}), dados.get("parametro"))
+        return jsonify(resultados)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@rotas.route("/calcular/diario", methods=["POST"])
+@assinatura_requerida
+def calcular_projecao_diaria():
+    # Mesmos dados do /calcular; prazos em dias, vencimentos e calendário em "diario"
+    try:
+        dados = com_previsao(request.get_json())
+        return jsonify(calcular_diario(dados))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@rotas.route("/calcular/consolidado", methods=["POST"])
+@assinatura_requerida
+def calcular_consolidado():
+    # {"empresas": [{"id": ..., ...dados}, ...], "num_meses": N, "detalhar": true}
+    try:
+        dados = request.get_json()
+        resultado = consolidar(
+            dados.get("empresas"), dados.get("num_meses"), dados.get("detalhar", True), bruto=formato_bruto()
+        )
+        with medir("json"):
+            return Response(json_compacto(resultado), mimetype="application/json")
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+def chave_plano(plano_id):
+    return f"{g.usuario.id}:{plano_id}"
+
+@rotas.route("/calcular/compilar", methods=["POST"])
+@assinatura_requerida
+def compilar_plano():
+    try:
+        dados = request.get_json()
+        plano = PlanoCompilado(normalizar_dados(com_previsao(dados)), user_id=g.usuario.id)
+        planos_compilados.guardar(chave_plano(plano.id), plano)
+        return jsonify({"plano_id": plano.id, **plano.resultados()})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@rotas.route("/calcular/incremental", methods=["POST"])
+@assinatura_requerida
+def calcular_incremental():
+    # {"plano_id": ..., "seq": n, "dados": {...valores atuais}}: o plano é levado até os
+    # dados enviados, então a resposta não depende de qual worker atendeu nem da ordem de
+    # chegada; "seq" volta na resposta para o cliente descartar respostas atrasadas.
+    # Sem "dados", aplica a lista "alteracoes" a um plano que precisa existir neste processo.
+    try:
+        dados = request.get_json()
+        plano_id = dados.get("plano_id")
+        if not isinstance(plano_id, str) or not re.fullmatch(r"[0-9a-f]{32}", plano_id):
+            plano_id = None
+        plano = planos_compilados.consultar(chave_plano(plano_id)) if plano_id else None
+
+        if "dados" in dados:
+            entrada = normalizar_dados(com_previsao(dados["dados"]))
+            if plano is None or not plano.compativel(entrada):
+                plano = PlanoCompilado(entrada, user_id=g.usuario.id, plano_id=plano_id)
+                planos_compilados.guardar(chave_plano(plano.id), plano)
+                resultados = plano.resultados()
+            else:
+                resultados = plano.sincronizar(entrada)
+        elif plano is None:
+            return jsonify({"error": "Plano compilado não encontrado. Compile novamente."}), 404
+        else:
+            resultados = plano.alterar(dados.get("alteracoes", []))
+        return jsonify({"plano_id": plano.id, "seq": dados.get("seq"), **resultados})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@rotas.route("/prever", methods=["POST"])
+@assinatura_requerida
+def prever():
+    # Aceita um histórico em "historico_vendas" ou vários em "historicos"
+    try:
+        dados = request.get_json()
+        unico = "historicos" not in dados
+        historicos = [dados["historico_vendas"]] if unico else dados["historicos"]
+        if not isinstance(historicos, list) or not historicos:
+            return jsonify({"error": "Envie o histórico em 'historico_vendas' ou 'historicos'."}), 400
+        if len(historicos) > MAX_CENARIOS_LOTE:
+            return jsonify({"error": f"Máximo de {MAX_CENARIOS_LOTE} séries por previsão."}), 400
+        previsoes, parametros = prever_lote(
+            historicos,
+            int(dados.get("num_meses", NUM_MESES_PADRAO)),
+            modelo=dados.get("modelo", MODELO_PADRAO),
+            periodo=int(dados.get("periodo", PERIODO_SAZONAL)),
+            janela=int(dados.get("janela", JANELA_PADRAO)),
+        )
+        resultado = [
+            {"previsao_vendas": previsao.tolist(), "parametros": ajuste}
+            for previsao, ajuste in zip(previsoes, parametros)
+        ]
+        return jsonify(resultado[0] if unico else {"previsoes": resultado})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@rotas.route("/tarefas", methods=["POST"])
+@assinatura_requerida
+def criar_tarefa():
+    # {"tipo": "calcular" | "lote" | "simulacao", "dados": ...}; responde 202 com o id
+    try:
+        corpo = request.get_json()
+        tipo, dados = corpo.get("tipo"), corpo.get("dados")
+        tarefas.validar(tipo, dados)
+
+        abertas = Job.query.filter(
+            Job.user_id == g.usuario.id, Job.status.in_((tarefas.PENDENTE, tarefas.EXECUTANDO))
+        ).count()
+        if abertas >= MAX_TAREFAS_ABERTAS:
+            return jsonify({"error": f"Máximo de {MAX_TAREFAS_ABERTAS} tarefas abertas por usuário."}), 429
+
+        tarefa = Job(id=uuid.uuid4().hex, user_id=g.usuario.id, kind=tipo, status=tarefas.PENDENTE, payload=dados)
+        db.session.add(tarefa)
+        db.session.commit()
+        tarefa_id = tarefa.id
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+
+    despachar_tarefas(g.usuario.id)
+    tarefa = db.session.get(Job, tarefa_id)
+    return jsonify(tarefa.to_dict()), 202, {"Location": url_for(".tarefa", tarefa_id=tarefa_id)}
+
+@rotas.route("/tarefas", methods=["GET"])
+@assinatura_requerida
+def listar_tarefas():
+    try:
+        limite = max(1, min(int(request.args.get("limite", 50)), MAX_CENARIOS_PAGINA))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    lista = Job.query.options(defer(Job.payload), defer(Job.result)) \
+        .filter(Job.user_id == g.usuario.id) \
+        .order_by(Job.created_at.desc()).limit(limite).all()
+    return jsonify({"tarefas": [tarefa.to_dict() for tarefa in lista]})
+
+def buscar_tarefa(tarefa_id, incluir_resultado=False):
+    consulta = Job.query.options(defer(Job.payload))
+    if not incluir_resultado:
+        consulta = consulta.options(defer(Job.result))
+    return consulta.filter_by(id=tarefa_id, user_id=g.usuario.id).first()
+
+@rotas.route("/tarefas/<tarefa_id>", methods=["GET"])
+@assinatura_requerida
+def tarefa(tarefa_id):
+    tarefa = buscar_tarefa(tarefa_id, incluir_resultado=True)
+    if tarefa is None:
+        return jsonify({"error": "Tarefa não encontrada."}), 404
+    return jsonify(tarefa.to_dict(include_result=tarefa.status == tarefas.CONCLUIDA))
+
+@rotas.route("/tarefas/<tarefa_id>/eventos", methods=["GET"])
+@assinatura_requerida
+def eventos_tarefa(tarefa_id):
+    # Server-Sent Events com o estado da tarefa a cada mudança, até ela terminar.
+    # A conexão é encerrada após DURACAO_MAXIMA_EVENTOS; o cliente reconecta
+    tarefa = buscar_tarefa(tarefa_id)
+    if tarefa is None:
+        return jsonify({"error": "Tarefa não encontrada."}), 404
+    if not eventos_abertos.acquire(blocking=False):
+        return jsonify({"error": "Muitas conexões de eventos abertas. Consulte GET /tarefas/<id>."}), 503, {"Retry-After": "5"}
+
+    def gerar_eventos():
+        anterior = None
+        limite = time.monotonic() + DURACAO_MAXIMA_EVENTOS
+        while time.monotonic() < limite:
+            estado = buscar_tarefa(tarefa_id).to_dict()
+            # Encerra a transação para não segurar leitura no banco durante a espera
+            db.session.rollback()
+            if estado != anterior:
+                yield f"data: {json.dumps(estado)}\n\n"
+                anterior = estado
+            if estado["status"] in tarefas.FINAIS:
+                return
+            time.sleep(INTERVALO_EVENTOS_TAREFA)
+
+    resposta = Response(stream_with_context(gerar_eventos()), mimetype="text/event-stream")
+    resposta.headers["Cache-Control"] = "no-cache"
+    # Libera a vaga quando a resposta é fechada, mesmo que o gerador nem tenha começado
+    resposta.call_on_close(eventos_abertos.release)
+    return resposta
+
+@rotas.route("/tarefas/<tarefa_id>/cancelar", methods=["POST"])
+@assinatura_requerida
+def cancelar_tarefa(tarefa_id):
+    # Pendentes nunca chegam a rodar; em execução param no próximo registro de progresso
+    alteradas = Job.query.filter(
+        Job.id == tarefa_id,
+        Job.user_id == g.usuario.id,
+        Job.status.in_((tarefas.PENDENTE, tarefas.EXECUTANDO)),
+    ).update({"status": tarefas.CANCELADA, "finished_at": datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    tarefa = buscar_tarefa(tarefa_id)
+    if tarefa is None:
+        return jsonify({"error": "Tarefa não encontrada."}), 404
+    if not alteradas:
+        return jsonify({"error": "A tarefa já terminou.", **tarefa.to_dict()}), 409
+    despachar_tarefas(g.usuario.id)
+    return jsonify(tarefa.to_dict())
+
+@rotas.route("/cenarios", methods=["GET"])
+@assinatura_requerida
+def listar_cenarios():
+    try:
+        # Pelo menos 1: com 0 o cursor "proximo" apontaria para a linha mais nova
+        limite = max(1, min(int(request.args.get("limite", 50)), MAX_CENARIOS_PAGINA))
+        consulta = Scenario.query.options(defer(Scenario.payload), defer(Scenario.results)) \
+            .filter(Scenario.user_id == g.usuario.id)
+        if request.args.get("apos"):
+            consulta = consulta.filter(Scenario.id < int(request.args["apos"]))
+        cenarios = consulta.order_by(Scenario.id.desc()).limit(limite + 1).all()
+
+        proximo = cenarios[limite - 1].id if len(cenarios) > limite else None
+        return jsonify({
+            "cenarios": [cenario.to_dict(include_data=False) for cenario in cenarios[:limite]],
+            "proximo": proximo,
+        })
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+@rotas.route("/cenarios", methods=["POST"])
+@assinatura_requerida
+def criar_cenario():
+    try:
+        dados = request.get_json()
+        cenario = Scenario(
+            user_id=g.usuario.id,
+            name=(dados.get("nome") or "Cenário sem nome")[:120],
+            payload=dados.get("dados", {}),
+        )
+        atualizar_resultados([cenario], forcar=True)
+        db.session.add(cenario)
+        db.session.commit()
+        return jsonify(cenario.to_dict(bruto=formato_bruto())), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+
+@rotas.route("/cenarios/carregar", methods=["POST"])
+@assinatura_requerida
+def carregar_cenarios():
+    try:
+        ids = [int(x) for x in request.get_json().get("ids", [])]
+        if len(ids) > MAX_CENARIOS_CARREGAR:
+            return jsonify({"error": f"Máximo de {MAX_CENARIOS_CARREGAR} cenários por carga."}), 400
+
+        # Uma única consulta para todos os cenários; resultados desatualizados são
+        # recalculados juntos e gravados de volta
+        cenarios = Scenario.query.filter(Scenario.user_id == g.usuario.id, Scenario.id.in_(ids)).all()
+        if atualizar_resultados(cenarios):
+            db.session.commit()
+        por_id = {cenario.id: cenario for cenario in cenarios}
+        return jsonify({"cenarios": [por_id[i].to_dict(bruto=formato_bruto()) for i in ids if i in por_id]})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+
+@rotas.route("/cenarios/<int:cenario_id>", methods=["GET", "PUT", "DELETE"])
+@assinatura_requerida
+def cenario(cenario_id):
+    cenario = Scenario.query.filter_by(id=cenario_id, user_id=g.usuario.id).first()
+    if not cenario:
+        return jsonify({"error": "Cenário não encontrado."}), 404
+    try:
+        if request.method == "DELETE":
+            db.session.delete(cenario)
+            db.session.commit()
+            return jsonify({"success": True})
+
+        alterado = False
+        if request.method == "PUT":
+            dados = request.get_json()
+            if "nome" in dados:
+                cenario.name = (dados["nome"] or cenario.name)[:120]
+            if "dados" in dados:
+                # Só recalcula se os dados normalizados realmente mudaram
+                entrada = normalizar_dados(com_previsao(dados["dados"]))
+                cenario.payload = dados["dados"]
+                if chave_entrada(entrada) != cenario.input_hash:
+                    cenario.results = None
+            alterado = True
+
+        if atualizar_resultados([cenario]) or alterado:
+            db.session.commit()
+        return jsonify(cenario.to_dict(bruto=formato_bruto()))
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+
+@rotas.route("/exportar", methods=["POST"])
+@assinatura_requerida
+def exportar():
+    try:
+        formato = request.args.get("formato", "csv")
+        if formato not in ("csv", "xlsx"):
+            return jsonify({"error": "Formato deve ser csv ou xlsx."}), 400
+
+        # Aceita um cenário, uma lista em "cenarios" ou ids de cenários salvos em "cenario_ids"
+        dados = request.get_json()
+        if isinstance(dados, dict) and "cenario_ids" in dados:
+            ids = [int(x) for x in dados["cenario_ids"]]
+            salvos = Scenario.query.options(defer(Scenario.results)) \
+                .filter(Scenario.user_id == g.usuario.id, Scenario.id.in_(ids)).all()
+            cenarios = [dict(cenario.payload, id=cenario.id) for cenario in salvos]
+        elif isinstance(dados, dict) and "cenarios" in dados:
+            cenarios = dados["cenarios"]
+        elif isinstance(dados, dict):
+            cenarios = [dados]
+        else:
+            cenarios = dados
+        if not isinstance(cenarios, list) or not cenarios:
+            return jsonify({"error": "Nenhum cenário para exportar."}), 400
+        if len(cenarios) > MAX_CENARIOS_LOTE:
+            return jsonify({"error": f"Máximo de {MAX_CENARIOS_LOTE} cenários por exportação."}), 400
+
+        cenarios = preencher_previsoes(cenarios, NUM_MESES_PADRAO)
+        entradas = [normalizar_dados(cenario) for cenario in cenarios]
+        identificadores = [cenario.get("id", i + 1) for i, cenario in enumerate(cenarios)]
+        num_meses = max(entrada["num_meses"] for entrada in entradas)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Os cenários são calculados em blocos à medida que as linhas são escritas
+    planejamentos = (
+        (identificadores[posicao], planejamento)
+        for posicao, planejamento in calcular_em_blocos(entradas)
+    )
+    if formato == "xlsx":
+        return send_file(
+            gerar_xlsx(planejamentos, num_meses),
+            mimetype=MIMETYPE_XLSX,
+            as_attachment=True,
+            download_name="projecao.xlsx",
+        )
+
+    resposta = Response(stream_with_context(gerar_csv(planejamentos, num_meses)), mimetype="text/csv")
+    resposta.headers["Content-Disposition"] = "attachment; filename=projecao.csv"
+    return resposta
+
+@rotas.route("/importar", methods=["POST"])
+@assinatura_requerida
+def importar():
+    # Arquivos CSV em multipart: "vendas" (histórico), "receber" e "pagar" (por vencimento),
+    # cada um com uma coluna de data e uma de valor
+    try:
+        opcoes = {
+            "coluna_data": request.form.get("coluna_data", "data"),
+            "coluna_valor": request.form.get("coluna_valor", "valor"),
+            "separador": request.form.get("separador", ","),
+            "decimal": request.form.get("decimal", "."),
+            "milhares": request.form.get("milhares") or None,
+            "formato_data": request.form.get("formato_data") or None,
+            "codificacao": request.form.get("codificacao", "utf-8"),
+        }
+        if not any(nome in request.files for nome in ("vendas", "receber", "pagar")):
+            return jsonify({"error": "Envie ao menos um arquivo: vendas, receber ou pagar."}), 400
+
+        totais = {}
+        leitura = {}
+        for nome in ("vendas", "receber", "pagar"):
+            arquivo = request.files.get(nome)
+            if arquivo is not None:
+                totais[nome], leitura[nome] = agregar_por_mes(arquivo.stream, **opcoes)
+
+        mes_referencia = request.form.get("mes_referencia")
+        resultado = montar_dados(
+            totais.get("vendas", {}),
+            totais.get("receber"),
+            totais.get("pagar"),
+            num_meses=int(request.form.get("num_meses", NUM_MESES_PADRAO)),
+            mes_referencia=ler_mes(mes_referencia) if mes_referencia else None,
+            modelo=request.form.get("modelo") or None,
+        )
+        resultado["leitura"] = leitura
+        return jsonify(resultado)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+
+def configurar_banco(app):
+    database_url = os.environ.get("DATABASE_URL")
+    opcoes_pool = {}
+    if database_url and database_url.startswith("sqlite"):
+        # Banco SQLite explícito (ex.: o teste de carga usa um arquivo descartável)
+        app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+    elif database_url:
+        parsed_url = urlparse(database_url)
+        app.config["SQLALCHEMY_DATABASE_URI"] = f"postgresql+psycopg2://{parsed_url.username}:{parsed_url.password}@{parsed_url.hostname}:{parsed_url.port}{parsed_url.path}"
+        # Conexões por worker: pool_size fixas + max_overflow extras nos picos
+        if "DB_POOL_SIZE" in os.environ:
+            opcoes_pool["pool_size"] = int(os.environ["DB_POOL_SIZE"])
+        if "DB_MAX_OVERFLOW" in os.environ:
+            opcoes_pool["max_overflow"] = int(os.environ["DB_MAX_OVERFLOW"])
+    else:
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///users.db"
+
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+        **opcoes_pool,
+    }
+
+def criar_tabelas(app):
+    print("🔄 Criando tabelas do banco de dados...")
+    with app.app_context():
+        db.create_all()
     print("✅ Tabelas criadas com sucesso!")
 
+@click.command("criar-tabelas")
+def criar_tabelas_comando():
+    # Uso único no deploy: FLASK_APP=app flask criar-tabelas
+    criar_tabelas(current_app._get_current_object())
+
+def medidores_processo(app):
+    with app.app_context():
+        pool = db.engine.pool
+    estados = (("tamanho", "size"), ("em_uso", "checkedout"), ("disponiveis", "checkedin"), ("overflow", "overflow"))
+    return [
+        ("planejamento_db_pool_conexoes", "Conexões do pool do banco por estado",
+         [({"estado": nome}, getattr(pool, metodo)()) for nome, metodo in estados if hasattr(pool, metodo)]),
+        ("planejamento_cache_resultados", "Estatísticas do cache de resultados",
+         [({"medida": nome}, valor) for nome, valor in cache_resultados.estatisticas().items()]),
+    ]
+
+def create_app(config=None):
+    # Criar o app não toca no banco: a conexão só é aberta na primeira consulta
+    # e o schema é criado pelo comando criar-tabelas
+    app = Flask(__name__)
+    if PROXIES_CONFIAVEIS:
+        # request.remote_addr passa a ser o cliente informado em X-Forwarded-For
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXIES_CONFIAVEIS, x_proto=PROXIES_CONFIAVEIS)
+    app.secret_key = os.environ.get("SECRET_KEY", "dev-secret-key-12345")
+
+    # Uploads acima deste tamanho (MB) são recusados com 413; arquivos grandes vão para
+    # disco temporário e são lidos em blocos na importação
+    app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_UPLOAD_MB", 512)) * 1024 * 1024
+    app.config["TAREFA_SEM_PROGRESSO"] = TAREFA_SEM_PROGRESSO
+    configurar_banco(app)
+    if config:
+        app.config.update(config)
+
+    db.init_app(app)
+    app.before_request(iniciar_medicao)
+    app.after_request(registrar_medicao)
+    app.teardown_request(encerrar_medicao)
+    app.register_blueprint(rotas)
+    app.cli.add_command(criar_tabelas_comando)
+    registrar_medidores(lambda: medidores_processo(app))
+    return app
+
+app = create_app()
+
 if __name__ == "__main__":
+    # Servidor de desenvolvimento: cria as tabelas que faltarem antes de subir
+    criar_tabelas(app)
     port = int(os.environ.get("PORT", 5000))
     app.run(debug=True, host="0.0.0.0", port=port)
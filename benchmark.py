@@ -0,0 +1,217 @@
+# Benchmarks do motor de cálculo e do caminho HTTP:
+#
+#   python benchmark.py executar --saida baseline.json
+#   python benchmark.py comparar baseline.json atual.json --tolerancia 0.10
+#
+# `executar` mede cada caso e grava o resultado em JSON; `comparar` aponta os casos
+# cuja mediana piorou além da tolerância e termina com código 1 se houver regressão.
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+from planejamento import PlanejamentoCaixa, normalizar_dados
+
+NUM_MESES = (6, 24, 60, 120, 240)
+PARCELAMENTOS = ((1, 1), (6, 3), (12, 12), (24, 24))  # (vendas, compras)
+# Cada rodada repete a chamada até durar pelo menos este tempo (segundos)
+DURACAO_MINIMA_RODADA = 0.05
+RODADAS = 7
+EMAIL_BENCHMARK = "benchmark@example.com"
+
+
+def gerar_dados(num_meses, vendas_parcelamento=6, compras_parcelamento=3, semente=0):
+    rng = np.random.default_rng(semente)
+    return {
+        "num_meses": num_meses,
+        "setup": {
+            "vendas_parcelamento": vendas_parcelamento,
+            "compras_parcelamento": compras_parcelamento,
+        },
+        "venda_mes0": 100000.0,
+        "saldo_caixa_mes0": 50000.0,
+        "previsao_vendas": np.round(rng.uniform(80000, 150000, num_meses), 2).tolist(),
+        "contas_receber_anteriores": np.round(rng.uniform(0, 30000, num_meses), 2).tolist(),
+        "contas_pagar_anteriores": np.round(rng.uniform(0, 20000, num_meses), 2).tolist(),
+        "desp_fixas_manuais": np.round(rng.uniform(10000, 20000, num_meses), 2).tolist(),
+    }
+
+
+def medir(funcao, rodadas=RODADAS):
+    funcao()  # aquecimento
+    # Calibra quantas chamadas cabem numa rodada para que timers curtos não dominem
+    chamadas = 1
+    while True:
+        inicio = time.perf_counter()
+        for _ in range(chamadas):
+            funcao()
+        duracao = time.perf_counter() - inicio
+        if duracao >= DURACAO_MINIMA_RODADA:
+            break
+        chamadas *= 2 if duracao == 0 else max(2, int(DURACAO_MINIMA_RODADA / duracao * 1.2))
+
+    tempos = []
+    for _ in range(rodadas):
+        inicio = time.perf_counter()
+        for _ in range(chamadas):
+            funcao()
+        tempos.append((time.perf_counter() - inicio) / chamadas * 1000)
+    return {
+        "mediana_ms": statistics.median(tempos),
+        "minimo_ms": min(tempos),
+        "media_ms": statistics.fmean(tempos),
+        "rodadas": rodadas,
+        "chamadas_por_rodada": chamadas,
+    }
+
+
+def casos_calcular():
+    for num_meses in NUM_MESES:
+        for vendas_parcelamento, compras_parcelamento in PARCELAMENTOS:
+            dados = gerar_dados(num_meses, vendas_parcelamento, compras_parcelamento)
+            nome = f"calcular/meses={num_meses}/vp={vendas_parcelamento}/cp={compras_parcelamento}"
+            yield nome, lambda dados=dados, n=num_meses: PlanejamentoCaixa(n).calcular(dados)
+
+
+def casos_formatacao():
+    for num_meses in NUM_MESES:
+        planejamento = PlanejamentoCaixa()
+        planejamento.calcular_entrada(normalizar_dados(gerar_dados(num_meses)))
+        yield f"gerar_resultados/meses={num_meses}", planejamento.gerar_resultados
+        yield f"gerar_resultados_brutos/meses={num_meses}", planejamento.gerar_resultados_brutos
+
+
+def casos_http():
+    # App próprio num SQLite descartável: o usuário do benchmark não vai para o banco local
+    import app as aplicacao
+
+    diretorio = tempfile.mkdtemp(prefix="benchmark-")
+    aplicativo = aplicacao.create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(diretorio, 'benchmark.db')}",
+    })
+    try:
+        # O schema não é mais criado na importação do app
+        with aplicativo.app_context():
+            aplicacao.db.create_all()
+        cliente = aplicativo.test_client()
+        cliente.post("/register", data={"email": EMAIL_BENCHMARK, "password": "benchmark"})
+        cliente.post("/login", data={"email": EMAIL_BENCHMARK, "password": "benchmark"})
+        cliente.post("/subscribe")
+
+        def chamar(dados, limpar_cache):
+            if limpar_cache:
+                aplicacao.cache_resultados.limpar()
+            resposta = cliente.post("/calcular", json=dados)
+            if resposta.status_code != 200:
+                raise RuntimeError(f"/calcular respondeu {resposta.status_code}: {resposta.get_data(as_text=True)[:200]}")
+
+        for num_meses in (6, 60, 240):
+            dados = gerar_dados(num_meses)
+            yield f"http/calcular/meses={num_meses}", lambda dados=dados: chamar(dados, True)
+            yield f"http/calcular_cache/meses={num_meses}", lambda dados=dados: chamar(dados, False)
+    finally:
+        # Roda quando todos os casos do grupo foram medidos
+        with aplicativo.app_context():
+            aplicacao.db.engine.dispose()
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+
+GRUPOS = {
+    "calcular": casos_calcular,
+    "formatacao": casos_formatacao,
+    "http": casos_http,
+}
+
+
+def executar(args):
+    resultados = {}
+    for grupo in args.grupos:
+        for nome, funcao in GRUPOS[grupo]():
+            if args.filtro and args.filtro not in nome:
+                continue
+            resultados[nome] = medir(funcao, args.rodadas)
+            print(f"{nome:<45} {resultados[nome]['mediana_ms']:10.3f} ms", flush=True)
+
+    relatorio = {
+        "criado_em": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "plataforma": platform.platform(),
+        "resultados": resultados,
+    }
+    with open(args.saida, "w", encoding="utf-8") as arquivo:
+        json.dump(relatorio, arquivo, indent=2, ensure_ascii=False)
+    print(f"Resultados gravados em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            return comparar_relatorios(json.load(arquivo), relatorio, args.tolerancia)
+    return 0
+
+
+def comparar_relatorios(base, atual, tolerancia):
+    regressoes = 0
+    print(f"{'caso':<45} {'base ms':>10} {'atual ms':>10} {'razão':>7}")
+    for nome, medida in atual["resultados"].items():
+        anterior = base["resultados"].get(nome)
+        if anterior is None:
+            print(f"{nome:<45} {'-':>10} {medida['mediana_ms']:10.3f} {'novo':>7}")
+            continue
+        razao = medida["mediana_ms"] / anterior["mediana_ms"]
+        if razao > 1 + tolerancia:
+            situacao = "  REGRESSÃO"
+            regressoes += 1
+        elif razao < 1 - tolerancia:
+            situacao = "  melhora"
+        else:
+            situacao = ""
+        print(f"{nome:<45} {anterior['mediana_ms']:10.3f} {medida['mediana_ms']:10.3f} {razao:7.2f}{situacao}")
+
+    if regressoes:
+        print(f"{regressoes} caso(s) acima da tolerância de {tolerancia:.0%}")
+        return 1
+    print("Nenhuma regressão acima da tolerância")
+    return 0
+
+
+def comparar(args):
+    with open(args.base, encoding="utf-8") as arquivo:
+        base = json.load(arquivo)
+    with open(args.atual, encoding="utf-8") as arquivo:
+        atual = json.load(arquivo)
+    return comparar_relatorios(base, atual, args.tolerancia)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do planejamento de caixa")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    parser_executar = comandos.add_parser("executar", help="mede os casos e grava o JSON")
+    parser_executar.add_argument("--saida", default="benchmark.json")
+    parser_executar.add_argument("--grupos", nargs="+", choices=list(GRUPOS), default=list(GRUPOS))
+    parser_executar.add_argument("--filtro", help="mede só os casos cujo nome contém este texto")
+    parser_executar.add_argument("--rodadas", type=int, default=RODADAS)
+    parser_executar.add_argument("--comparar", metavar="BASE", help="compara com um baseline ao final")
+    parser_executar.add_argument("--tolerancia", type=float, default=0.10)
+    parser_executar.set_defaults(funcao=executar)
+
+    parser_comparar = comandos.add_parser("comparar", help="compara dois JSON de resultados")
+    parser_comparar.add_argument("base")
+    parser_comparar.add_argument("atual")
+    parser_comparar.add_argument("--tolerancia", type=float, default=0.10)
+    parser_comparar.set_defaults(funcao=comparar)
+
+    args = parser.parse_args(argv)
+    return args.funcao(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+import numpy as np
+
+from planejamento import PlanejamentoCaixa, normalizar_dados, replicar, calcular_lote, empilhar
+
+METAS = ("saldo_minimo", "saldo_final")
+# Parâmetros do setup resolvidos por busca em grade, com seus limites
+PARAMETROS_CONTINUOS = {"vendas_vista": (0.0, 1.0), "compras_vista": (0.0, 1.0)}
+MAX_PARCELAS_BUSCA = 120
+PARAMETROS_INTEIROS = {
+    "vendas_parcelamento": (1, MAX_PARCELAS_BUSCA),
+    "compras_parcelamento": (1, MAX_PARCELAS_BUSCA),
+}
+# Parâmetros que entram linearmente no saldo e têm solução direta
+PARAMETROS_LINEARES = ("saldo_caixa_mes0", "linha_credito")
+PARAMETROS_META = tuple(PARAMETROS_CONTINUOS) + tuple(PARAMETROS_INTEIROS) + PARAMETROS_LINEARES
+
+PONTOS_BUSCA = 65
+REFINAMENTOS_BUSCA = 4
+
+
+def _centavos_acima(valores):
+    return np.ceil(np.asarray(valores, dtype=float) * 100) / 100
+
+
+def _metrica(saldos, tipo):
+    return saldos.min(axis=1) if tipo == "saldo_minimo" else saldos[:, -1]
+
+
+def _avaliar(entrada, parametro, valores, tipo):
+    # Um cenário por valor candidato, todos calculados numa única passada
+    lote = replicar(entrada, len(valores))
+    lote["setup"][parametro] = np.asarray(valores, dtype=float)
+    return _metrica(calcular_lote(lote)["saldo_final_caixa"], tipo)
+
+
+def _buscar_continuo(entrada, parametro, tipo, alvo):
+    # Avalia a faixa inteira em grade e, a partir do ponto viável mais próximo do valor
+    # atual, estreita o intervalo [inviável, viável] com novas grades até a precisão desejada
+    minimo, maximo = PARAMETROS_CONTINUOS[parametro]
+    atual = float(entrada["setup"][parametro])
+    grade = np.linspace(minimo, maximo, PONTOS_BUSCA)
+    viaveis = _avaliar(entrada, parametro, grade, tipo) >= alvo
+    if not viaveis.any():
+        return None
+    distancias = np.where(viaveis, np.abs(grade - atual), np.inf)
+    inviavel, viavel = atual, grade[distancias.argmin()]
+    for _ in range(REFINAMENTOS_BUSCA):
+        pontos = np.linspace(inviavel, viavel, PONTOS_BUSCA)
+        primeiro = int(np.argmax(_avaliar(entrada, parametro, pontos, tipo) >= alvo))
+        inviavel, viavel = pontos[primeiro - 1], pontos[primeiro]
+    return float(viavel)
+
+
+def _buscar_inteiro(entrada, parametro, tipo, alvo):
+    minimo, maximo = PARAMETROS_INTEIROS[parametro]
+    atual = int(entrada["setup"][parametro])
+    valores = np.arange(minimo, maximo + 1)
+    viaveis = _avaliar(entrada, parametro, valores, tipo) >= alvo
+    if not viaveis.any():
+        return None
+    # Mais próximo do valor atual; no empate, o menor
+    distancias = np.where(viaveis, np.abs(valores - atual), np.iinfo(np.int64).max)
+    return int(valores[distancias.argmin()])
+
+
+def _linha_credito(saldos, tipo, alvo):
+    # Crédito mínimo sacado a cada mês: o saldo acumulado com os saques precisa cobrir
+    # o pior déficit até aquele mês (saldo_minimo) ou só o do último mês (saldo_final)
+    deficit = alvo - saldos
+    if tipo == "saldo_minimo":
+        acumulado = np.maximum.accumulate(np.maximum(deficit, 0.0))
+    else:
+        acumulado = np.zeros_like(saldos)
+        acumulado[-1] = max(deficit[-1], 0.0)
+    # Saques em centavos, arredondados para cima. A soma em ponto flutuante ainda pode
+    # deixar um mês a uma fração de centavo da meta: um centavo a mais no primeiro mês
+    # que ficar abaixo garante a meta com o saldo que é devolvido
+    credito = np.round(np.diff(_centavos_acima(acumulado), prepend=0.0), 2)
+    while True:
+        saldo_com_credito = saldos + np.cumsum(credito)
+        abaixo = saldo_com_credito < alvo if tipo == "saldo_minimo" else saldo_com_credito[-1:] < alvo
+        if not abaixo.any():
+            return credito
+        credito[len(credito) - len(abaixo) + int(np.argmax(abaixo))] += 0.01
+
+
+def _saldo_inicial(entrada, metrica_atual, tipo, alvo):
+    # O saldo inicial soma o mesmo valor a todos os meses do saldo final. O valor vai
+    # arredondado para cima em centavos e é conferido no motor, que pode ficar a uma
+    # fração de centavo da meta pelo erro de ponto flutuante
+    atual = entrada["saldo_caixa_mes0"]
+    necessario = float(_centavos_acima(atual + (alvo - metrica_atual)))
+    while True:
+        candidata = dict(entrada, saldo_caixa_mes0=necessario)
+        saldos = calcular_lote(empilhar([candidata]))["saldo_final_caixa"]
+        if _metrica(saldos, tipo)[0] >= alvo:
+            return necessario
+        necessario = round(necessario + 0.01, 2)
+
+
+def buscar_meta(dados, meta, parametro):
+    # `meta`: {"tipo": "saldo_minimo" | "saldo_final", "valor": X}. Retorna o valor do
+    # parâmetro mais próximo do atual que atinge a meta (ou o crédito mensal necessário)
+    tipo = meta.get("tipo", "saldo_minimo")
+    if tipo not in METAS:
+        raise ValueError(f"Meta inválida: {tipo}. Use {', '.join(METAS)}")
+    if parametro not in PARAMETROS_META:
+        raise ValueError(f"Parâmetro inválido: {parametro}. Use {', '.join(PARAMETROS_META)}")
+    alvo = float(meta.get("valor", 0.0))
+
+    entrada = normalizar_dados(dados)
+    saldos = calcular_lote(empilhar([entrada]))["saldo_final_caixa"][0]
+    metrica_atual = float(_metrica(saldos[None, :], tipo)[0])
+    resposta = {
+        "parametro": parametro,
+        "meta": {"tipo": tipo, "valor": alvo},
+        "metrica_atual": metrica_atual,
+        "atende_atual": metrica_atual >= alvo,
+    }
+
+    if parametro == "linha_credito":
+        credito = _linha_credito(saldos, tipo, alvo)
+        saldo_com_credito = saldos + np.cumsum(credito)
+        resposta.update({
+            "viavel": True,
+            "credito_mensal": credito.tolist(),
+            "credito_total": float(credito.sum()),
+            "saldo_final_caixa_com_credito": saldo_com_credito.tolist(),
+            "metrica_obtida": float(_metrica(saldo_com_credito[None, :], tipo)[0]),
+            "resultados": PlanejamentoCaixa().calcular_entrada(entrada),
+        })
+        return resposta
+
+    if parametro == "saldo_caixa_mes0":
+        # Meta já atendida mantém o valor atual, como nos demais parâmetros
+        atual = entrada["saldo_caixa_mes0"]
+        necessario = atual if metrica_atual >= alvo else _saldo_inicial(entrada, metrica_atual, tipo, alvo)
+        entrada["saldo_caixa_mes0"] = necessario
+    else:
+        atual = entrada["setup"][parametro]
+        if parametro in PARAMETROS_INTEIROS:
+            atual = int(atual)
+        if metrica_atual >= alvo:
+            necessario = atual
+        elif parametro in PARAMETROS_INTEIROS:
+            necessario = _buscar_inteiro(entrada, parametro, tipo, alvo)
+        else:
+            necessario = _buscar_continuo(entrada, parametro, tipo, alvo)
+        if necessario is None:
+            resposta.update({"viavel": False, "valor_atual": atual, "valor_necessario": None})
+            return resposta
+        entrada["setup"] = dict(entrada["setup"], **{parametro: necessario})
+
+    planejamento = PlanejamentoCaixa()
+    resultados = planejamento.calcular_entrada(entrada)
+    resposta.update({
+        "viavel": True,
+        "valor_atual": atual,
+        "valor_necessario": necessario,
+        "metrica_obtida": float(_metrica(np.array([planejamento.saldo_final_caixa]), tipo)[0]),
+        "resultados": resultados,
+    })
+    return resposta
@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _ChamadaEmAndamento:
+    def __init__(self):
+        self.evento = threading.Event()
+        self.valor = None
+        self.erro = None
+
+
+class CacheResultados:
+    # Cache LRU com expiração (TTL) e "single-flight": requisições idênticas que
+    # chegam enquanto o valor está sendo calculado esperam o mesmo cálculo
+    def __init__(self, tamanho_maximo=1024, ttl=300):
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        self._itens = OrderedDict()
+        self._em_andamento = {}
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.coalescidos = 0
+        self.remocoes = 0
+        self.expirados = 0
+
+    def obter(self, chave, calcular):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is not None:
+                expira_em, valor = item
+                if expira_em > time.monotonic():
+                    self._itens.move_to_end(chave)
+                    self.acertos += 1
+                    return valor
+                del self._itens[chave]
+                self.expirados += 1
+
+            chamada = self._em_andamento.get(chave)
+            lider = chamada is None
+            if lider:
+                chamada = _ChamadaEmAndamento()
+                self._em_andamento[chave] = chamada
+                self.falhas += 1
+            else:
+                self.coalescidos += 1
+
+        if not lider:
+            chamada.evento.wait()
+            if chamada.erro is not None:
+                raise chamada.erro
+            return chamada.valor
+
+        try:
+            chamada.valor = calcular()
+        except Exception as e:
+            chamada.erro = e
+            raise
+        finally:
+            with self._lock:
+                if chamada.erro is None:
+                    self._guardar(chave, chamada.valor)
+                del self._em_andamento[chave]
+            chamada.evento.set()
+        return chamada.valor
+
+    def consultar(self, chave):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None:
+                self.falhas += 1
+                return None
+            expira_em, valor = item
+            if expira_em <= time.monotonic():
+                del self._itens[chave]
+                self.expirados += 1
+                self.falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            return valor
+
+    def guardar(self, chave, valor):
+        with self._lock:
+            self._guardar(chave, valor)
+
+    def _guardar(self, chave, valor):
+        self._itens[chave] = (time.monotonic() + self.ttl, valor)
+        self._itens.move_to_end(chave)
+        while len(self._itens) > self.tamanho_maximo:
+            self._itens.popitem(last=False)
+            self.remocoes += 1
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.falhas + self.coalescidos
+            return {
+                "tamanho": len(self._itens),
+                "tamanho_maximo": self.tamanho_maximo,
+                "ttl": self.ttl,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "coalescidos": self.coalescidos,
+                "remocoes": self.remocoes,
+                "expirados": self.expirados,
+                "taxa_acerto": (self.acertos + self.coalescidos) / consultas if consultas else 0.0,
+            }
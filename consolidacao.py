@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+
+from planejamento import (
+    PlanejamentoCaixa, SETUP_PADRAO, SERIES_MENSAIS, ESCALARES, METADADOS_LINHAS, NUM_MESES_PADRAO,
+    normalizar_dados, empilhar, calcular_lote, indicadores_lote, linhas_lote, _centavos,
+)
+from previsao import preencher_previsoes
+
+MAX_EMPRESAS = int(os.environ.get("MAX_EMPRESAS_CONSOLIDACAO", 1000))
+
+
+def consolidar(empresas, num_meses=None, detalhar=True, bruto=False):
+    if not isinstance(empresas, list) or not empresas:
+        raise ValueError("Envie a lista de empresas em 'empresas'.")
+    if len(empresas) > MAX_EMPRESAS:
+        raise ValueError(f"Máximo de {MAX_EMPRESAS} empresas por consolidação.")
+
+    num_meses = int(num_meses or empresas[0].get("num_meses", NUM_MESES_PADRAO))
+    empresas = preencher_previsoes(empresas, num_meses)
+    entradas = []
+    for indice, empresa in enumerate(empresas):
+        entrada = normalizar_dados(empresa, num_meses)
+        if entrada["num_meses"] != num_meses:
+            raise ValueError(f"Empresa {indice + 1}: todas as empresas devem ter o mesmo horizonte ({num_meses} meses)")
+        entradas.append(entrada)
+    identificadores = [empresa.get("id", empresa.get("nome", i + 1)) for i, empresa in enumerate(empresas)]
+
+    # Todas as empresas num único lote; como o modelo é linear nas linhas da tabela,
+    # o consolidado é a soma das empresas
+    lote = empilhar(entradas)
+    matrizes = calcular_lote(lote)
+    indicadores = indicadores_lote(matrizes, lote["previsao_vendas"])
+
+    entrada_consolidada = {"num_meses": num_meses, "setup": dict(SETUP_PADRAO)}
+    for key in ESCALARES:
+        entrada_consolidada[key] = float(lote[key].sum())
+    for key in SERIES_MENSAIS:
+        entrada_consolidada[key] = lote[key].sum(axis=0)
+    consolidado = PlanejamentoCaixa().carregar(
+        entrada_consolidada, {key: matriz.sum(axis=0, keepdims=True) for key, matriz in matrizes.items()}
+    )
+
+    negativos = indicadores["saldo_minimo"] < 0
+    resultado = {
+        "empresas": identificadores,
+        "consolidado": consolidado.gerar_resultados_brutos() if bruto else consolidado.gerar_resultados(),
+        "indicadores": {key: _centavos(valores) for key, valores in indicadores.items()},
+        "empresas_saldo_negativo": [identificadores[i] for i in np.flatnonzero(negativos)],
+    }
+    if detalhar:
+        descricoes, valores = linhas_lote(lote, matrizes)
+        resultado["por_empresa"] = {
+            "ids": [METADADOS_LINHAS[descricao][0] for descricao in descricoes],
+            "descricoes": descricoes,
+            # valores[linha][empresa][mês] e totais[linha][empresa]
+            "valores": _centavos(valores),
+            "totais": _centavos(valores.sum(axis=2)),
+        }
+    return resultado
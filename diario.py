@@ -0,0 +1,180 @@
+from datetime import date
+
+import numpy as np
+
+from planejamento import normalizar_dados, calcular_lote, empilhar, _centavos
+
+DIAS_MES_COMERCIAL = 30
+MAX_MESES_DIARIO = 60
+# Chaves de "dias_vencimento": em que dia do mês cada valor mensal vence (sem o dia, é
+# distribuído igualmente pelos dias do mês)
+VENCIMENTOS = ("contas_receber_anteriores", "contas_pagar_anteriores", "desp_fixas_manuais", "desp_variaveis")
+
+
+def _limites_meses(num_meses, data_inicio):
+    # Índice do primeiro dia de cada mês (e o fim do horizonte) e a duração do Mês 0.
+    # Sem data de início usa o mês comercial de 30 dias, que reconcilia com o modelo mensal;
+    # com ela, o Mês 1 é o mês de calendário da data (a partir do dia 1)
+    if data_inicio is None:
+        return np.arange(num_meses + 1) * DIAS_MES_COMERCIAL, DIAS_MES_COMERCIAL, None
+    inicio = date.fromisoformat(data_inicio).replace(day=1)
+    viradas = []
+    for mes in range(-1, num_meses + 1):
+        ano, indice = divmod(inicio.month - 1 + mes, 12)
+        viradas.append(date(inicio.year + ano, indice + 1, 1))
+    deslocamentos = np.array([(virada - inicio).days for virada in viradas])
+    datas = [date.fromordinal(inicio.toordinal() + dia).isoformat() for dia in range(deslocamentos[-1])]
+    return deslocamentos[1:], int(-deslocamentos[0]), datas
+
+
+def _distribuir(mensal, limites, dia=None):
+    # Valores mensais -> diários: igualmente entre os dias do mês ou todo num dia fixo
+    dias_no_mes = np.diff(limites)
+    if dia is None:
+        return np.repeat(mensal / dias_no_mes, dias_no_mes)
+    diario = np.zeros(limites[-1])
+    diario[limites[:-1] + np.minimum(int(dia), dias_no_mes) - 1] = mensal
+    return diario
+
+
+def _prazos(prazos, num_parcelas, nome):
+    if prazos is None:
+        return np.arange(1, num_parcelas + 1) * DIAS_MES_COMERCIAL
+    prazos = np.array([int(prazo) for prazo in prazos])
+    if prazos.size == 0 or prazos.min() < 0:
+        raise ValueError(f"{nome} deve ser uma lista de prazos em dias (>= 0)")
+    return prazos
+
+
+def _parcelar(valores, prazos, num_dias, dias_anteriores):
+    # `valores` cobre os dias [-dias_anteriores, num_dias). Cada valor é dividido em
+    # parcelas iguais que vencem nos prazos informados: a matriz de prazos é esparsa
+    # (uma entrada por parcela), então basta uma soma deslocada por parcela
+    saida = np.zeros(num_dias)
+    parcela = valores / len(prazos)
+    for prazo in prazos:
+        deslocamento = int(prazo) - dias_anteriores
+        inicio = max(0, -deslocamento)
+        fim = min(len(parcela), num_dias - deslocamento)
+        if fim > inicio:
+            saida[inicio + deslocamento:fim + deslocamento] += parcela[inicio:fim]
+    return saida
+
+
+def calcular_diario(dados):
+    configuracao = dados.get("diario", {})
+    entrada = normalizar_dados(dados)
+    num_meses = entrada["num_meses"]
+    if num_meses > MAX_MESES_DIARIO:
+        raise ValueError(f"O modo diário aceita no máximo {MAX_MESES_DIARIO} meses")
+    setup = entrada["setup"]
+    vencimentos = configuracao.get("dias_vencimento", {})
+    for key, dia in vencimentos.items():
+        if key not in VENCIMENTOS:
+            raise ValueError(f"Vencimento desconhecido: {key}. Use {', '.join(VENCIMENTOS)}")
+        if not 1 <= int(dia) <= 31:
+            raise ValueError(f"Dia de vencimento inválido para {key}: {dia}")
+
+    limites, dias_anteriores, datas = _limites_meses(num_meses, configuracao.get("data_inicio"))
+    num_dias = int(limites[-1])
+    prazos_recebimento = _prazos(
+        configuracao.get("prazos_recebimento"), int(setup["vendas_parcelamento"]), "prazos_recebimento"
+    )
+    prazos_pagamento = _prazos(
+        configuracao.get("prazos_pagamento"), int(setup["compras_parcelamento"]), "prazos_pagamento"
+    )
+
+    # Vendas diárias (com o plus) num eixo que inclui o Mês 0 antes do dia 0
+    plus = setup["plus_vendas"]
+    if "vendas_diarias" in configuracao:
+        vendas = np.zeros(num_dias)
+        valores = [float(x) for x in configuracao["vendas_diarias"]][:num_dias]
+        vendas[:len(valores)] = valores
+    else:
+        vendas = _distribuir(entrada["previsao_vendas"], limites)
+    if plus > 0:
+        vendas = vendas * (1 + plus)
+    venda_mes0 = entrada["venda_mes0"] if entrada["venda_mes0"] > 0 else 0.0
+    vendas_estendidas = np.concatenate([np.full(dias_anteriores, venda_mes0 / dias_anteriores), vendas])
+    vendas_mensais = np.add.reduceat(vendas, limites[:-1])
+    vendas_mes_anterior = np.concatenate([[venda_mes0], vendas_mensais[:-1]])
+
+    # Recebimentos: à vista no dia da venda, parcelas nos prazos de recebimento
+    percent_vista = setup["vendas_vista"]
+    vendas_vista = vendas * percent_vista
+    receber_parcelado = _parcelar(
+        vendas_estendidas * (1 - percent_vista), prazos_recebimento, num_dias, dias_anteriores
+    )
+
+    # Compras: o valor do mês vem das vendas do mês anterior e é distribuído no mês
+    fator_compras = setup["cmv"] * setup["percent_compras"]
+    compras = _distribuir(vendas_mes_anterior * fator_compras, limites)
+    compras_estendidas = np.concatenate([np.full(dias_anteriores, venda_mes0 * fator_compras / dias_anteriores), compras])
+    fornecedores_vista = compras * setup["compras_vista"]
+    fornecedores_parcelados = _parcelar(
+        compras_estendidas * (1 - setup["compras_vista"]), prazos_pagamento, num_dias, dias_anteriores
+    )
+
+    # Despesas variáveis s/ vendas do mês anterior (valor manual substitui o Mês 1)
+    desp_variaveis_mensais = vendas_mes_anterior * setup["desp_variaveis_impostos"]
+    if entrada["desp_variavel_manual"] > 0:
+        desp_variaveis_mensais[0] = entrada["desp_variavel_manual"]
+    desp_variaveis = _distribuir(desp_variaveis_mensais, limites, vencimentos.get("desp_variaveis"))
+
+    # Despesas variáveis s/ parcelamento seguem os prazos de recebimento das vendas
+    percent_desp_parcelamento = setup["desp_variaveis_parcelamento"]
+    desp_parcelamento_vista = vendas * percent_desp_parcelamento * percent_vista
+    desp_parcelamento_parceladas = _parcelar(
+        vendas_estendidas * percent_desp_parcelamento * (1 - percent_vista),
+        prazos_recebimento, num_dias, dias_anteriores,
+    )
+
+    contas_receber = _distribuir(entrada["contas_receber_anteriores"], limites, vencimentos.get("contas_receber_anteriores"))
+    contas_pagar = _distribuir(entrada["contas_pagar_anteriores"], limites, vencimentos.get("contas_pagar_anteriores"))
+    desp_fixas = _distribuir(entrada["desp_fixas_manuais"], limites, vencimentos.get("desp_fixas_manuais"))
+
+    series = {
+        "vendas": vendas,
+        "total_recebimentos": vendas_vista + receber_parcelado + contas_receber,
+        "total_pagamento_compras": fornecedores_vista + fornecedores_parcelados + contas_pagar,
+        "desp_variaveis": desp_variaveis,
+        "total_desp_variaveis_parcelamento": desp_parcelamento_vista + desp_parcelamento_parceladas,
+        "desp_fixas": desp_fixas,
+    }
+    series["saldo_operacional"] = (
+        series["total_recebimentos"]
+        - series["total_pagamento_compras"]
+        - series["desp_variaveis"]
+        - series["total_desp_variaveis_parcelamento"]
+        - series["desp_fixas"]
+    )
+    saldo = entrada["saldo_caixa_mes0"] + np.cumsum(series["saldo_operacional"])
+    series["saldo_caixa"] = saldo
+
+    mensal = {key: np.add.reduceat(valores, limites[:-1]) for key, valores in series.items() if key != "saldo_caixa"}
+    mensal["saldo_final_caixa"] = saldo[limites[1:] - 1]
+
+    negativos = np.flatnonzero(saldo < 0)
+    resultado = {
+        "num_dias": num_dias,
+        "datas": datas,
+        "inicio_meses": limites[:-1].tolist(),
+        "series": {key: _centavos(valores) for key, valores in series.items()},
+        "mensal": {key: _centavos(valores) for key, valores in mensal.items()},
+        "indicadores": {
+            "saldo_minimo": float(saldo.min()),
+            "dia_saldo_minimo": int(saldo.argmin()),
+            "dias_saldo_negativo": int(negativos.size),
+            "primeiro_dia_negativo": int(negativos[0]) if negativos.size else None,
+            "saldo_minimo_mensal": float(mensal["saldo_final_caixa"].min()),
+        },
+    }
+
+    # No calendário comercial com prazos múltiplos de 30 dias o consolidado mensal
+    # coincide com o modelo mensal; a diferença mostra o efeito dos prazos e do calendário
+    saldo_mensal = calcular_lote(empilhar([entrada]))["saldo_final_caixa"][0]
+    resultado["reconciliacao"] = {
+        "saldo_final_caixa_modelo_mensal": _centavos(saldo_mensal),
+        "diferenca_maxima": float(np.abs(mensal["saldo_final_caixa"] - saldo_mensal).max()),
+    }
+    return resultado
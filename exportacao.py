@@ -0,0 +1,52 @@
+import csv
+import io
+import tempfile
+
+# Tamanho aproximado de cada pedaço do CSV enviado ao cliente
+TAMANHO_PEDACO_CSV = 64 * 1024
+
+MIMETYPE_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def cabecalho(num_meses):
+    return ["cenario", "linha"] + [f"Mês {i+1}" for i in range(num_meses)] + ["TOTAL"]
+
+
+def linhas_exportacao(planejamentos, num_meses):
+    # `planejamentos` é um iterável de (identificador, PlanejamentoCaixa) consumido aos poucos;
+    # cenários com horizonte menor ficam com as últimas colunas vazias
+    for identificador, planejamento in planejamentos:
+        vazios = [None] * (num_meses - planejamento.num_meses)
+        for descricao, valores, total in planejamento.linhas_numericas():
+            yield [identificador, descricao] + list(valores) + vazios + [total]
+
+
+def gerar_csv(planejamentos, num_meses):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(cabecalho(num_meses))
+    for linha in linhas_exportacao(planejamentos, num_meses):
+        escritor.writerow(linha)
+        if buffer.tell() >= TAMANHO_PEDACO_CSV:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gerar_xlsx(planejamentos, num_meses):
+    # openpyxl só é necessário para esta exportação
+    from openpyxl import Workbook
+
+    # Em modo write_only as linhas vão direto para arquivos temporários, sem
+    # manter a planilha inteira em memória
+    livro = Workbook(write_only=True)
+    planilha = livro.create_sheet("Projeção")
+    planilha.append(cabecalho(num_meses))
+    for linha in linhas_exportacao(planejamentos, num_meses):
+        planilha.append(linha)
+
+    arquivo = tempfile.TemporaryFile()
+    livro.save(arquivo)
+    arquivo.seek(0)
+    return arquivo
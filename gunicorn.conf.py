@@ -0,0 +1,45 @@
+# gunicorn.conf.py
+import multiprocessing
+import os
+import tempfile
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", min(multiprocessing.cpu_count() * 2 + 1, 4)))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+
+# O app é importado uma vez no processo mestre e os workers herdam os módulos
+# já carregados (numpy, SQLAlchemy, Flask) compartilhando as páginas de memória
+preload_app = True
+
+# Reinicia workers periodicamente para conter crescimento de memória
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = max_requests // 10
+
+# Cada worker grava suas métricas neste diretório e /metrics soma todos. O arquivo de
+# configuração roda no mestre antes do app ser importado; um diretório novo a cada
+# inicialização evita somar valores de execuções anteriores.
+if "METRICAS_DIR" not in os.environ:
+    os.environ["METRICAS_DIR"] = tempfile.mkdtemp(prefix="metricas-")
+
+
+def post_fork(server, worker):
+    # Conexões abertas no mestre antes do fork não podem ser usadas pelos workers:
+    # cada worker começa com um pool vazio
+    from app import app, db
+
+    with app.app_context():
+        db.engine.dispose()
+
+
+def worker_exit(server, worker):
+    # Grava o que o worker mediu desde a última gravação periódica
+    from metricas import gravar_processo
+
+    gravar_processo()
+
+
+def child_exit(server, worker):
+    from metricas import processo_encerrado
+
+    processo_encerrado(worker.pid)
@@ -0,0 +1,113 @@
+import os
+
+from planejamento import NUM_MESES_PADRAO, MAX_MESES
+from previsao import prever_lote
+
+LINHAS_POR_BLOCO = int(os.environ.get("IMPORTACAO_LINHAS_POR_BLOCO", 100000))
+
+
+def indice_mes(ano, mes):
+    return ano * 12 + mes - 1
+
+
+def rotulo_mes(indice):
+    return f"{indice // 12:04d}-{indice % 12 + 1:02d}"
+
+
+def ler_mes(texto):
+    # "AAAA-MM" -> índice do mês
+    ano, mes = (int(parte) for parte in texto.split("-")[:2])
+    if not 1 <= mes <= 12:
+        raise ValueError(f"Mês inválido: {texto}")
+    return indice_mes(ano, mes)
+
+
+def agregar_por_mes(arquivo, coluna_data="data", coluna_valor="valor", separador=",",
+                    decimal=".", milhares=None, formato_data=None, codificacao="utf-8"):
+    # pandas só é carregado quando há importação
+    import pandas as pd
+
+    # O arquivo é lido em blocos de LINHAS_POR_BLOCO linhas e cada bloco é somado por mês,
+    # então a memória usada não cresce com o tamanho do arquivo
+    totais = {}
+    linhas_lidas = 0
+    linhas_descartadas = 0
+    leitor = pd.read_csv(
+        arquivo,
+        sep=separador,
+        decimal=decimal,
+        thousands=milhares,
+        encoding=codificacao,
+        usecols=[coluna_data, coluna_valor],
+        dtype={coluna_data: str},
+        chunksize=LINHAS_POR_BLOCO,
+    )
+    for bloco in leitor:
+        if formato_data:
+            datas = pd.to_datetime(bloco[coluna_data], errors="coerce", format=formato_data)
+        else:
+            datas = pd.to_datetime(bloco[coluna_data], errors="coerce", dayfirst=True)
+        valores = pd.to_numeric(bloco[coluna_valor], errors="coerce")
+        validas = datas.notna() & valores.notna()
+        linhas_lidas += len(bloco)
+        linhas_descartadas += int((~validas).sum())
+
+        datas = datas[validas]
+        meses = datas.dt.year * 12 + datas.dt.month - 1
+        for mes, total in valores[validas].groupby(meses).sum().items():
+            totais[int(mes)] = totais.get(int(mes), 0.0) + float(total)
+
+    totais = {mes: round(total, 2) for mes, total in totais.items()}
+    return totais, {"linhas_lidas": linhas_lidas, "linhas_descartadas": linhas_descartadas}
+
+
+def montar_dados(vendas, receber=None, pagar=None, num_meses=NUM_MESES_PADRAO, mes_referencia=None, modelo=None):
+    # `vendas`, `receber` e `pagar` são totais por índice de mês (ver agregar_por_mes).
+    # O mês de referência é o Mês 0; por padrão, o último mês com vendas no histórico.
+    # Com `modelo` (ver previsao.MODELOS) a previsão é ajustada ao histórico; sem ele,
+    # repete o mesmo mês do ano anterior.
+    receber = receber or {}
+    pagar = pagar or {}
+    if not 1 <= num_meses <= MAX_MESES:
+        raise ValueError(f"num_meses deve estar entre 1 e {MAX_MESES}")
+    if mes_referencia is None:
+        if not vendas:
+            raise ValueError("Informe o histórico de vendas ou o mês de referência")
+        mes_referencia = max(vendas)
+
+    venda_mes0 = vendas.get(mes_referencia, 0.0)
+    # Meses sem vendas dentro do histórico contam como zero
+    historico = list(range(min(vendas), mes_referencia + 1)) if vendas and min(vendas) <= mes_referencia else []
+
+    if modelo and historico:
+        previsoes, _ = prever_lote([[vendas.get(mes, 0.0) for mes in historico]], num_meses, modelo=modelo)
+        previsao_vendas = [round(valor, 2) for valor in previsoes[0].tolist()]
+    else:
+        # Previsão ingênua sazonal: o mesmo mês do último ano do histórico. Meses sem vendas
+        # dentro do histórico são zero; só antes do início (histórico com menos de um ano)
+        # repete a venda do mês de referência
+        inicio_historico = historico[0] if historico else mes_referencia + 1
+        previsao_vendas = []
+        for mes in range(1, num_meses + 1):
+            mes_anterior = mes_referencia + (mes - 1) % 12 + 1 - 12
+            padrao = 0.0 if mes_anterior >= inicio_historico else venda_mes0
+            previsao_vendas.append(vendas.get(mes_anterior, padrao))
+
+    dados = {
+        "num_meses": num_meses,
+        "venda_mes0": venda_mes0,
+        "previsao_vendas": previsao_vendas,
+        "contas_receber_anteriores": [receber.get(mes_referencia + mes, 0.0) for mes in range(1, num_meses + 1)],
+        "contas_pagar_anteriores": [pagar.get(mes_referencia + mes, 0.0) for mes in range(1, num_meses + 1)],
+    }
+    return {
+        "mes_referencia": rotulo_mes(mes_referencia),
+        "dados": dados,
+        "historico_vendas": {
+            "meses": [rotulo_mes(mes) for mes in historico],
+            "valores": [vendas.get(mes, 0.0) for mes in historico],
+        },
+        # Valores com vencimento até o Mês 0 não entram na projeção
+        "receber_vencido": sum(valor for mes, valor in receber.items() if mes <= mes_referencia),
+        "pagar_vencido": sum(valor for mes, valor in pagar.items() if mes <= mes_referencia),
+    }
@@ -1,7 +1,5 @@
 # init_db.py
-from app import db, app
+# Equivalente a `FLASK_APP=app flask criar-tabelas`
+from app import app, criar_tabelas
 
-print("🔄 Criando tabelas do banco de dados...")
-with app.app_context():
-    db.create_all()
-    print("✅ Tabelas criadas com sucesso!")
+criar_tabelas(app)
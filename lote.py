@@ -0,0 +1,277 @@
+# Cálculo em lote, fora do app web: lê um diretório de cenários e grava os resultados
+# em formato colunar, um arquivo de entrada por tarefa num pool de processos:
+#
+#   python lote.py entradas/ saidas/ --processos 8
+#   python lote.py entradas/ saidas/ --formato csv --refazer
+#
+# Entradas aceitas:
+#   .json     um cenário, uma lista de cenários ou {"cenarios": [...]} (mesmo formato do /calcular)
+#   .csv      um cenário por linha: id, num_meses, venda_mes0, saldo_caixa_mes0, as chaves do
+#   .parquet  setup e as séries em colunas <serie>_<mes> (previsao_vendas_1, ...) ou numa
+#             coluna <serie> com a lista (JSON no CSV)
+#
+# Para cada entrada são gravados <arquivo>.mensal.<formato> (uma linha por cenário e mês,
+# uma coluna por linha da tabela) e <arquivo>.indicadores.<formato> (uma linha por cenário,
+# com o erro quando o cenário é inválido). Cada arquivo concluído vai para o manifesto da
+# saída; rodar de novo pula os que não mudaram desde então. Não importa o app: não sobe o
+# Flask nem abre o banco de usuários.
+import argparse
+import importlib.util
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from planejamento import (
+    SETUP_PADRAO, SERIES_MENSAIS, METADADOS_LINHAS, NUM_MESES_PADRAO, TAMANHO_BLOCO, VERSAO_MOTOR,
+    normalizar_dados, empilhar, calcular_lote, indicadores_lote, linhas_lote,
+)
+from previsao import preencher_previsoes
+
+EXTENSOES = (".json", ".csv", ".parquet")
+FORMATOS = ("parquet", "csv")
+# Parquet exige o pyarrow; sem ele a saída padrão é CSV
+FORMATO_PADRAO = "parquet" if importlib.util.find_spec("pyarrow") else "csv"
+MANIFESTO = "_manifesto.jsonl"
+# Séries aceitas nas colunas do CSV/Parquet (além das do motor, o histórico para a previsão)
+SERIES_ENTRADA = SERIES_MENSAIS + ("historico_vendas", "desp_variaveis_manuais")
+COLUNA_SERIE = re.compile(r"^(.+)_(\d+)$")
+
+
+def _vazio(valor):
+    return valor is None or (isinstance(valor, float) and np.isnan(valor))
+
+
+def _cenario_de_linha(linha):
+    cenario = {"setup": {}}
+    colunas_series = {}
+    for coluna, valor in linha.items():
+        if np.ndim(valor) == 0 and _vazio(valor):
+            continue
+        if coluna in SETUP_PADRAO:
+            cenario["setup"][coluna] = valor
+        elif coluna in SERIES_ENTRADA:
+            cenario[coluna] = json.loads(valor) if isinstance(valor, str) else list(valor)
+        else:
+            encontrado = COLUNA_SERIE.match(coluna)
+            if encontrado and encontrado.group(1) in SERIES_ENTRADA:
+                colunas_series.setdefault(encontrado.group(1), {})[int(encontrado.group(2))] = valor
+            else:
+                cenario[coluna] = valor.item() if isinstance(valor, np.generic) else valor
+    # Colunas <serie>_<mes> começam no mês 1; meses sem coluna ficam zerados
+    for serie, meses in colunas_series.items():
+        valores = [0.0] * max(meses)
+        for mes, valor in meses.items():
+            if mes >= 1:
+                valores[mes - 1] = float(valor)
+        cenario[serie] = valores
+    return cenario
+
+
+def ler_cenarios(caminho):
+    extensao = os.path.splitext(caminho)[1].lower()
+    if extensao == ".json":
+        with open(caminho, encoding="utf-8") as arquivo:
+            dados = json.load(arquivo)
+        if isinstance(dados, dict):
+            dados = dados["cenarios"] if "cenarios" in dados else [dados]
+        return dados
+
+    import pandas as pd
+
+    tabela = pd.read_csv(caminho) if extensao == ".csv" else pd.read_parquet(caminho)
+    return [_cenario_de_linha(linha) for linha in tabela.to_dict("records")]
+
+
+def _gravar(tabela, destino, formato):
+    # Grava num temporário e renomeia: uma interrupção nunca deixa um arquivo pela metade
+    temporario = destino + ".tmp"
+    if formato == "parquet":
+        tabela.to_parquet(temporario, index=False)
+    else:
+        tabela.to_csv(temporario, index=False)
+    os.replace(temporario, destino)
+
+
+def saidas(diretorio_saida, nome, formato):
+    return [os.path.join(diretorio_saida, f"{nome}.{tipo}.{formato}") for tipo in ("mensal", "indicadores")]
+
+
+def processar_arquivo(caminho, diretorio_saida, formato):
+    import pandas as pd
+
+    inicio = time.perf_counter()
+    cenarios = ler_cenarios(caminho)
+    if not isinstance(cenarios, list):
+        raise ValueError("O arquivo deve conter um cenário ou uma lista de cenários")
+    erros_previsao = {}
+    cenarios = preencher_previsoes(cenarios, NUM_MESES_PADRAO, erros_previsao)
+
+    indicadores = {"indice": [], "id": [], "num_meses": [], "saldo_final": [], "saldo_minimo": [], "margem": [], "erro": []}
+    validos = []
+    for indice, cenario in enumerate(cenarios):
+        try:
+            if indice in erros_previsao:
+                raise ValueError(erros_previsao[indice])
+            validos.append((indice, normalizar_dados(cenario)))
+        except Exception as e:
+            linha = dict.fromkeys(indicadores)
+            linha.update(indice=indice, id=cenario.get("id") if isinstance(cenario, dict) else None, erro=str(e))
+            for key, valor in linha.items():
+                indicadores[key].append(valor)
+
+    # Blocos de cenários com o mesmo horizonte: sem meses completados com zeros, os
+    # indicadores do lote valem como estão e cada cenário ocupa a matriz inteira
+    validos.sort(key=lambda item: item[1]["num_meses"])
+    partes = []
+    for inicio_bloco in range(0, len(validos), TAMANHO_BLOCO):
+        bloco = validos[inicio_bloco:inicio_bloco + TAMANHO_BLOCO]
+        for num_meses in sorted({entrada["num_meses"] for _, entrada in bloco}):
+            grupo = [(indice, entrada) for indice, entrada in bloco if entrada["num_meses"] == num_meses]
+            lote = empilhar([entrada for _, entrada in grupo])
+            matrizes = calcular_lote(lote)
+            descricoes, valores = linhas_lote(lote, matrizes)
+            indices = np.array([indice for indice, _ in grupo])
+            ids = [str(cenarios[indice].get("id", indice)) for indice in indices]
+
+            parte = {
+                "indice": np.repeat(indices, num_meses),
+                "id": np.repeat(ids, num_meses),
+                "mes": np.tile(np.arange(1, num_meses + 1), len(grupo)),
+            }
+            for descricao, linha in zip(descricoes, valores):
+                parte[METADADOS_LINHAS[descricao][0]] = linha.ravel()
+            partes.append(pd.DataFrame(parte))
+
+            for key, valores_indicador in indicadores_lote(matrizes, lote["previsao_vendas"]).items():
+                indicadores[key].extend(valores_indicador.tolist())
+            indicadores["indice"].extend(indices.tolist())
+            indicadores["id"].extend(ids)
+            indicadores["num_meses"].extend([num_meses] * len(grupo))
+            indicadores["erro"].extend([None] * len(grupo))
+
+    colunas = ["indice", "id", "mes"] + [METADADOS_LINHAS[descricao][0] for descricao in METADADOS_LINHAS]
+    mensal = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=colunas)
+    mensal = mensal.sort_values(["indice", "mes"], kind="stable", ignore_index=True)
+    tabela_indicadores = pd.DataFrame(indicadores).sort_values("indice", kind="stable", ignore_index=True)
+    tabela_indicadores["id"] = tabela_indicadores["id"].map(lambda valor: None if pd.isna(valor) else str(valor))
+    tabela_indicadores["num_meses"] = tabela_indicadores["num_meses"].astype("Int64")
+
+    destino_mensal, destino_indicadores = saidas(diretorio_saida, os.path.basename(caminho), formato)
+    _gravar(mensal, destino_mensal, formato)
+    _gravar(tabela_indicadores, destino_indicadores, formato)
+    return {
+        "cenarios": len(cenarios),
+        "erros": len(cenarios) - len(validos),
+        "segundos": time.perf_counter() - inicio,
+    }
+
+
+def _assinatura(caminho, formato):
+    # O que precisa ser igual para que um resultado gravado continue valendo
+    estado = os.stat(caminho)
+    return {"tamanho": estado.st_size, "modificado_ns": estado.st_mtime_ns, "versao_motor": VERSAO_MOTOR, "formato": formato}
+
+
+def ler_manifesto(diretorio_saida):
+    concluidos = {}
+    caminho = os.path.join(diretorio_saida, MANIFESTO)
+    if os.path.exists(caminho):
+        with open(caminho, encoding="utf-8") as arquivo:
+            for linha in arquivo:
+                try:
+                    registro = json.loads(linha)
+                except ValueError:
+                    continue  # última linha cortada por uma interrupção
+                concluidos[registro["arquivo"]] = registro
+    return concluidos
+
+
+def pendentes(diretorio_entrada, diretorio_saida, formato, refazer=False):
+    concluidos = {} if refazer else ler_manifesto(diretorio_saida)
+    arquivos = []
+    for nome in sorted(os.listdir(diretorio_entrada)):
+        caminho = os.path.join(diretorio_entrada, nome)
+        if not os.path.isfile(caminho) or os.path.splitext(nome)[1].lower() not in EXTENSOES:
+            continue
+        registro = concluidos.get(nome)
+        assinatura = _assinatura(caminho, formato)
+        if (
+            registro is not None
+            and all(registro.get(key) == valor for key, valor in assinatura.items())
+            and all(os.path.exists(saida) for saida in saidas(diretorio_saida, nome, formato))
+        ):
+            continue
+        arquivos.append((nome, caminho, assinatura))
+    # Maiores primeiro, para que o último arquivo não segure o pool sozinho
+    arquivos.sort(key=lambda item: -item[2]["tamanho"])
+    return arquivos, len(concluidos)
+
+
+def executar(diretorio_entrada, diretorio_saida, formato=FORMATO_PADRAO, processos=None, refazer=False):
+    if formato == "parquet" and not importlib.util.find_spec("pyarrow"):
+        raise RuntimeError("A saída em Parquet requer o pyarrow (pip install pyarrow); use --formato csv")
+    os.makedirs(diretorio_saida, exist_ok=True)
+    arquivos, anteriores = pendentes(diretorio_entrada, diretorio_saida, formato, refazer)
+    if not arquivos:
+        print("Nada a processar: todas as entradas já estão no manifesto")
+        return 0
+    print(f"{len(arquivos)} arquivo(s) a processar ({anteriores} no manifesto)", flush=True)
+
+    falhas = 0
+    inicio = time.perf_counter()
+    total_cenarios = 0
+    with ProcessPoolExecutor(max_workers=processos or os.cpu_count()) as pool, \
+            open(os.path.join(diretorio_saida, MANIFESTO), "a", encoding="utf-8") as manifesto:
+        futuros = {
+            pool.submit(processar_arquivo, caminho, diretorio_saida, formato): (nome, assinatura)
+            for nome, caminho, assinatura in arquivos
+        }
+        try:
+            for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+                nome, assinatura = futuros[futuro]
+                try:
+                    estatisticas = futuro.result()
+                except Exception as e:
+                    falhas += 1
+                    print(f"[{concluidos}/{len(arquivos)}] {nome}: ERRO {e}", flush=True)
+                    continue
+                total_cenarios += estatisticas["cenarios"]
+                manifesto.write(json.dumps({"arquivo": nome, **assinatura, **estatisticas}) + "\n")
+                manifesto.flush()
+                print(
+                    f"[{concluidos}/{len(arquivos)}] {nome}: {estatisticas['cenarios']} cenário(s), "
+                    f"{estatisticas['erros']} inválido(s), {estatisticas['segundos']:.2f}s",
+                    flush=True,
+                )
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            print("Interrompido: rode de novo com os mesmos diretórios para retomar", flush=True)
+            return 130
+
+    decorrido = time.perf_counter() - inicio
+    print(f"{total_cenarios} cenário(s) em {decorrido:.1f}s ({total_cenarios / decorrido:.0f}/s)")
+    return 1 if falhas else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cálculo do planejamento de caixa em lote, a partir de arquivos")
+    parser.add_argument("entrada", help="diretório com os cenários (.json, .csv, .parquet)")
+    parser.add_argument("saida", help="diretório dos resultados e do manifesto")
+    parser.add_argument("--formato", choices=FORMATOS, default=FORMATO_PADRAO)
+    parser.add_argument("--processos", type=int, help="processos do pool (padrão: número de CPUs)")
+    parser.add_argument("--refazer", action="store_true", help="ignora o manifesto e processa tudo de novo")
+    args = parser.parse_args(argv)
+    try:
+        return executar(args.entrada, args.saida, args.formato, args.processos, args.refazer)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
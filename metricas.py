@@ -0,0 +1,332 @@
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# Limites (segundos) dos buckets dos histogramas
+BUCKETS_REQUISICAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_ETAPA = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+# Tempos da requisição atual: {etapa: [segundos, ocorrências]}. Fora de uma requisição
+# o valor é None e os tempos só alimentam os histogramas.
+_tempos_requisicao = contextvars.ContextVar("tempos_requisicao", default=None)
+
+# Com vários workers (gunicorn), cada processo grava seus valores em METRICAS_DIR a cada
+# INTERVALO_GRAVACAO segundos e a coleta soma os arquivos de todos os processos, como o
+# modo multiprocesso do prometheus_client. Sem METRICAS_DIR os valores são só do processo.
+INTERVALO_GRAVACAO = float(os.environ.get("METRICAS_INTERVALO", 1.0))
+ARQUIVO_ENCERRADOS = "encerrados.json"
+
+_acumulados = {}  # nome -> Histograma/Contador
+_coletor_medidores = [None]
+_gravador = {"pid": None, "id": None, "alterado": False}
+_lock_gravacao = threading.Lock()
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _rotulos(nomes, valores):
+    if not nomes:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)) + "}"
+
+
+class Histograma:
+    def __init__(self, nome, descricao, rotulos=(), buckets=BUCKETS_REQUISICAO):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _acumulados[nome] = self
+
+    def observar(self, valor, *rotulos):
+        _marcar_alteracao()
+        with self._lock:
+            serie = self._series.get(rotulos)
+            if serie is None:
+                serie = self._series[rotulos] = [[0] * len(self.buckets), 0.0, 0]
+            contagens = serie[0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    contagens[i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def capturar(self):
+        with self._lock:
+            return [[list(rotulos), list(contagens), soma, total] for rotulos, (contagens, soma, total) in self._series.items()]
+
+    @staticmethod
+    def combinar(capturas):
+        series = {}
+        for captura in capturas:
+            for rotulos, contagens, soma, total in captura:
+                serie = series.setdefault(tuple(rotulos), [[0] * len(contagens), 0.0, 0])
+                serie[0] = [a + b for a, b in zip(serie[0], contagens)]
+                serie[1] += soma
+                serie[2] += total
+        return [[list(rotulos), contagens, soma, total] for rotulos, (contagens, soma, total) in series.items()]
+
+    def exportar(self, captura=None):
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} histogram"]
+        series = [(tuple(rotulos), contagens, soma, total) for rotulos, contagens, soma, total in (self.capturar() if captura is None else captura)]
+        nomes_bucket = self.rotulos + ("le",)
+        for rotulos, contagens, soma, total in series:
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                linhas.append(f"{self.nome}_bucket{_rotulos(nomes_bucket, rotulos + (repr(float(limite)),))} {acumulado}")
+            linhas.append(f"{self.nome}_bucket{_rotulos(nomes_bucket, rotulos + ('+Inf',))} {total}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, rotulos)} {soma}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, rotulos)} {total}")
+        return linhas
+
+
+class Contador:
+    def __init__(self, nome, descricao, rotulos=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+        _acumulados[nome] = self
+
+    def somar(self, *rotulos, valor=1):
+        _marcar_alteracao()
+        with self._lock:
+            self._valores[rotulos] = self._valores.get(rotulos, 0) + valor
+
+    def capturar(self):
+        with self._lock:
+            return [[list(rotulos), valor] for rotulos, valor in self._valores.items()]
+
+    @staticmethod
+    def combinar(capturas):
+        valores = {}
+        for captura in capturas:
+            for rotulos, valor in captura:
+                valores[tuple(rotulos)] = valores.get(tuple(rotulos), 0) + valor
+        return [[list(rotulos), valor] for rotulos, valor in valores.items()]
+
+    def exportar(self, captura=None):
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} counter"]
+        for rotulos, valor in (self.capturar() if captura is None else captura):
+            linhas.append(f"{self.nome}{_rotulos(self.rotulos, tuple(rotulos))} {valor}")
+        return linhas
+
+
+def exportar_medidor(nome, descricao, valores):
+    # Medidores são lidos na hora da coleta: `valores` é uma lista de (rótulos, valor)
+    linhas = [f"# HELP {nome} {descricao}", f"# TYPE {nome} gauge"]
+    for rotulos, valor in valores:
+        linhas.append(f"{nome}{_rotulos(tuple(rotulos), tuple(rotulos.values()))} {valor}")
+    return linhas
+
+
+duracao_requisicoes = Histograma(
+    "planejamento_requisicao_segundos", "Duração das requisições HTTP",
+    rotulos=("rota", "metodo", "status"),
+)
+duracao_etapas = Histograma(
+    "planejamento_etapa_segundos", "Duração das etapas do cálculo e das consultas ao banco",
+    rotulos=("etapa",), buckets=BUCKETS_ETAPA,
+)
+consultas_banco = Contador("planejamento_db_consultas_total", "Consultas executadas no banco")
+
+
+def registrar_medidores(coletor):
+    # `coletor()` devolve [(nome, descrição, [(rótulos, valor)])] com os medidores do processo;
+    # vale o último app criado
+    _coletor_medidores[0] = coletor
+
+
+def _medidores_processo():
+    return _coletor_medidores[0]() if _coletor_medidores[0] else []
+
+
+def _diretorio():
+    return os.environ.get("METRICAS_DIR")
+
+
+def _marcar_alteracao():
+    _gravador["alterado"] = True
+    if _gravador["pid"] != os.getpid() and _diretorio():
+        _iniciar_gravador()
+
+
+def _iniciar_gravador():
+    # Uma thread por processo; depois do fork o worker inicia a sua com outro id de arquivo
+    with _lock_gravacao:
+        if _gravador["pid"] == os.getpid():
+            return
+        _gravador.update(pid=os.getpid(), id=f"{os.getpid()}-{uuid.uuid4().hex}", alterado=True)
+    threading.Thread(target=_gravar_periodicamente, daemon=True).start()
+
+
+def _gravar_periodicamente():
+    pid = os.getpid()
+    while _gravador["pid"] == pid:
+        time.sleep(INTERVALO_GRAVACAO)
+        if _gravador["alterado"]:
+            gravar_processo()
+
+
+def _gravar_json(caminho, conteudo):
+    # Escreve num temporário e renomeia: quem lê nunca vê um arquivo pela metade
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "w") as arquivo:
+        json.dump(conteudo, arquivo)
+    os.replace(temporario, caminho)
+
+
+def _ler_json(caminho):
+    try:
+        with open(caminho) as arquivo:
+            return json.load(arquivo)
+    except FileNotFoundError:
+        return None
+
+
+def gravar_processo():
+    diretorio = _diretorio()
+    if not diretorio or _gravador["pid"] != os.getpid():
+        return
+    with _lock_gravacao:
+        _gravador["alterado"] = False
+        _gravar_json(os.path.join(diretorio, f"processo-{_gravador['id']}.json"), {
+            "pid": os.getpid(),
+            "acumulados": {nome: metrica.capturar() for nome, metrica in _acumulados.items()},
+            "medidores": _medidores_processo(),
+        })
+
+
+def processo_encerrado(pid):
+    # Chamado pelo mestre do gunicorn quando um worker sai. Os acumulados do worker vão para
+    # encerrados.json (contadores e histogramas nunca diminuem); os medidores são descartados.
+    # O arquivo do worker só é apagado depois de encerrados.json listar o seu id.
+    diretorio = _diretorio()
+    if not diretorio:
+        return
+    caminho_encerrados = os.path.join(diretorio, ARQUIVO_ENCERRADOS)
+    encerrados = _ler_json(caminho_encerrados) or {"ids": [], "acumulados": {}}
+    arquivos = glob.glob(os.path.join(diretorio, f"processo-{pid}-*.json"))
+    processos = [(arquivo, _ler_json(arquivo)) for arquivo in arquivos]
+    processos = [(arquivo, processo) for arquivo, processo in processos if processo is not None]
+    if not processos:
+        return
+    for arquivo, processo in processos:
+        encerrados["ids"].append(os.path.basename(arquivo))
+        for nome, captura in processo["acumulados"].items():
+            if nome in _acumulados:
+                anterior = encerrados["acumulados"].get(nome, [])
+                encerrados["acumulados"][nome] = _acumulados[nome].combinar([anterior, captura])
+    _gravar_json(caminho_encerrados, encerrados)
+    for arquivo, _ in processos:
+        os.remove(arquivo)
+
+
+def _combinar_medidores(processos):
+    # Medidores (pool, cache) não se somam entre processos: cada worker aparece com o rótulo pid
+    medidores = {}
+    for processo in processos:
+        for nome, descricao, valores in processo["medidores"]:
+            _, combinados = medidores.setdefault(nome, (descricao, []))
+            combinados += [(dict(rotulos, pid=processo["pid"]), valor) for rotulos, valor in valores]
+    return [(nome, descricao, valores) for nome, (descricao, valores) in medidores.items()]
+
+
+def exportar_metricas():
+    # Texto do Prometheus com histogramas, contadores e medidores. Com METRICAS_DIR os valores
+    # somam todos os workers: os arquivos dos processos são lidos antes de encerrados.json
+    # para que um worker que acabou de sair não seja contado duas vezes nem nenhuma.
+    diretorio = _diretorio()
+    if not diretorio:
+        linhas = [linha for metrica in _acumulados.values() for linha in metrica.exportar()]
+        medidores = _medidores_processo()
+    else:
+        if _gravador["pid"] != os.getpid():
+            _iniciar_gravador()
+        gravar_processo()
+        processos = {}
+        for arquivo in glob.glob(os.path.join(diretorio, "processo-*.json")):
+            processo = _ler_json(arquivo)
+            if processo is not None:
+                processos[os.path.basename(arquivo)] = processo
+        encerrados = _ler_json(os.path.join(diretorio, ARQUIVO_ENCERRADOS)) or {"ids": [], "acumulados": {}}
+        for nome_arquivo in encerrados["ids"]:
+            processos.pop(nome_arquivo, None)
+
+        linhas = []
+        for nome, metrica in _acumulados.items():
+            capturas = [processo["acumulados"].get(nome, []) for processo in processos.values()]
+            capturas.append(encerrados["acumulados"].get(nome, []))
+            linhas += metrica.exportar(metrica.combinar(capturas))
+        medidores = _combinar_medidores(processos.values())
+    for nome, descricao, valores in medidores:
+        linhas += exportar_medidor(nome, descricao, valores)
+    return linhas
+
+
+def registrar_tempo(etapa, segundos):
+    duracao_etapas.observar(segundos, etapa)
+    tempos = _tempos_requisicao.get()
+    if tempos is not None:
+        tempo = tempos.get(etapa)
+        if tempo is None:
+            tempos[etapa] = [segundos, 1]
+        else:
+            tempo[0] += segundos
+            tempo[1] += 1
+
+
+class Cronometro:
+    # Mede etapas consecutivas: cada marca registra o tempo desde a marca anterior
+    __slots__ = ("_inicio",)
+
+    def __init__(self):
+        self._inicio = time.perf_counter()
+
+    def marcar(self, etapa):
+        agora = time.perf_counter()
+        registrar_tempo(etapa, agora - self._inicio)
+        self._inicio = agora
+
+
+@contextmanager
+def medir(etapa):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_tempo(etapa, time.perf_counter() - inicio)
+
+
+def iniciar_requisicao():
+    return _tempos_requisicao.set({})
+
+
+def encerrar_requisicao(token):
+    _tempos_requisicao.reset(token)
+
+
+def tempos_requisicao():
+    return _tempos_requisicao.get() or {}
+
+
+def server_timing(tempos, total):
+    # Cabeçalho Server-Timing: "etapa;dur=ms" para cada etapa e para o total
+    partes = []
+    for etapa, (segundos, ocorrencias) in tempos.items():
+        descricao = f';desc="{ocorrencias}x"' if ocorrencias > 1 else ""
+        partes.append(f"{etapa}{descricao};dur={segundos * 1000:.3f}")
+    partes.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(partes)
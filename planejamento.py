@@ -0,0 +1,780 @@
+import hashlib
+import json
+import numpy as np
+from collections import OrderedDict
+
+from metricas import Cronometro, medir
+
+# Incrementar sempre que uma mudança no cálculo alterar os resultados
+VERSAO_MOTOR = "2"
+
+NUM_MESES_PADRAO = 6
+MAX_MESES = 240
+MAX_MESES_ESCALAR = 24
+TAMANHO_BLOCO = 256
+MAX_PONTOS_SENSIBILIDADE = 2500
+
+SETUP_PADRAO = {
+    "vendas_vista": 0.3,
+    "vendas_parcelamento": 5,
+    "plus_vendas": 0,
+    "cmv": 0.4480,
+    "percent_compras": 0.2,
+    "compras_vista": 0.2,
+    "compras_parcelamento": 6,
+    "desp_variaveis_impostos": 0.0613,
+    "desp_variaveis_parcelamento": 0.1313
+}
+
+# Identificador estável e estilo de exibição de cada linha da tabela de resultados
+METADADOS_LINHAS = {
+    "PREVISÃO DE VENDAS": ("previsao_vendas", "secao"),
+    "Recebimento de vendas à vista": ("recebimento_vendas_vista", "normal"),
+    "Contas a receber Parcelado": ("contas_receber_parcelado", "normal"),
+    "Contas a receber anteriores": ("contas_receber_anteriores", "normal"),
+    "Total de Contas a Receber": ("total_contas_receber", "negrito"),
+    "Despesas Variáveis s/ a receber à Vista": ("desp_variaveis_vista", "normal"),
+    "Despesas Variáveis a receber Parcelados": ("desp_variaveis_parceladas", "normal"),
+    "Total Despesas variáveis s/ Parcelamento das Vendas": ("total_desp_variaveis_parcelamento", "negrito"),
+    "Planejamento de Compras": ("compras_totais", "negrito"),
+    "Fornecedores à vista": ("fornecedores_vista", "normal"),
+    "Fornecedores Parcelados": ("fornecedores_parcelados", "normal"),
+    "Contas a Pagar Anteriores": ("contas_pagar_anteriores", "normal"),
+    "Total Pagamento de Fornecedores e Contas a Pagar": ("total_pagamento_compras", "negrito"),
+    "Despesas variáveis s/ Vendas": ("desp_variaveis", "negrito"),
+    "Despesas fixas": ("desp_fixas", "negrito"),
+    "SALDO OPERACIONAL": ("saldo_operacional", "negrito"),
+    "SALDO FINAL DE CAIXA PREVISTO": ("saldo_final_caixa", "negrito"),
+}
+
+# Séries mensais de entrada (uma linha por cenário, uma coluna por mês)
+SERIES_MENSAIS = (
+    "previsao_vendas",
+    "contas_receber_anteriores",
+    "contas_pagar_anteriores",
+    "desp_fixas_manuais",
+)
+
+# Valores únicos por cenário
+ESCALARES = ("venda_mes0", "saldo_caixa_mes0", "desp_variavel_manual")
+
+
+def serie_mensal(valores, num_meses):
+    # Completa com zeros (ou corta) para que a série tenha exatamente num_meses posições
+    serie = np.zeros(num_meses)
+    valores = [float(x) for x in valores][:num_meses]
+    serie[:len(valores)] = valores
+    return serie
+
+
+def normalizar_dados(dados, num_meses=NUM_MESES_PADRAO, setup=None):
+    setup_cenario = dict(SETUP_PADRAO if setup is None else setup)
+    for key in setup_cenario:
+        if key in dados.get("setup", {}):
+            setup_cenario[key] = float(dados["setup"][key])
+
+    num_meses = int(dados.get("num_meses", num_meses))
+    if not 1 <= num_meses <= MAX_MESES:
+        raise ValueError(f"num_meses deve estar entre 1 e {MAX_MESES}")
+
+    for key in ("vendas_parcelamento", "compras_parcelamento"):
+        if int(setup_cenario[key]) < 1:
+            raise ValueError(f"{key} deve ser maior ou igual a 1")
+
+    # Apenas o primeiro valor manual é considerado (Mês 1)
+    desp_variaveis_manuais = [float(x) for x in dados.get("desp_variaveis_manuais", [0])[:1]]
+
+    entrada = {
+        "num_meses": num_meses,
+        "setup": setup_cenario,
+        "venda_mes0": float(dados.get("venda_mes0", 0)),
+        "saldo_caixa_mes0": float(dados.get("saldo_caixa_mes0", 0)),
+        "desp_variavel_manual": desp_variaveis_manuais[0] if desp_variaveis_manuais else 0.0,
+    }
+    for key in SERIES_MENSAIS:
+        entrada[key] = serie_mensal(dados.get(key, []), num_meses)
+    return entrada
+
+
+def chave_entrada(entrada):
+    # Hash canônico dos dados já normalizados: payloads equivalentes (ex.: séries
+    # completadas com zeros) geram a mesma chave
+    canonico = {
+        "versao": VERSAO_MOTOR,
+        "num_meses": entrada["num_meses"],
+        "setup": {key: float(valor) for key, valor in entrada["setup"].items()},
+    }
+    for key in ESCALARES:
+        canonico[key] = float(entrada[key])
+    for key in SERIES_MENSAIS:
+        canonico[key] = entrada[key].tolist()
+    texto = json.dumps(canonico, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def empilhar(entradas):
+    # Cenários com horizontes diferentes são completados com zeros até o maior horizonte.
+    # O modelo é causal (o mês m só depende dos meses <= m), então os meses extras
+    # não alteram os meses de cada cenário e podem ser descartados depois.
+    num_meses = max(entrada["num_meses"] for entrada in entradas)
+    lote = {
+        "num_meses": np.array([entrada["num_meses"] for entrada in entradas]),
+        "setup": {
+            key: np.array([float(entrada["setup"][key]) for entrada in entradas])
+            for key in SETUP_PADRAO
+        },
+    }
+    for key in ESCALARES:
+        lote[key] = np.array([entrada[key] for entrada in entradas], dtype=float)
+    for key in SERIES_MENSAIS:
+        matriz = np.zeros((len(entradas), num_meses))
+        for i, entrada in enumerate(entradas):
+            matriz[i, :entrada["num_meses"]] = entrada[key]
+        lote[key] = matriz
+    return lote
+
+
+def replicar(entrada, num_cenarios):
+    # Lote com `num_cenarios` cópias do mesmo cenário; as séries são apenas visões
+    # (broadcast), então replicar não copia memória. O setup é copiado para poder
+    # ser alterado cenário a cenário.
+    lote = empilhar([entrada])
+    num_meses = entrada["num_meses"]
+    lote["num_meses"] = np.full(num_cenarios, num_meses)
+    lote["setup"] = {
+        key: np.full(num_cenarios, valor[0]) for key, valor in lote["setup"].items()
+    }
+    for key in ESCALARES:
+        lote[key] = np.broadcast_to(lote[key], (num_cenarios,))
+    for key in SERIES_MENSAIS:
+        lote[key] = np.broadcast_to(lote[key], (num_cenarios, num_meses))
+    return lote
+
+
+def _centavos(valores):
+    return np.round(np.asarray(valores, dtype=float), 2).tolist()
+
+
+def _coluna(valores, num_cenarios):
+    return np.broadcast_to(np.asarray(valores, dtype=float).reshape(-1, 1), (num_cenarios, 1))
+
+
+def _acumular_parcelas(valor_parcelado, valor_parcelado_mes0, n_parcelas, *acumuladores):
+    # A parcela p gerada no mês m cai no mês m + p + 1; a parcela p do Mês 0 cai no mês p.
+    # Cada parcela é somada na mesma ordem do cálculo original (parcela por parcela),
+    # o que mantém os resultados idênticos, bit a bit, ao laço mês x parcela.
+    num_meses = valor_parcelado.shape[1]
+    acumuladores = [np.array(acumulado, dtype=float) for acumulado in acumuladores]
+    for parcela_idx in range(min(int(n_parcelas.max()), num_meses)):
+        parcela = np.zeros_like(valor_parcelado)
+        parcela[:, parcela_idx] = valor_parcelado_mes0[:, 0]
+        parcela[:, parcela_idx + 1:] = valor_parcelado[:, :num_meses - parcela_idx - 1]
+        parcela = np.where(parcela_idx < n_parcelas, parcela, 0.0)
+        for acumulado in acumuladores:
+            acumulado += parcela
+    return acumuladores
+
+
+def _acumular_parcelas_cenario(valor_parcelado, valor_parcelado_mes0, n_parcelas, *acumuladores):
+    # Mesma soma de _acumular_parcelas para um único cenário, com listas: parcela por
+    # parcela, na mesma ordem, para que os dois caminhos deem resultados idênticos
+    num_meses = len(valor_parcelado)
+    acumuladores = [list(acumulado) for acumulado in acumuladores]
+    for parcela_idx in range(min(n_parcelas, num_meses)):
+        parcela = [0.0] * parcela_idx + [valor_parcelado_mes0] + valor_parcelado[:num_meses - parcela_idx - 1]
+        for acumulado in acumuladores:
+            for mes in range(num_meses):
+                acumulado[mes] += parcela[mes]
+    return acumuladores
+
+
+def calcular_cenario(entrada):
+    # Caminho escalar do calcular_lote para um único cenário de horizonte curto: com
+    # poucos meses, montar as matrizes do NumPy custa mais que o próprio cálculo.
+    # Devolve as mesmas linhas do calcular_lote, como listas em vez de matrizes.
+    setup = {key: float(valor) for key, valor in entrada["setup"].items()}
+    num_meses = entrada["num_meses"]
+    vendas = entrada["previsao_vendas"].tolist()
+    venda_mes0 = float(entrada["venda_mes0"])
+    desp_variavel_manual = float(entrada["desp_variavel_manual"])
+    contas_receber_anteriores = entrada["contas_receber_anteriores"].tolist()
+    contas_pagar_anteriores = entrada["contas_pagar_anteriores"].tolist()
+    desp_fixas = entrada["desp_fixas_manuais"].tolist()
+    tem_mes0 = venda_mes0 > 0
+    zeros = [0.0] * num_meses
+    cronometro = Cronometro()
+
+    # 1. Escalonamento das Vendas com Plus
+    plus = setup["plus_vendas"]
+    vendas_escalonadas = [venda * (1 + plus) for venda in vendas] if plus > 0 else vendas
+    cronometro.marcar("calc_vendas")
+
+    # 2. Fluxo de recebimentos
+    percent_vista = setup["vendas_vista"]
+    n_parcelas = int(setup["vendas_parcelamento"])
+    vendas_vista = [venda * percent_vista for venda in vendas_escalonadas]
+
+    valor_parcelado_mes0 = (venda_mes0 - (venda_mes0 * percent_vista)) / n_parcelas if tem_mes0 else 0.0
+    valor_parcelado = [
+        (venda - vista) / n_parcelas for venda, vista in zip(vendas_escalonadas, vendas_vista)
+    ]
+    total_recebimentos, total_receber_parcelado = _acumular_parcelas_cenario(
+        valor_parcelado, valor_parcelado_mes0, n_parcelas, vendas_vista, zeros
+    )
+    total_recebimentos = [total + anterior for total, anterior in zip(total_recebimentos, contas_receber_anteriores)]
+    total_contas_receber = [
+        vista + parcelado + anterior
+        for vista, parcelado, anterior in zip(vendas_vista, total_receber_parcelado, contas_receber_anteriores)
+    ]
+    cronometro.marcar("calc_recebimentos")
+
+    # 3. Planejamento de Compras
+    cmv = setup["cmv"]
+    percent_compras = setup["percent_compras"]
+    compra_total_mes0 = venda_mes0 * cmv * percent_compras if tem_mes0 else 0.0
+    compras_totais = [compra_total_mes0] + [venda * cmv * percent_compras for venda in vendas_escalonadas[:-1]]
+
+    compras_vista = setup["compras_vista"]
+    fornecedores_vista = [compra * compras_vista for compra in compras_totais]
+
+    n_parcelas_compras = int(setup["compras_parcelamento"])
+    valor_parcelado_fornecedor_mes0 = (
+        (compra_total_mes0 - compra_total_mes0 * compras_vista) / n_parcelas_compras if tem_mes0 else 0.0
+    )
+    valor_parcelado_fornecedor = [
+        (compra - vista) / n_parcelas_compras for compra, vista in zip(compras_totais, fornecedores_vista)
+    ]
+    total_pagamento_compras, total_fornecedores_parcelados = _acumular_parcelas_cenario(
+        valor_parcelado_fornecedor, valor_parcelado_fornecedor_mes0, n_parcelas_compras,
+        fornecedores_vista, zeros
+    )
+    total_pagamento_compras = [
+        total + anterior for total, anterior in zip(total_pagamento_compras, contas_pagar_anteriores)
+    ]
+    cronometro.marcar("calc_compras")
+
+    # 4.1 Despesas variáveis s/ Vendas (valor manual substitui o Mês 1)
+    desp_impostos = setup["desp_variaveis_impostos"]
+    if desp_variavel_manual > 0:
+        desp_variavel_mes1 = desp_variavel_manual
+    else:
+        desp_variavel_mes1 = venda_mes0 * desp_impostos if tem_mes0 else 0.0
+    desp_variaveis = [desp_variavel_mes1] + [venda * desp_impostos for venda in vendas_escalonadas[:-1]]
+
+    # 4.2 Despesas variáveis s/ Parcelamento das Vendas
+    percent_desp_var_parcelamento = setup["desp_variaveis_parcelamento"]
+    desp_variaveis_vista = [
+        venda * percent_desp_var_parcelamento * percent_vista for venda in vendas_escalonadas
+    ]
+    total_desp_var_mes0 = venda_mes0 * percent_desp_var_parcelamento
+    valor_parcelado_desp_mes0 = (
+        (total_desp_var_mes0 - total_desp_var_mes0 * percent_vista) / n_parcelas if tem_mes0 else 0.0
+    )
+    valor_parcelado_desp = [
+        (venda * percent_desp_var_parcelamento - vista) / n_parcelas
+        for venda, vista in zip(vendas_escalonadas, desp_variaveis_vista)
+    ]
+    total_desp_variaveis_parceladas, = _acumular_parcelas_cenario(
+        valor_parcelado_desp, valor_parcelado_desp_mes0, n_parcelas, zeros
+    )
+    total_desp_variaveis_parcelamento = [
+        vista + parcelado for vista, parcelado in zip(desp_variaveis_vista, total_desp_variaveis_parceladas)
+    ]
+    cronometro.marcar("calc_despesas")
+
+    # 6. Saldo operacional
+    saldo_operacional = [
+        total_recebimentos[mes] -
+        total_pagamento_compras[mes] -
+        desp_variaveis[mes] -
+        total_desp_variaveis_parcelamento[mes] -
+        desp_fixas[mes]
+        for mes in range(num_meses)
+    ]
+
+    # 7. Saldo final de caixa - COMEÇANDO COM SALDO MÊS 0
+    saldo_final_caixa = [float(entrada["saldo_caixa_mes0"]) + saldo_operacional[0]]
+    for saldo in saldo_operacional[1:]:
+        saldo_final_caixa.append(saldo_final_caixa[-1] + saldo)
+    cronometro.marcar("calc_saldo")
+
+    return {
+        "vendas_escalonadas": vendas_escalonadas,
+        "vendas_vista": vendas_vista,
+        "total_receber_parcelado": total_receber_parcelado,
+        "total_contas_receber": total_contas_receber,
+        "total_recebimentos": total_recebimentos,
+        "compras_totais": compras_totais,
+        "fornecedores_vista": fornecedores_vista,
+        "total_fornecedores_parcelados": total_fornecedores_parcelados,
+        "total_pagamento_compras": total_pagamento_compras,
+        "desp_variaveis": desp_variaveis,
+        "desp_variaveis_vista": desp_variaveis_vista,
+        "total_desp_variaveis_parceladas": total_desp_variaveis_parceladas,
+        "total_desp_variaveis_parcelamento": total_desp_variaveis_parcelamento,
+        "desp_fixas": desp_fixas,
+        "saldo_operacional": saldo_operacional,
+        "saldo_final_caixa": saldo_final_caixa,
+    }
+
+
+def calcular_lote(lote):
+    vendas = np.asarray(lote["previsao_vendas"], dtype=float)
+    num_cenarios, num_meses = vendas.shape
+    setup = {key: _coluna(lote["setup"][key], num_cenarios) for key in SETUP_PADRAO}
+    venda_mes0 = _coluna(lote["venda_mes0"], num_cenarios)
+    saldo_caixa_mes0 = _coluna(lote["saldo_caixa_mes0"], num_cenarios)
+    desp_variavel_manual = _coluna(lote["desp_variavel_manual"], num_cenarios)
+    contas_receber_anteriores = np.asarray(lote["contas_receber_anteriores"], dtype=float)
+    contas_pagar_anteriores = np.asarray(lote["contas_pagar_anteriores"], dtype=float)
+    desp_fixas = np.asarray(lote["desp_fixas_manuais"], dtype=float)
+    tem_mes0 = venda_mes0 > 0
+    cronometro = Cronometro()
+
+    # 1. Escalonamento das Vendas com Plus
+    plus = setup["plus_vendas"]
+    vendas_escalonadas = np.where(plus > 0, vendas * (1 + plus), vendas)
+    cronometro.marcar("calc_vendas")
+
+    # 2. Fluxo de recebimentos
+    percent_vista = setup["vendas_vista"]
+    n_parcelas = np.trunc(setup["vendas_parcelamento"])
+    vendas_vista = vendas_escalonadas * percent_vista
+
+    valor_parcelado_mes0 = np.where(
+        tem_mes0, (venda_mes0 - (venda_mes0 * percent_vista)) / n_parcelas, 0.0
+    )
+    valor_parcelado = (vendas_escalonadas - vendas_vista) / n_parcelas
+    total_recebimentos, total_receber_parcelado = _acumular_parcelas(
+        valor_parcelado, valor_parcelado_mes0, n_parcelas,
+        vendas_vista, np.zeros_like(vendas)
+    )
+    total_recebimentos += contas_receber_anteriores
+    total_contas_receber = vendas_vista + total_receber_parcelado + contas_receber_anteriores
+    cronometro.marcar("calc_recebimentos")
+
+    # 3. Planejamento de Compras
+    # LINHA MÃE: Compras (CMV * % Compras sobre CMV), sempre sobre as vendas do mês anterior
+    cmv = setup["cmv"]
+    percent_compras = setup["percent_compras"]
+    compra_total_mes0 = np.where(tem_mes0, venda_mes0 * cmv * percent_compras, 0.0)
+    compras_totais = np.zeros_like(vendas)
+    compras_totais[:, :1] = compra_total_mes0
+    compras_totais[:, 1:] = vendas_escalonadas[:, :-1] * cmv * percent_compras
+
+    # LINHA FILHA: Fornecedores à Vista (Compras * % Compras a Vista)
+    compras_vista = setup["compras_vista"]
+    fornecedores_vista = compras_totais * compras_vista
+
+    # Fornecedores Parcelados = (Compras totais - Fornecedores à vista) / N parcelas
+    n_parcelas_compras = np.trunc(setup["compras_parcelamento"])
+    valor_parcelado_fornecedor_mes0 = np.where(
+        tem_mes0,
+        (compra_total_mes0 - compra_total_mes0 * compras_vista) / n_parcelas_compras,
+        0.0
+    )
+    valor_parcelado_fornecedor = (compras_totais - fornecedores_vista) / n_parcelas_compras
+    total_pagamento_compras, total_fornecedores_parcelados = _acumular_parcelas(
+        valor_parcelado_fornecedor, valor_parcelado_fornecedor_mes0, n_parcelas_compras,
+        fornecedores_vista, np.zeros_like(vendas)
+    )
+    total_pagamento_compras += contas_pagar_anteriores
+    cronometro.marcar("calc_compras")
+
+    # 4.1 Despesas variáveis s/ Vendas (valor manual substitui o Mês 1)
+    desp_impostos = setup["desp_variaveis_impostos"]
+    desp_variaveis = np.zeros_like(vendas)
+    desp_variaveis[:, :1] = np.where(
+        desp_variavel_manual > 0,
+        desp_variavel_manual,
+        np.where(tem_mes0, venda_mes0 * desp_impostos, 0.0)
+    )
+    desp_variaveis[:, 1:] = vendas_escalonadas[:, :-1] * desp_impostos
+
+    # 4.2 Despesas variáveis s/ Parcelamento das Vendas
+    percent_desp_var_parcelamento = setup["desp_variaveis_parcelamento"]
+
+    # Despesas Variáveis à Vista (% Despesas variáveis s/ Parcelamento * % Vendas a Vista)
+    desp_variaveis_vista = vendas_escalonadas * percent_desp_var_parcelamento * percent_vista
+
+    # Despesas Variáveis Parceladas
+    total_desp_var_mes0 = venda_mes0 * percent_desp_var_parcelamento
+    valor_parcelado_desp_mes0 = np.where(
+        tem_mes0,
+        (total_desp_var_mes0 - total_desp_var_mes0 * percent_vista) / n_parcelas,
+        0.0
+    )
+    valor_parcelado_desp = (
+        vendas_escalonadas * percent_desp_var_parcelamento - desp_variaveis_vista
+    ) / n_parcelas
+    total_desp_variaveis_parceladas, = _acumular_parcelas(
+        valor_parcelado_desp, valor_parcelado_desp_mes0, n_parcelas, np.zeros_like(vendas)
+    )
+    total_desp_variaveis_parcelamento = desp_variaveis_vista + total_desp_variaveis_parceladas
+    cronometro.marcar("calc_despesas")
+
+    # 6. Saldo operacional
+    saldo_operacional = (
+        total_recebimentos -
+        total_pagamento_compras -
+        desp_variaveis -
+        total_desp_variaveis_parcelamento -
+        desp_fixas
+    )
+
+    # 7. Saldo final de caixa - COMEÇANDO COM SALDO MÊS 0
+    saldo_final_caixa = saldo_operacional.copy()
+    saldo_final_caixa[:, 0] = saldo_caixa_mes0[:, 0] + saldo_operacional[:, 0]
+    saldo_final_caixa = np.cumsum(saldo_final_caixa, axis=1)
+    cronometro.marcar("calc_saldo")
+
+    return {
+        "vendas_escalonadas": vendas_escalonadas,
+        "vendas_vista": vendas_vista,
+        "total_receber_parcelado": total_receber_parcelado,
+        "total_contas_receber": total_contas_receber,
+        "total_recebimentos": total_recebimentos,
+        "compras_totais": compras_totais,
+        "fornecedores_vista": fornecedores_vista,
+        "total_fornecedores_parcelados": total_fornecedores_parcelados,
+        "total_pagamento_compras": total_pagamento_compras,
+        "desp_variaveis": desp_variaveis,
+        "desp_variaveis_vista": desp_variaveis_vista,
+        "total_desp_variaveis_parceladas": total_desp_variaveis_parceladas,
+        "total_desp_variaveis_parcelamento": total_desp_variaveis_parcelamento,
+        "desp_fixas": desp_fixas,
+        "saldo_operacional": saldo_operacional,
+        "saldo_final_caixa": saldo_final_caixa,
+    }
+
+
+def indicadores_lote(matrizes, previsao_vendas):
+    # Indicadores numéricos por cenário: saldo final, menor saldo do período e
+    # margem de fluxo de caixa (geração de caixa / vendas, em %)
+    total_vendas = np.asarray(previsao_vendas, dtype=float).sum(axis=1)
+    geracao_caixa = matrizes["saldo_operacional"].sum(axis=1)
+    margem = np.zeros_like(total_vendas)
+    positivas = total_vendas > 0
+    margem[positivas] = geracao_caixa[positivas] / total_vendas[positivas] * 100
+    return {
+        "saldo_final": matrizes["saldo_final_caixa"][:, -1],
+        "saldo_minimo": matrizes["saldo_final_caixa"].min(axis=1),
+        "margem": margem,
+    }
+
+
+def linhas_lote(lote, matrizes):
+    # Linhas da tabela de todos os cenários de uma vez: o PlanejamentoCaixa recebe as
+    # matrizes (cenário x mês) no lugar das listas de um cenário e as linhas são
+    # empilhadas num único array (linha x cenário x mês), sem as separadoras
+    planejamento = PlanejamentoCaixa()
+    for key in SERIES_MENSAIS:
+        setattr(planejamento, key, lote[key])
+    for key, matriz in matrizes.items():
+        setattr(planejamento, key, matriz)
+    linhas = [(descricao, valores) for descricao, valores in planejamento.linhas_resultado() if descricao]
+    return [descricao for descricao, _ in linhas], np.stack([valores for _, valores in linhas])
+
+
+class PlanejamentoCaixa:
+    def __init__(self, num_meses=NUM_MESES_PADRAO):
+        self.num_meses = num_meses
+        self.setup = dict(SETUP_PADRAO)
+        self.previsao_vendas = [0] * self.num_meses
+        self.contas_receber_anteriores = [0] * self.num_meses
+        self.contas_pagar_anteriores = [0] * self.num_meses
+        self.desp_fixas_manuais = [0] * self.num_meses
+        self.desp_variaveis_manuais = [0]
+        self.venda_mes0 = 0  # Vendas do mês anterior
+        self.saldo_caixa_mes0 = 0  # Saldo de caixa inicial (Mês 0)
+
+    def carregar(self, entrada, matrizes, cenario=0):
+        # Copia para o objeto a linha `cenario` de um lote já calculado
+        num_meses = entrada["num_meses"]
+        return self.carregar_linhas(
+            entrada, {key: matriz[cenario, :num_meses].tolist() for key, matriz in matrizes.items()}
+        )
+
+    def carregar_linhas(self, entrada, linhas):
+        self.num_meses = entrada["num_meses"]
+        self.setup = dict(entrada["setup"])
+        self.venda_mes0 = entrada["venda_mes0"]
+        self.saldo_caixa_mes0 = entrada["saldo_caixa_mes0"]
+        self.desp_variaveis_manuais = [entrada["desp_variavel_manual"]]
+        for key in SERIES_MENSAIS:
+            setattr(self, key, entrada[key].tolist())
+        for key, valores in linhas.items():
+            setattr(self, key, valores)
+        return self
+
+    def calcular(self, dados):
+        return self.calcular_entrada(normalizar_dados(dados, self.num_meses, self.setup))
+
+    def calcular_entrada(self, entrada, bruto=False):
+        # Cenário único de horizonte curto (o caso padrão de 6 meses) vai pelo caminho
+        # escalar; o motor vetorizado só compensa em lotes e horizontes longos
+        if entrada["num_meses"] <= MAX_MESES_ESCALAR:
+            self.carregar_linhas(entrada, calcular_cenario(entrada))
+        else:
+            self.carregar(entrada, calcular_lote(empilhar([entrada])))
+        with medir("formatacao"):
+            return self.gerar_resultados_brutos() if bruto else self.gerar_resultados()
+
+    def linhas_resultado(self):
+        # Linhas da tabela na ordem EXATA de exibição; "" marca uma linha separadora
+        return [
+            # 1: PREVISÃO DE VENDAS
+            ("PREVISÃO DE VENDAS", self.previsao_vendas),
+
+            # 2: Recebimento de vendas à vista
+            ("Recebimento de vendas à vista", self.vendas_vista),
+
+            # 3: Contas a receber Parcelado (total) - TODAS as parcelas
+            ("Contas a receber Parcelado", self.total_receber_parcelado),
+
+            # 4: Contas a receber anteriores
+            ("Contas a receber anteriores", self.contas_receber_anteriores),
+
+            # 5: Total de Contas a Receber (negrito)
+            ("Total de Contas a Receber", self.total_contas_receber),
+
+            # 6: Despesas Variáveis à Vista
+            ("Despesas Variáveis s/ a receber à Vista", self.desp_variaveis_vista),
+
+            # 7: Despesas Variáveis Parceladas
+            ("Despesas Variáveis a receber Parcelados", self.total_desp_variaveis_parceladas),
+
+            # 8: Despesas variáveis s/ Parcelamento das Vendas
+            ("Total Despesas variáveis s/ Parcelamento das Vendas", self.total_desp_variaveis_parcelamento),
+
+            ("", None),
+
+            # 9: LINHA MÃE: COMPRAS (CMV * % Compras sobre CMV)
+            ("Planejamento de Compras", self.compras_totais),
+
+            # 10: LINHA FILHA: FORNECEDORES À VISTA (Compras * % Compras a Vista)
+            ("Fornecedores à vista", self.fornecedores_vista),
+
+            # 11: Fornecedores Parcelados (total) - TODAS as parcelas
+            ("Fornecedores Parcelados", self.total_fornecedores_parcelados),
+
+            # 12: Fornecedores Anteriores
+            ("Contas a Pagar Anteriores", self.contas_pagar_anteriores),
+
+            # 13: Total Pagamento de Fornecedores (negrito)
+            ("Total Pagamento de Fornecedores e Contas a Pagar", self.total_pagamento_compras),
+
+            ("", None),
+
+            # 14: Despesas variáveis s/ Vendas (negrito)
+            ("Despesas variáveis s/ Vendas", self.desp_variaveis),
+
+            # 15: Despesas fixas (negrito)
+            ("Despesas fixas", self.desp_fixas),
+
+            ("", None),
+
+            # 16: SALDO OPERACIONAL (negrito)
+            ("SALDO OPERACIONAL", self.saldo_operacional),
+
+            # 17: SALDO FINAL DE CAIXA PREVISTO (negrito)
+            ("SALDO FINAL DE CAIXA PREVISTO", self.saldo_final_caixa),
+        ]
+
+    def linhas_numericas(self):
+        # Valores sem formatação (sem as linhas separadoras), cada linha com seu total
+        return [
+            (descricao, valores, sum(valores))
+            for descricao, valores in self.linhas_resultado()
+            if descricao
+        ]
+
+    def indicadores_brutos(self):
+        total_vendas = sum(self.previsao_vendas)
+        return {
+            "total_vendas": total_vendas,
+            "total_recebimentos": sum(self.total_recebimentos),
+            "total_despesas": sum(self.total_pagamento_compras) + sum(self.desp_variaveis) + sum(self.desp_fixas) + sum(self.total_desp_variaveis_parcelamento),
+            "saldo_final": self.saldo_final_caixa[-1],
+            "margem": (sum(self.saldo_operacional) / total_vendas) * 100 if total_vendas > 0 else 0.0,
+        }
+
+    def despesas_mensais(self):
+        return [
+            a + b + c + d for a, b, c, d in zip(
+                self.total_pagamento_compras,
+                self.desp_variaveis,
+                self.total_desp_variaveis_parcelamento,
+                self.desp_fixas
+            )
+        ]
+
+    def gerar_resultados_brutos(self, centavos=True):
+        # Formato colunar, sem formatação de moeda: uma posição por linha da tabela
+        # nas listas paralelas abaixo. Separadores têm id/valores/total nulos.
+        # Os valores vão arredondados em centavos; os totais são somados antes do arredondamento.
+        # Com centavos=False os valores vão completos (resultados guardados e formatados depois).
+        arredondar = _centavos if centavos else (lambda valores: np.asarray(valores, dtype=float).tolist())
+        arredondar_total = (lambda valor: round(valor, 2)) if centavos else float
+        ids, descricoes, estilos, valores, totais = [], [], [], [], []
+        for descricao, linha in self.linhas_resultado():
+            if not descricao:
+                ids.append(None)
+                descricoes.append("")
+                estilos.append("separador")
+                valores.append(None)
+                totais.append(None)
+                continue
+            id_linha, estilo = METADADOS_LINHAS[descricao]
+            ids.append(id_linha)
+            descricoes.append(descricao)
+            estilos.append(estilo)
+            valores.append(arredondar(linha))
+            totais.append(arredondar_total(sum(linha)))
+
+        return {
+            "formato": "raw",
+            "meses": [f"Mês {i+1}" for i in range(self.num_meses)],
+            "linhas": {
+                "ids": ids,
+                "descricoes": descricoes,
+                "estilos": estilos,
+                "valores": valores,
+                "totais": totais,
+            },
+            "indicadores": {
+                key: arredondar_total(valor) for key, valor in self.indicadores_brutos().items()
+            },
+            "graficos": {
+                "saldo_final_caixa": arredondar(self.saldo_final_caixa),
+                "receitas": arredondar(self.total_recebimentos),
+                "despesas": arredondar(self.despesas_mensais()),
+            },
+        }
+
+    def gerar_resultados(self):
+        meses = [f"Mês {i+1}" for i in range(self.num_meses)] + ["TOTAL"]
+
+        # Criar resultados na ordem EXATA solicitada usando OrderedDict
+        resultados_ordenados = OrderedDict(self.linhas_resultado())
+
+        # Formatar resultados
+        resultados_formatados = OrderedDict()
+        for key, values in resultados_ordenados.items():
+            if key == "":
+                resultados_formatados[key] = [""] * (self.num_meses + 1) + ["TOTAL"]
+            else:
+                if values and key != "PREVISÃO DE VENDAS":
+                    total = sum(values) if len(values) == self.num_meses else values[-1]
+                    valores_formatados = [f"R$ {x:,.0f}" for x in values] + [f"R$ {total:,.0f}"]
+                else:
+                    valores_formatados = [""] * (self.num_meses + 1)
+                resultados_formatados[key] = valores_formatados
+
+        indicadores = _formatar_indicadores(self.indicadores_brutos())
+
+        dados_graficos = {
+            "meses": [f"Mês {i+1}" for i in range(self.num_meses)],
+            "saldo_final_caixa": self.saldo_final_caixa,
+            "receitas": self.total_recebimentos,
+            "despesas": self.despesas_mensais()
+        }
+
+        return {
+            "resultados": resultados_formatados,
+            "indicadores": indicadores,
+            "graficos": dados_graficos,
+            "meses": meses
+        }
+
+
+def _formatar_indicadores(valores_indicadores):
+    return {
+        "Total de Vendas": f"R$ {valores_indicadores['total_vendas']:,.0f}",
+        "Total de Recebimentos": f"R$ {valores_indicadores['total_recebimentos']:,.0f}",
+        "Total de Despesas": f"R$ {valores_indicadores['total_despesas']:,.0f}",
+        "Saldo Final Acumulado": f"R$ {valores_indicadores['saldo_final']:,.0f}",
+        "Margem de Fluxo de Caixa (Geração de Caixa / Vendas)": f"{valores_indicadores['margem']:.1f}%" if valores_indicadores["total_vendas"] > 0 else "0%"
+    }
+
+
+def formatar_resultados(brutos):
+    # Resposta no formato de gerar_resultados a partir de gerar_resultados_brutos, para
+    # resultados guardados em formato numérico. Com os valores completos (centavos=False)
+    # o resultado é o mesmo de gerar_resultados
+    num_meses = len(brutos["meses"])
+    linhas = brutos["linhas"]
+    resultados_formatados = OrderedDict()
+    for descricao, valores, total in zip(linhas["descricoes"], linhas["valores"], linhas["totais"]):
+        if not descricao:
+            resultados_formatados.setdefault("", [""] * (num_meses + 1) + ["TOTAL"])
+        elif valores and descricao != "PREVISÃO DE VENDAS":
+            resultados_formatados[descricao] = [f"R$ {x:,.0f}" for x in valores] + [f"R$ {total:,.0f}"]
+        else:
+            resultados_formatados[descricao] = [""] * (num_meses + 1)
+
+    return {
+        "resultados": resultados_formatados,
+        "indicadores": _formatar_indicadores(brutos["indicadores"]),
+        "graficos": {"meses": brutos["meses"], **brutos["graficos"]},
+        "meses": brutos["meses"] + ["TOTAL"],
+    }
+
+
+def calcular_em_blocos(entradas, tamanho_bloco=TAMANHO_BLOCO):
+    # Empilha os cenários em blocos (cenário x mês) e devolve cada planejamento
+    # assim que o bloco dele termina, para que a resposta possa ser transmitida aos poucos
+    for inicio in range(0, len(entradas), tamanho_bloco):
+        bloco = entradas[inicio:inicio + tamanho_bloco]
+        matrizes = calcular_lote(empilhar(bloco))
+        for i, entrada in enumerate(bloco):
+            yield inicio + i, PlanejamentoCaixa().carregar(entrada, matrizes, i)
+
+
+def _valores_parametro(parametro):
+    # Aceita uma lista explícita de valores ou uma faixa inicio/fim/passos
+    if "valores" in parametro:
+        valores = np.array([float(x) for x in parametro["valores"]])
+    else:
+        valores = np.linspace(
+            float(parametro["inicio"]), float(parametro["fim"]), int(parametro.get("passos", 10))
+        )
+    if valores.size == 0:
+        raise ValueError(f"Nenhum valor informado para {parametro['nome']}")
+    return valores
+
+
+def sensibilidade(dados, parametros):
+    if not 1 <= len(parametros) <= 2:
+        raise ValueError("Informe um ou dois parâmetros para a análise de sensibilidade")
+
+    nomes = [parametro["nome"] for parametro in parametros]
+    for nome in nomes:
+        if nome not in SETUP_PADRAO:
+            raise ValueError(f"Parâmetro desconhecido: {nome}")
+    if len(set(nomes)) != len(nomes):
+        raise ValueError("Os parâmetros da análise devem ser diferentes")
+
+    eixos = [_valores_parametro(parametro) for parametro in parametros]
+    for nome, valores in zip(nomes, eixos):
+        if nome in ("vendas_parcelamento", "compras_parcelamento") and np.trunc(valores).min() < 1:
+            raise ValueError(f"{nome} deve ser maior ou igual a 1")
+
+    forma = tuple(valores.size for valores in eixos)
+    num_pontos = int(np.prod(forma))
+    if num_pontos > MAX_PONTOS_SENSIBILIDADE:
+        raise ValueError(f"Máximo de {MAX_PONTOS_SENSIBILIDADE} combinações por análise")
+
+    # Toda a grade é calculada numa única passada: um cenário por combinação
+    entrada = normalizar_dados(dados)
+    lote = replicar(entrada, num_pontos)
+    for nome, grade in zip(nomes, np.meshgrid(*eixos, indexing="ij")):
+        lote["setup"][nome] = grade.ravel()
+
+    indicadores = indicadores_lote(calcular_lote(lote), lote["previsao_vendas"])
+    return {
+        "parametros": [
+            {"nome": nome, "valores": valores.tolist()} for nome, valores in zip(nomes, eixos)
+        ],
+        **{key: valores.reshape(forma).tolist() for key, valores in indicadores.items()},
+    }
@@ -0,0 +1,134 @@
+import threading
+import uuid
+
+import numpy as np
+
+from planejamento import SERIES_MENSAIS, PlanejamentoCaixa, calcular_lote, replicar
+
+# Entradas escalares que entram linearmente no modelo
+ESCALARES_LINEARES = ("venda_mes0", "saldo_caixa_mes0")
+CAMPOS_ALTERAVEIS = SERIES_MENSAIS + ESCALARES_LINEARES
+# As atualizações acumuladas deixam resíduo de ponto flutuante (ex.: -1e-10 exibido como
+# "R$ -0"); os valores são arredondados nesta casa decimal antes de exibir
+CASAS_RESIDUO = 6
+
+
+def _valor_efetivo(campo, valor):
+    # As parcelas do Mês 0 só existem quando venda_mes0 > 0; abaixo disso a venda_mes0 não tem efeito
+    if campo == "venda_mes0":
+        return max(valor, 0.0)
+    return valor
+
+
+def compilar_operador(entrada):
+    # Com o setup fixo, o modelo é linear nas séries mensais, em venda_mes0 (quando > 0)
+    # e no saldo inicial. Também é invariante no tempo: um valor no mês s produz a
+    # mesma resposta que um valor no mês 0, deslocada s meses. Por isso basta calcular,
+    # num único lote, o cenário base (entradas zeradas) e um impulso unitário por entrada.
+    # A primeira linha do lote é o próprio cenário, calculado de forma exata.
+    num_meses = entrada["num_meses"]
+    campos = list(CAMPOS_ALTERAVEIS)
+    num_cenarios = len(campos) + 2
+    lote = replicar(entrada, num_cenarios)
+    for key in SERIES_MENSAIS:
+        lote[key] = np.zeros((num_cenarios, num_meses))
+        lote[key][0] = entrada[key]
+    for key in ESCALARES_LINEARES:
+        lote[key] = np.zeros(num_cenarios)
+        lote[key][0] = entrada[key]
+    for i, campo in enumerate(campos, start=2):
+        if campo in SERIES_MENSAIS:
+            lote[campo][i, 0] = 1.0
+        else:
+            lote[campo][i] = 1.0
+
+    matrizes = calcular_lote(lote)
+    linhas = list(matrizes)
+    respostas = np.stack([matrizes[linha] for linha in linhas])  # (linha, cenário, mês)
+    nucleos = {
+        campo: respostas[:, i, :] - respostas[:, 1, :]
+        for i, campo in enumerate(campos, start=2)
+    }
+    return linhas, respostas[:, 0, :].copy(), nucleos
+
+
+class PlanoCompilado:
+    def __init__(self, entrada, user_id=None, plano_id=None):
+        self.id = plano_id or uuid.uuid4().hex
+        self.user_id = user_id
+        self.entrada = dict(entrada)
+        self.num_meses = entrada["num_meses"]
+        for key in SERIES_MENSAIS:
+            self.entrada[key] = np.array(entrada[key], dtype=float)
+        self.linhas, self.valores, self.nucleos = compilar_operador(self.entrada)
+        self._lock = threading.Lock()
+
+    def _somar(self, campo, mes, delta):
+        # Atualização de posto 1: a resposta da entrada, deslocada para o mês alterado
+        self.valores[:, mes:] += delta * self.nucleos[campo][:, :self.num_meses - mes]
+
+    def _validar(self, alteracoes):
+        # Converte e confere todas as alterações antes de aplicar qualquer uma: um lote
+        # com um item inválido não pode deixar o plano alterado pela metade
+        validas = []
+        for alteracao in alteracoes:
+            campo = alteracao.get("campo")
+            if campo not in CAMPOS_ALTERAVEIS:
+                raise ValueError(f"Campo não pode ser alterado incrementalmente: {campo}")
+            valor = float(alteracao["valor"])
+            mes = None
+            if campo in SERIES_MENSAIS:
+                mes = int(alteracao["mes"]) - 1
+                if not 0 <= mes < self.num_meses:
+                    raise ValueError(f"Mês fora do horizonte do plano: {mes + 1}")
+            validas.append((campo, mes, valor))
+        return validas
+
+    def _aplicar(self, validas):
+        for campo, mes, valor in validas:
+            if mes is not None:
+                delta = valor - self.entrada[campo][mes]
+                self.entrada[campo][mes] = valor
+            else:
+                mes = 0
+                delta = _valor_efetivo(campo, valor) - _valor_efetivo(campo, self.entrada[campo])
+                self.entrada[campo] = valor
+            if delta:
+                self._somar(campo, mes, delta)
+
+    def alterar(self, alteracoes):
+        # Cada alteração: {"campo": ..., "mes": 1..num_meses (séries), "valor": ...}
+        validas = self._validar(alteracoes)
+        with self._lock:
+            self._aplicar(validas)
+            return self.resultados()
+
+    def compativel(self, entrada):
+        # O operador vale enquanto setup, horizonte e a despesa variável manual (que não
+        # entra de forma linear) forem os mesmos
+        return (
+            entrada["num_meses"] == self.num_meses
+            and entrada["setup"] == self.entrada["setup"]
+            and entrada["desp_variavel_manual"] == self.entrada["desp_variavel_manual"]
+        )
+
+    def sincronizar(self, entrada):
+        # Leva o plano até `entrada` (os dados atuais completos do cliente) aplicando só as
+        # diferenças. O resultado depende apenas de `entrada`, então requisições fora de
+        # ordem ou vindas de outro worker não deixam o plano num estado antigo.
+        with self._lock:
+            validas = []
+            for key in SERIES_MENSAIS:
+                for mes in np.flatnonzero(entrada[key] != self.entrada[key]):
+                    validas.append((key, int(mes), float(entrada[key][mes])))
+            for key in ESCALARES_LINEARES:
+                if entrada[key] != self.entrada[key]:
+                    validas.append((key, None, float(entrada[key])))
+            self._aplicar(validas)
+            return self.resultados()
+
+    def resultados(self):
+        # Somar 0.0 transforma o -0.0 do arredondamento em 0.0
+        valores = np.round(self.valores, CASAS_RESIDUO) + 0.0
+        matrizes = {linha: valores[i][None, :] for i, linha in enumerate(self.linhas)}
+        return PlanejamentoCaixa().carregar(self.entrada, matrizes).gerar_resultados()
@@ -0,0 +1,233 @@
+import hashlib
+import os
+
+import numpy as np
+
+from cache_resultados import CacheResultados
+from planejamento import MAX_MESES
+
+MODELOS = ("holt_winters", "media_movel")
+MODELO_PADRAO = "holt_winters"
+PERIODO_SAZONAL = 12
+JANELA_PADRAO = 3
+# Sazonalidade de até dois anos; o estado sazonal é alocado por série e combinação da grade
+MAX_PERIODO = 24
+# Amortecimento da tendência: evita que horizontes longos extrapolem a reta indefinidamente
+AMORTECIMENTO = 0.98
+
+# Grade de parâmetros avaliada de uma vez para todas as séries do lote
+ALFAS = (0.1, 0.2, 0.4, 0.6, 0.8)
+BETAS = (0.0, 0.05, 0.1, 0.2)
+GAMAS = (0.0, 0.1, 0.2, 0.4)
+
+parametros_ajustados = CacheResultados(
+    tamanho_maximo=int(os.environ.get("PREVISAO_CACHE_TAMANHO", 10000)),
+    ttl=int(os.environ.get("PREVISAO_CACHE_TTL", 3600)),
+)
+
+
+def chave_serie(historico, modelo, periodo):
+    texto = f"{modelo}:{periodo}:".encode("utf-8") + np.asarray(historico, dtype=float).tobytes()
+    return hashlib.sha256(texto).hexdigest()
+
+
+def _grade(sazonal):
+    gamas = GAMAS if sazonal else (0.0,)
+    grade = np.array([(a, b, c) for a in ALFAS for b in BETAS for c in gamas])
+    return grade[:, 0], grade[:, 1], grade[:, 2]
+
+
+def _suavizar(y, alfa, beta, gama, periodo, sazonal):
+    # Holt-Winters aditivo com tendência amortecida. `y` é (S, T) e os parâmetros
+    # (S, G): cada série é filtrada com G combinações ao mesmo tempo.
+    # Retorna o erro quadrático de um passo e o estado final (nível, tendência, sazonalidade).
+    S, T = y.shape
+    G = alfa.shape[1]
+    if sazonal:
+        nivel = y[:, :periodo].mean(axis=1)
+        tendencia = (y[:, periodo:2 * periodo].mean(axis=1) - nivel) / periodo
+        # A média da primeira estação vale para o meio dela: a sazonalidade inicial é o
+        # desvio em relação à reta de tendência, sem a tendência da própria estação
+        centrado = np.arange(periodo) - (periodo - 1) / 2
+        estacao = y[:, :periodo] - nivel[:, None] - tendencia[:, None] * centrado
+        inicio = periodo
+    else:
+        nivel = y[:, 0]
+        tendencia = y[:, 1] - y[:, 0] if T > 1 else np.zeros(S)
+        estacao = np.zeros((S, periodo))
+        inicio = 1
+
+    nivel = np.repeat(nivel[:, None], G, axis=1)
+    tendencia = np.repeat(tendencia[:, None], G, axis=1)
+    estacao = np.repeat(estacao[:, None, :], G, axis=1)
+    erro = np.zeros((S, G))
+    for t in range(inicio, T):
+        observado = y[:, t, None]
+        s_anterior = estacao[:, :, t % periodo]
+        previsto = nivel + AMORTECIMENTO * tendencia + s_anterior
+        erro += (observado - previsto) ** 2
+        novo_nivel = alfa * (observado - s_anterior) + (1 - alfa) * (nivel + AMORTECIMENTO * tendencia)
+        tendencia = beta * (novo_nivel - nivel) + (1 - beta) * AMORTECIMENTO * tendencia
+        nivel = novo_nivel
+        if sazonal:
+            estacao[:, :, t % periodo] = gama * (observado - nivel) + (1 - gama) * s_anterior
+    return erro, nivel, tendencia, estacao
+
+
+def _projetar(nivel, tendencia, estacao, T, horizonte, periodo):
+    # Previsão h passos à frente: nível + (φ + φ² + ... + φ^h)·tendência + sazonalidade do mês
+    passos = np.arange(1, horizonte + 1)
+    soma_amortecida = np.cumsum(AMORTECIMENTO ** passos)
+    sazonal = estacao[:, (T + passos - 1) % periodo]
+    return nivel[:, None] + soma_amortecida[None, :] * tendencia[:, None] + sazonal
+
+
+def _holt_winters(y, horizonte, periodo, parametros):
+    # `parametros` traz (alfa, beta, gama) por série ou None para as que ainda precisam de ajuste
+    S, T = y.shape
+    sazonal = T >= 2 * periodo
+    pendentes = [i for i, p in enumerate(parametros) if p is None]
+    if pendentes:
+        alfas, betas, gamas = _grade(sazonal)
+        forma = (len(pendentes), len(alfas))
+        erro = _suavizar(
+            y[pendentes],
+            np.broadcast_to(alfas, forma), np.broadcast_to(betas, forma), np.broadcast_to(gamas, forma),
+            periodo, sazonal,
+        )[0]
+        melhores = erro.argmin(axis=1)
+        for i, melhor in zip(pendentes, melhores):
+            parametros[i] = (float(alfas[melhor]), float(betas[melhor]), float(gamas[melhor]))
+
+    escolhidos = np.array(parametros)
+    _, nivel, tendencia, estacao = _suavizar(
+        y, escolhidos[:, 0:1], escolhidos[:, 1:2], escolhidos[:, 2:3], periodo, sazonal
+    )
+    return _projetar(nivel[:, 0], tendencia[:, 0], estacao[:, 0], T, horizonte, periodo)
+
+
+def _media_movel(y, horizonte, janela):
+    media = y[:, -janela:].mean(axis=1)
+    return np.repeat(media[:, None], horizonte, axis=1)
+
+
+def prever_lote(historicos, horizonte, modelo=MODELO_PADRAO, periodo=PERIODO_SAZONAL, janela=JANELA_PADRAO):
+    # Prevê `horizonte` meses para cada série de `historicos` (listas de vendas mensais,
+    # da mais antiga para a mais recente). Séries de mesmo tamanho são ajustadas juntas
+    # e os parâmetros escolhidos ficam em cache por série.
+    if modelo not in MODELOS:
+        raise ValueError(f"Modelo de previsão inválido: {modelo}. Use {', '.join(MODELOS)}")
+    # Limites conferidos antes de qualquer ajuste: o custo cresce com horizonte e período
+    if not 1 <= horizonte <= MAX_MESES:
+        raise ValueError(f"O horizonte da previsão deve estar entre 1 e {MAX_MESES}")
+    if not 1 <= periodo <= MAX_PERIODO:
+        raise ValueError(f"periodo deve estar entre 1 e {MAX_PERIODO}")
+    if not 1 <= janela <= MAX_MESES:
+        raise ValueError(f"janela deve estar entre 1 e {MAX_MESES}")
+
+    series = []
+    for historico in historicos:
+        try:
+            serie = np.asarray(historico, dtype=float)
+        except (TypeError, ValueError):
+            serie = None
+        if serie is None or serie.ndim != 1 or not len(serie):
+            raise ValueError("Cada histórico deve ser uma lista não vazia de valores mensais")
+        if not np.isfinite(serie).all():
+            raise ValueError("O histórico de vendas contém valores inválidos")
+        series.append(serie)
+
+    previsoes = np.zeros((len(series), horizonte))
+    parametros = [None] * len(series)
+    por_tamanho = {}
+    for i, serie in enumerate(series):
+        por_tamanho.setdefault(len(serie), []).append(i)
+
+    for tamanho, indices in por_tamanho.items():
+        y = np.stack([series[i] for i in indices])
+        if modelo == "media_movel" or tamanho < 2:
+            previsoes[indices] = _media_movel(y, horizonte, janela)
+            for i in indices:
+                parametros[i] = {"janela": min(janela, tamanho)}
+            continue
+
+        chaves = [chave_serie(series[i], modelo, periodo) for i in indices]
+        ajustes = [parametros_ajustados.consultar(chave) for chave in chaves]
+        previsoes[indices] = _holt_winters(y, horizonte, periodo, ajustes)
+        for i, chave, ajuste in zip(indices, chaves, ajustes):
+            parametros_ajustados.guardar(chave, ajuste)
+            parametros[i] = {"alfa": ajuste[0], "beta": ajuste[1], "gama": ajuste[2]}
+
+    # Vendas não ficam negativas
+    return np.maximum(previsoes, 0.0), parametros
+
+
+def _inteiro(valor, nome, maximo):
+    try:
+        numero = int(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"{nome} deve ser um número inteiro") from None
+    if not 1 <= numero <= maximo:
+        raise ValueError(f"{nome} deve estar entre 1 e {maximo}")
+    return numero
+
+
+def _configuracao(cenario, num_meses_padrao):
+    # Conferida aqui porque a previsão roda antes de normalizar_dados validar o cenário.
+    # Retorna a chave do grupo (modelo, período, janela) e o horizonte do cenário
+    config = cenario.get("previsao", {})
+    if not isinstance(config, dict):
+        raise ValueError("'previsao' deve ser um objeto com modelo, periodo e janela")
+    modelo = config.get("modelo", MODELO_PADRAO)
+    if modelo not in MODELOS:
+        raise ValueError(f"Modelo de previsão inválido: {modelo}. Use {', '.join(MODELOS)}")
+    chave = (
+        modelo,
+        _inteiro(config.get("periodo", PERIODO_SAZONAL), "periodo", MAX_PERIODO),
+        _inteiro(config.get("janela", JANELA_PADRAO), "janela", MAX_MESES),
+    )
+    return chave, _inteiro(cenario.get("num_meses", num_meses_padrao), "num_meses", MAX_MESES)
+
+
+def preencher_previsoes(cenarios, num_meses_padrao, erros=None):
+    # Cenários com "historico_vendas" e sem "previsao_vendas" recebem a previsão calculada
+    # num único lote por modelo. A previsão de um horizonte menor é o início da de um
+    # maior, então cada grupo é previsto até o maior num_meses e depois cortado.
+    # Com `erros` (dict), um cenário inválido não interrompe os demais: a mensagem fica
+    # em erros[índice] e o cenário volta sem previsão.
+    grupos = {}
+    meses = {}
+    for i, cenario in enumerate(cenarios):
+        if isinstance(cenario, dict) and "historico_vendas" in cenario and "previsao_vendas" not in cenario:
+            try:
+                chave, meses[i] = _configuracao(cenario, num_meses_padrao)
+            except ValueError as e:
+                if erros is None:
+                    raise
+                erros[i] = str(e)
+                continue
+            grupos.setdefault(chave, []).append(i)
+
+    cenarios = list(cenarios)
+
+    def prever(indices, modelo, periodo, janela):
+        previsoes, _ = prever_lote(
+            [cenarios[i]["historico_vendas"] for i in indices],
+            max(meses[i] for i in indices), modelo=modelo, periodo=periodo, janela=janela,
+        )
+        for i, previsao in zip(indices, previsoes):
+            cenarios[i] = dict(cenarios[i], previsao_vendas=previsao[:meses[i]].tolist())
+
+    for chave, indices in grupos.items():
+        try:
+            prever(indices, *chave)
+        except ValueError:
+            if erros is None:
+                raise
+            # Algum histórico do grupo é inválido: prevê cenário a cenário para isolá-lo
+            for i in indices:
+                try:
+                    prever([i], *chave)
+                except ValueError as e:
+                    erros[i] = str(e)
+    return cenarios
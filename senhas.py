@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Custo do hash no formato do Werkzeug. A coluna password_hash tem 128 caracteres,
+# então o padrão é pbkdf2 (hashes scrypt do Werkzeug não cabem nela)
+METODO_HASH = os.environ.get("SENHA_METODO_HASH", "pbkdf2:sha256:600000")
+MAX_HASHES_SIMULTANEOS = int(os.environ.get("SENHA_MAX_HASHES_SIMULTANEOS", 2))
+# Quanto tempo (segundos) uma tentativa espera por uma vaga antes de ser recusada
+ESPERA_MAXIMA_HASH = float(os.environ.get("SENHA_ESPERA_MAXIMA", 0.5))
+MAX_CHAVES_LIMITADOR = 10000
+
+
+class ServicoOcupado(Exception):
+    pass
+
+
+# O hash (pbkdf2/scrypt do hashlib) libera o GIL e roda na própria thread da requisição;
+# o semáforo limita quantos rodam ao mesmo tempo no processo, e as demais tentativas
+# são recusadas em vez de esperar ocupando todas as threads do worker
+_vagas = threading.BoundedSemaphore(MAX_HASHES_SIMULTANEOS)
+
+
+def _executar(funcao, *args):
+    if not _vagas.acquire(timeout=ESPERA_MAXIMA_HASH):
+        raise ServicoOcupado("Muitas tentativas simultâneas. Tente novamente em instantes.")
+    try:
+        return funcao(*args)
+    finally:
+        _vagas.release()
+
+
+def gerar_hash(senha):
+    return _executar(generate_password_hash, senha, METODO_HASH)
+
+
+def verificar_senha(password_hash, senha):
+    return _executar(check_password_hash, password_hash, senha)
+
+
+def precisa_atualizar(password_hash):
+    # Hashes gerados com outro método/custo são refeitos no próximo login
+    return password_hash.split("$", 1)[0] != METODO_HASH
+
+
+class LimitadorTentativas:
+    # Janela deslizante em memória: no máximo `max_tentativas` por chave a cada `janela` segundos
+    def __init__(self, max_tentativas, janela):
+        self.max_tentativas = max_tentativas
+        self.janela = janela
+        self._tentativas = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def _limpar(self, tentativas, agora):
+        while tentativas and tentativas[0] <= agora - self.janela:
+            tentativas.popleft()
+
+    def bloqueado(self, chave):
+        with self._lock:
+            tentativas = self._tentativas.get(chave)
+            if not tentativas:
+                return False
+            self._limpar(tentativas, time.monotonic())
+            if not tentativas:
+                del self._tentativas[chave]
+                return False
+            return len(tentativas) >= self.max_tentativas
+
+    def registrar(self, chave):
+        with self._lock:
+            agora = time.monotonic()
+            tentativas = self._tentativas[chave]
+            self._limpar(tentativas, agora)
+            tentativas.append(agora)
+            if len(self._tentativas) > MAX_CHAVES_LIMITADOR:
+                self._remover_expiradas(agora)
+
+    def _remover_expiradas(self, agora):
+        for chave in list(self._tentativas):
+            self._limpar(self._tentativas[chave], agora)
+            if not self._tentativas[chave]:
+                del self._tentativas[chave]
+
+    def limpar(self, chave):
+        with self._lock:
+            self._tentativas.pop(chave, None)
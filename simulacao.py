@@ -0,0 +1,143 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from planejamento import SETUP_PADRAO, normalizar_dados, replicar, calcular_lote
+
+MAX_SIMULACOES = 100000
+# Na rota síncrona a matriz de saldos (simulações x meses) fica no worker web: execuções
+# maiores vão para a fila de tarefas (POST /tarefas com tipo "simulacao")
+MAX_SIMULACOES_SINCRONO = int(os.environ.get("MAX_SIMULACOES_SINCRONO", 10000))
+SIMULACOES_PADRAO = 1000
+TAMANHO_BLOCO_SIMULACAO = 2500
+# Acima deste volume (caminhos x meses) os blocos são distribuídos entre processos
+LIMITE_PARALELO = int(os.environ.get("SIMULACAO_LIMITE_PARALELO", 2000000))
+PROCESSOS_SIMULACAO = int(os.environ.get("SIMULACAO_PROCESSOS", os.cpu_count() or 1))
+PERCENTIS = (5, 50, 95)
+# Os pools são criados dentro dos workers do gunicorn, que já têm threads (gthread, pool do
+# banco): processos saem de um servidor limpo em vez de um fork do worker
+CONTEXTO_PROCESSOS = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+# Parâmetros do setup que podem variar na simulação (o número de parcelas precisa ser inteiro)
+PARAMETROS_ALEATORIOS = tuple(
+    key for key in SETUP_PADRAO if key not in ("vendas_parcelamento", "compras_parcelamento")
+)
+
+_pool = None
+
+
+def _obter_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PROCESSOS_SIMULACAO, mp_context=CONTEXTO_PROCESSOS)
+    return _pool
+
+
+def _sortear(gerador, especificacao, media, tamanho):
+    # `media` é o valor determinístico do cenário, usado quando a distribuição não informa o centro
+    distribuicao = especificacao.get("distribuicao", "normal")
+    if distribuicao == "normal":
+        media = np.asarray(especificacao.get("media", media), dtype=float)
+        if "desvio" in especificacao:
+            desvio = np.asarray(especificacao["desvio"], dtype=float)
+        else:
+            desvio = np.abs(media) * float(especificacao.get("desvio_percentual", 0.1))
+        return gerador.normal(media, desvio, size=tamanho)
+    if distribuicao == "uniforme":
+        return gerador.uniform(
+            np.asarray(especificacao["minimo"], dtype=float),
+            np.asarray(especificacao["maximo"], dtype=float),
+            size=tamanho
+        )
+    if distribuicao == "triangular":
+        return gerador.triangular(
+            np.asarray(especificacao["minimo"], dtype=float),
+            np.asarray(especificacao.get("moda", media), dtype=float),
+            np.asarray(especificacao["maximo"], dtype=float),
+            size=tamanho
+        )
+    raise ValueError(f"Distribuição desconhecida: {distribuicao}")
+
+
+def _simular_bloco(entrada, especificacoes, semente, num_caminhos):
+    gerador = np.random.default_rng(semente)
+    lote = replicar(entrada, num_caminhos)
+
+    if "previsao_vendas" in especificacoes:
+        vendas = _sortear(
+            gerador, especificacoes["previsao_vendas"], entrada["previsao_vendas"],
+            (num_caminhos, entrada["num_meses"])
+        )
+        lote["previsao_vendas"] = np.maximum(vendas, 0.0)
+
+    for key in PARAMETROS_ALEATORIOS:
+        if key in especificacoes:
+            valores = _sortear(gerador, especificacoes[key], entrada["setup"][key], num_caminhos)
+            lote["setup"][key] = np.maximum(valores, 0.0)
+
+    return calcular_lote(lote)["saldo_final_caixa"]
+
+
+def simular(dados, progresso=None, paralelo=True, maximo=MAX_SIMULACOES):
+    # `progresso(fração)` é chamado após cada bloco
+    configuracao = dados.get("simulacao", {})
+    num_simulacoes = int(configuracao.get("num_simulacoes", SIMULACOES_PADRAO))
+    if not 1 <= num_simulacoes <= maximo:
+        raise ValueError(f"num_simulacoes deve estar entre 1 e {maximo}")
+
+    especificacoes = {
+        key: configuracao[key]
+        for key in ("previsao_vendas",) + PARAMETROS_ALEATORIOS
+        if key in configuracao
+    }
+    if not especificacoes:
+        raise ValueError("Informe ao menos uma distribuição em 'simulacao'")
+
+    entrada = normalizar_dados(dados)
+
+    # Blocos de tamanho fixo, cada um com sua própria semente derivada: o resultado
+    # é o mesmo com ou sem processos paralelos
+    tamanhos = [TAMANHO_BLOCO_SIMULACAO] * (num_simulacoes // TAMANHO_BLOCO_SIMULACAO)
+    if num_simulacoes % TAMANHO_BLOCO_SIMULACAO:
+        tamanhos.append(num_simulacoes % TAMANHO_BLOCO_SIMULACAO)
+    sementes = np.random.SeedSequence(configuracao.get("semente")).spawn(len(tamanhos))
+
+    argumentos = [(entrada, especificacoes, semente, tamanho) for semente, tamanho in zip(sementes, tamanhos)]
+    if paralelo and len(argumentos) > 1 and num_simulacoes * entrada["num_meses"] > LIMITE_PARALELO:
+        blocos = _obter_pool().map(_simular_bloco, *zip(*argumentos))
+    else:
+        blocos = (_simular_bloco(*args) for args in argumentos)
+
+    # Cada bloco é reduzido assim que chega (somas e contagens de saldo negativo) e copiado
+    # para uma única matriz, usada só pelos percentis
+    saldos = np.empty((num_simulacoes, entrada["num_meses"]))
+    soma = np.zeros(entrada["num_meses"])
+    negativos = np.zeros(entrada["num_meses"])
+    negativos_periodo = 0
+    inicio = 0
+    for numero, bloco in enumerate(blocos, 1):
+        saldos[inicio:inicio + len(bloco)] = bloco
+        inicio += len(bloco)
+        soma += bloco.sum(axis=0)
+        negativo = bloco < 0
+        negativos += negativo.sum(axis=0)
+        negativos_periodo += int(negativo.any(axis=1).sum())
+        if progresso is not None:
+            progresso(numero / len(argumentos))
+
+    # Ordena a própria matriz em vez de uma cópia
+    percentis = np.percentile(saldos, PERCENTIS, axis=0, overwrite_input=True)
+    return {
+        "meses": [f"Mês {i+1}" for i in range(entrada["num_meses"])],
+        "num_simulacoes": num_simulacoes,
+        "percentis": {
+            f"p{percentil}": valores.tolist() for percentil, valores in zip(PERCENTIS, percentis)
+        },
+        "media": (soma / num_simulacoes).tolist(),
+        "probabilidade_saldo_negativo": (negativos / num_simulacoes).tolist(),
+        "probabilidade_saldo_negativo_periodo": negativos_periodo / num_simulacoes,
+    }
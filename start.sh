@@ -5,13 +5,8 @@ echo "=== INICIANDO APLICAÇÃO ==="
 
 # Criar tabelas do banco de dados
 echo "Criando tabelas do banco de dados..."
-python -c "
-from app import db, app
-with app.app_context():
-    db.create_all()
-    print('Tabelas criadas com sucesso!')
-"
+FLASK_APP=app flask criar-tabelas
 
 # Iniciar a aplicação
 echo "Iniciando servidor..."
-exec gunicorn --bind 0.0.0.0:5000 app:app
+exec gunicorn -c gunicorn.conf.py app:app
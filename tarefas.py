@@ -0,0 +1,165 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+
+from planejamento import normalizar_dados, calcular_em_blocos, PlanejamentoCaixa, NUM_MESES_PADRAO
+from previsao import preencher_previsoes
+from simulacao import simular, CONTEXTO_PROCESSOS
+
+TIPOS = ("calcular", "lote", "simulacao")
+
+PENDENTE = "pendente"
+EXECUTANDO = "executando"
+CONCLUIDA = "concluida"
+ERRO = "erro"
+CANCELADA = "cancelada"
+FINAIS = (CONCLUIDA, ERRO, CANCELADA)
+
+PROCESSOS_TAREFAS = int(os.environ.get("TAREFAS_PROCESSOS", 2))
+MAX_CENARIOS_TAREFA = int(os.environ.get("MAX_CENARIOS_TAREFA", 10000))
+# Intervalo mínimo (segundos) entre gravações de progresso e consultas de cancelamento
+INTERVALO_PROGRESSO = 0.5
+
+_pool = None
+_engines = {}
+
+
+class TarefaCancelada(Exception):
+    pass
+
+
+def _obter_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PROCESSOS_TAREFAS, mp_context=CONTEXTO_PROCESSOS)
+    return _pool
+
+
+def submeter(url_banco, tarefa_id, tipo, dados, ao_terminar):
+    # `ao_terminar(future)` roda quando o processo devolve a tarefa (ou morre)
+    global _pool
+    try:
+        future = _obter_pool().submit(executar_tarefa, url_banco, tarefa_id, tipo, dados)
+    except BrokenProcessPool:
+        # Um processo do pool morreu: descarta o pool e tenta com um novo
+        _pool = None
+        future = _obter_pool().submit(executar_tarefa, url_banco, tarefa_id, tipo, dados)
+    future.add_done_callback(ao_terminar)
+    return future
+
+
+def cenarios_lote(dados, maximo):
+    # Lote no formato do /calcular/lote: a lista de cenários ou {"cenarios": [...]}
+    cenarios = dados.get("cenarios") if isinstance(dados, dict) else dados
+    if not isinstance(cenarios, list) or not cenarios:
+        raise ValueError("Envie uma lista de cenários em 'cenarios'.")
+    if len(cenarios) > maximo:
+        raise ValueError(f"Máximo de {maximo} cenários por lote.")
+    return cenarios
+
+
+def preparar_lote(cenarios):
+    # Preenche as previsões e normaliza os cenários. Inválidos geram uma linha de erro
+    # própria sem interromper o lote; os válidos vêm como (índice, id, entrada)
+    erros_previsao = {}
+    cenarios = preencher_previsoes(cenarios, NUM_MESES_PADRAO, erros_previsao)
+    erros = []
+    validos = []
+    for indice, cenario in enumerate(cenarios):
+        if indice in erros_previsao:
+            erros.append({"indice": indice, "error": erros_previsao[indice]})
+            continue
+        try:
+            validos.append((indice, cenario.get("id"), normalizar_dados(cenario)))
+        except Exception as e:
+            erros.append({"indice": indice, "error": str(e)})
+    return erros, validos
+
+
+def validar(tipo, dados):
+    # Validação barata feita na submissão, para que erros de entrada voltem como 400
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo de tarefa inválido: {tipo}. Use {', '.join(TIPOS)}")
+    if tipo == "lote":
+        cenarios_lote(dados, MAX_CENARIOS_TAREFA)
+    elif not isinstance(dados, dict):
+        raise ValueError("Envie os dados do cenário em 'dados'.")
+    else:
+        normalizar_dados(dados)
+
+
+class _Execucao:
+    # Lado do processo do pool: grava progresso e resultado direto no banco, com uma
+    # engine própria (conexões não atravessam o fork)
+    def __init__(self, url_banco, tarefa_id):
+        if url_banco not in _engines:
+            _engines[url_banco] = create_engine(url_banco, pool_pre_ping=True)
+        self.engine = _engines[url_banco]
+        self.tarefa_id = tarefa_id
+        self._ultima_gravacao = 0.0
+
+    def _atualizar(self, campos, condicao=""):
+        atribuicoes = ", ".join(f"{campo} = :{campo}" for campo in campos)
+        with self.engine.begin() as conexao:
+            resultado = conexao.execute(
+                text(f"UPDATE job SET {atribuicoes}, updated_at = :agora WHERE id = :id {condicao}"),
+                dict(campos, agora=datetime.utcnow(), id=self.tarefa_id),
+            )
+        return resultado.rowcount
+
+    def progresso(self, fracao):
+        agora = time.monotonic()
+        if agora - self._ultima_gravacao < INTERVALO_PROGRESSO and fracao < 1:
+            return
+        self._ultima_gravacao = agora
+        # Só avança tarefas ainda em execução: se nada mudou, ela foi cancelada
+        if not self._atualizar({"progress": fracao}, "AND status = 'executando'"):
+            raise TarefaCancelada()
+
+    def concluir(self, resultado):
+        self._atualizar(
+            {"status": CONCLUIDA, "progress": 1.0, "result": json.dumps(resultado), "finished_at": datetime.utcnow()},
+            "AND status = 'executando'",
+        )
+
+    def falhar(self, mensagem):
+        self._atualizar(
+            {"status": ERRO, "error": mensagem, "finished_at": datetime.utcnow()},
+            "AND status = 'executando'",
+        )
+
+
+def _executar_lote(dados, execucao):
+    bruto = isinstance(dados, dict) and dados.get("formato") == "raw"
+    resultados, validos = preparar_lote(cenarios_lote(dados, MAX_CENARIOS_TAREFA))
+    entradas = [entrada for _, _, entrada in validos]
+    for posicao, planejamento in calcular_em_blocos(entradas):
+        indice, cenario_id = validos[posicao][:2]
+        linha = planejamento.gerar_resultados_brutos() if bruto else planejamento.gerar_resultados()
+        resultados.append({"indice": indice, "id": cenario_id, **linha})
+        execucao.progresso((posicao + 1) / len(entradas))
+    return resultados
+
+
+def executar_tarefa(url_banco, tarefa_id, tipo, dados):
+    execucao = _Execucao(url_banco, tarefa_id)
+    try:
+        if tipo == "lote":
+            resultado = _executar_lote(dados, execucao)
+        elif tipo == "simulacao":
+            # Já roda dentro do pool: sem subprocessos próprios
+            dados = preencher_previsoes([dados], NUM_MESES_PADRAO)[0]
+            resultado = simular(dados, progresso=execucao.progresso, paralelo=False)
+        else:
+            entrada = normalizar_dados(preencher_previsoes([dados], NUM_MESES_PADRAO)[0])
+            resultado = PlanejamentoCaixa().calcular_entrada(entrada)
+        execucao.concluir(resultado)
+    except TarefaCancelada:
+        pass
+    except Exception as e:
+        execucao.falhar(str(e))
@@ -0,0 +1,42 @@
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+# Os módulos do app ficam na raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # App com banco SQLite descartável e caches zerados a cada teste
+    import app as modulo
+    from cache_resultados import CacheResultados
+
+    monkeypatch.setattr(modulo, "cache_resultados", CacheResultados(tamanho_maximo=64, ttl=300))
+    monkeypatch.setattr(modulo, "planos_compilados", CacheResultados(tamanho_maximo=64, ttl=300))
+    aplicacao = modulo.create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'teste.db'}",
+        "TESTING": True,
+    })
+    with aplicacao.app_context():
+        modulo.db.create_all()
+    return aplicacao
+
+
+@pytest.fixture
+def cliente(app):
+    # Cliente já logado com assinatura ativa
+    import app as modulo
+
+    with app.app_context():
+        user = modulo.User(email="teste@exemplo.com", password_hash="x")
+        user.subscription_end = datetime.utcnow() + timedelta(days=30)
+        modulo.db.session.add(user)
+        modulo.db.session.commit()
+        user_id = user.id
+    cliente = app.test_client()
+    with cliente.session_transaction() as sessao:
+        sessao["user_id"] = user_id
+    return cliente
@@ -0,0 +1,23 @@
+# A solução direta (saldo inicial e linha de crédito) precisa atingir a meta exatamente,
+# sem ficar uma fração de centavo abaixo pelo erro de ponto flutuante.
+import random
+
+import pytest
+
+from busca_meta import buscar_meta
+from test_planejamento import gerar_dados
+
+
+@pytest.mark.parametrize("semente", range(40))
+@pytest.mark.parametrize("parametro", ["saldo_caixa_mes0", "linha_credito"])
+@pytest.mark.parametrize("tipo", ["saldo_minimo", "saldo_final"])
+def test_solucao_direta_atinge_meta(semente, parametro, tipo):
+    rng = random.Random(semente)
+    dados = gerar_dados(rng, rng.randint(1, 24))
+    alvo = rng.choice([0.0, rng.uniform(-50000, 50000)])
+
+    resposta = buscar_meta(dados, {"tipo": tipo, "valor": alvo}, parametro)
+    assert resposta["metrica_obtida"] >= alvo
+    if parametro == "saldo_caixa_mes0" and not resposta["atende_atual"]:
+        dados = dict(dados, saldo_caixa_mes0=resposta["valor_necessario"])
+        assert buscar_meta(dados, {"tipo": tipo, "valor": alvo}, parametro)["atende_atual"]
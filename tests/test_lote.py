@@ -0,0 +1,29 @@
+# CLI de cálculo em lote: tabelas mensal e de indicadores gravadas por arquivo de entrada.
+import json
+
+import pandas as pd
+
+from lote import processar_arquivo, saidas
+
+
+def test_indicadores_mantem_ids_ausentes_nulos(tmp_path):
+    cenarios = [
+        {"id": "a", "num_meses": 3, "previsao_vendas": [100000, 90000, 110000]},
+        {"num_meses": 0},
+        {"num_meses": 2, "previsao_vendas": [50000, 60000]},
+    ]
+    entrada = tmp_path / "cenarios.json"
+    entrada.write_text(json.dumps(cenarios), encoding="utf-8")
+
+    resumo = processar_arquivo(str(entrada), str(tmp_path), "csv")
+    assert (resumo["cenarios"], resumo["erros"]) == (3, 1)
+
+    destino_mensal, destino_indicadores = saidas(str(tmp_path), "cenarios.json", "csv")
+    indicadores = pd.read_csv(destino_indicadores, keep_default_na=False)
+    # Inválido sem id fica vazio (e não "nan"); válido sem id usa o índice
+    assert indicadores["id"].tolist() == ["a", "", "2"]
+    assert indicadores["erro"].tolist()[0] == ""
+    assert "num_meses" in indicadores["erro"].tolist()[1]
+
+    mensal = pd.read_csv(destino_mensal)
+    assert mensal["indice"].tolist() == [0, 0, 0, 2, 2]
@@ -0,0 +1,65 @@
+# Agregação das métricas entre workers: cada processo grava um arquivo em METRICAS_DIR
+# e a coleta soma todos, inclusive os de workers já encerrados.
+import json
+import os
+
+import pytest
+
+import metricas
+
+
+@pytest.fixture
+def diretorio(tmp_path, monkeypatch):
+    monkeypatch.setenv("METRICAS_DIR", str(tmp_path))
+    monkeypatch.setattr(metricas, "_coletor_medidores", [None])
+    # O processo do teste só lê os arquivos gravados pelos "workers"
+    monkeypatch.setattr(metricas, "_gravador", {"pid": os.getpid(), "id": "teste", "alterado": False})
+    monkeypatch.setattr(metricas, "gravar_processo", lambda: None)
+    return tmp_path
+
+
+def _gravar_processo(diretorio, pid, requisicoes, consultas):
+    with open(os.path.join(diretorio, f"processo-{pid}-teste.json"), "w") as arquivo:
+        json.dump({
+            "pid": pid,
+            "acumulados": {
+                metricas.duracao_requisicoes.nome: [[["/calcular", "POST", "200"], [requisicoes] + [0] * 10, 0.5, requisicoes]],
+                metricas.consultas_banco.nome: [[[], consultas]],
+            },
+            "medidores": [["planejamento_teste", "Medidor de teste", [[{"medida": "tamanho"}, pid]]]],
+        }, arquivo)
+
+
+def _valor(linhas, prefixo):
+    return next(float(linha.rsplit(" ", 1)[1]) for linha in linhas if linha.startswith(prefixo))
+
+
+def test_coleta_soma_processos_e_encerrados(diretorio):
+    _gravar_processo(diretorio, 101, 3, 7)
+    _gravar_processo(diretorio, 102, 4, 1)
+
+    linhas = metricas.exportar_metricas()
+    requisicoes = 'planejamento_requisicao_segundos_count{rota="/calcular",metodo="POST",status="200"}'
+    assert _valor(linhas, requisicoes) == 7
+    assert _valor(linhas, "planejamento_db_consultas_total") == 8
+    assert 'planejamento_teste{medida="tamanho",pid="101"} 101' in linhas
+
+    # O worker 101 sai: os acumulados continuam na soma e o medidor some
+    metricas.processo_encerrado(101)
+    linhas = metricas.exportar_metricas()
+    assert _valor(linhas, requisicoes) == 7
+    assert _valor(linhas, "planejamento_db_consultas_total") == 8
+    assert not any('pid="101"' in linha for linha in linhas)
+    assert sorted(os.listdir(diretorio)) == ["encerrados.json", "processo-102-teste.json"]
+
+
+def test_encerrado_listado_nao_conta_duas_vezes(diretorio):
+    # Coleta que ainda vê o arquivo do worker depois de encerrados.json já incluí-lo
+    _gravar_processo(diretorio, 101, 3, 7)
+    with open(os.path.join(diretorio, "processo-101-teste.json")) as arquivo:
+        conteudo = arquivo.read()
+    metricas.processo_encerrado(101)
+    with open(os.path.join(diretorio, "processo-101-teste.json"), "w") as arquivo:
+        arquivo.write(conteudo)
+
+    assert _valor(metricas.exportar_metricas(), "planejamento_db_consultas_total") == 7
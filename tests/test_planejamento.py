@@ -0,0 +1,121 @@
+# O motor vetorizado precisa reproduzir, bit a bit, a implementação original com laços
+# (tests/referencia_planejamento.py): tabela formatada e valores numéricos de cada linha.
+import json
+import random
+
+import pytest
+
+from planejamento import (
+    PlanejamentoCaixa, normalizar_dados, empilhar, calcular_lote, calcular_cenario, formatar_resultados,
+    MAX_MESES_ESCALAR,
+)
+from referencia_planejamento import PlanejamentoCaixaReferencia
+
+# Linhas que a referência guarda como atributo; as demais são conferidas pela tabela formatada
+LINHAS_COMPARADAS = (
+    "vendas_vista", "total_recebimentos", "compras_totais", "fornecedores_vista",
+    "total_pagamento_compras", "desp_variaveis", "desp_variaveis_vista",
+    "total_desp_variaveis_parceladas", "total_desp_variaveis_parcelamento", "desp_fixas",
+    "saldo_operacional", "saldo_final_caixa",
+)
+
+
+def _valor(rng):
+    return rng.choice([0, 0, rng.uniform(-1000, 100000), round(rng.uniform(0, 50000), 2)])
+
+
+def gerar_dados(rng, num_meses):
+    dados = {
+        "num_meses": num_meses,
+        "venda_mes0": _valor(rng),
+        "saldo_caixa_mes0": _valor(rng),
+        "previsao_vendas": [_valor(rng) for _ in range(num_meses)],
+        "contas_receber_anteriores": [_valor(rng) for _ in range(num_meses)],
+        "contas_pagar_anteriores": [_valor(rng) for _ in range(num_meses)],
+        "desp_fixas_manuais": [_valor(rng) for _ in range(num_meses)],
+        "setup": {
+            "vendas_vista": rng.random(),
+            "vendas_parcelamento": rng.randint(1, 14),
+            "plus_vendas": rng.choice([0, rng.uniform(-0.5, 0.5)]),
+            "cmv": rng.random(),
+            "percent_compras": rng.random(),
+            "compras_vista": rng.random(),
+            "compras_parcelamento": rng.randint(1, 14),
+            "desp_variaveis_impostos": rng.random(),
+            "desp_variaveis_parcelamento": rng.random(),
+        },
+    }
+    if rng.random() < 0.3:
+        dados["desp_variaveis_manuais"] = [_valor(rng)]
+    if rng.random() < 0.2:
+        del dados["setup"]
+    return dados
+
+
+def calcular_referencia(dados):
+    referencia = PlanejamentoCaixaReferencia(dados["num_meses"])
+    # A referência altera as listas recebidas: trabalha numa cópia
+    resultados = referencia.calcular(json.loads(json.dumps(dados)))
+    return referencia, resultados
+
+
+@pytest.mark.parametrize("semente", range(20))
+def test_calcular_igual_a_referencia(semente):
+    rng = random.Random(semente)
+    for _ in range(50):
+        dados = gerar_dados(rng, 6)
+        referencia, esperado = calcular_referencia(dados)
+        planejamento = PlanejamentoCaixa()
+        resultados = planejamento.calcular(dados)
+
+        assert json.dumps(resultados) == json.dumps(esperado)
+        for linha in LINHAS_COMPARADAS:
+            assert getattr(planejamento, linha) == [float(x) for x in getattr(referencia, linha)], linha
+
+
+@pytest.mark.parametrize("num_meses", [1, 12, 60, 120, 240])
+def test_horizontes_longos(num_meses):
+    rng = random.Random(num_meses)
+    dados = gerar_dados(rng, num_meses)
+    referencia, esperado = calcular_referencia(dados)
+    planejamento = PlanejamentoCaixa()
+
+    assert json.dumps(planejamento.calcular(dados)) == json.dumps(esperado)
+    assert planejamento.saldo_final_caixa == [float(x) for x in referencia.saldo_final_caixa]
+
+
+def test_lote_com_horizontes_diferentes():
+    # Cenários completados com zeros até o maior horizonte não mudam os próprios meses
+    rng = random.Random(1)
+    cenarios = [gerar_dados(rng, rng.choice([1, 6, 24, 60])) for _ in range(40)]
+    entradas = [normalizar_dados(dados) for dados in cenarios]
+    matrizes = calcular_lote(empilhar(entradas))
+
+    for i, dados in enumerate(cenarios):
+        referencia, _ = calcular_referencia(dados)
+        num_meses = dados["num_meses"]
+        for linha in LINHAS_COMPARADAS:
+            assert matrizes[linha][i, :num_meses].tolist() == [float(x) for x in getattr(referencia, linha)], linha
+
+
+@pytest.mark.parametrize("num_meses", [1, 2, 6, MAX_MESES_ESCALAR, MAX_MESES_ESCALAR + 1, 60])
+def test_caminho_escalar_igual_ao_lote(num_meses):
+    # O caminho escalar de cenário único dá as mesmas linhas, bit a bit, que o motor vetorizado
+    rng = random.Random(num_meses)
+    for _ in range(30):
+        entrada = normalizar_dados(gerar_dados(rng, num_meses))
+        matrizes = calcular_lote(empilhar([entrada]))
+        linhas = calcular_cenario(entrada)
+        assert linhas.keys() == matrizes.keys()
+        for linha, valores in linhas.items():
+            assert json.dumps(valores) == json.dumps(matrizes[linha][0].tolist()), linha
+
+
+@pytest.mark.parametrize("semente", range(20))
+def test_formatar_resultados_brutos_completos(semente):
+    # Resultados guardados no formato bruto completo voltam iguais ao /calcular
+    rng = random.Random(semente)
+    planejamento = PlanejamentoCaixa()
+    resultados = planejamento.calcular_entrada(normalizar_dados(gerar_dados(rng, rng.randint(1, 36))))
+    guardados = json.loads(json.dumps(planejamento.gerar_resultados_brutos(centavos=False)))
+    assert json.dumps(formatar_resultados(guardados)) == json.dumps(resultados)
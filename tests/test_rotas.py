@@ -0,0 +1,302 @@
+# Rotas HTTP de cálculo, com o app de teste (banco SQLite descartável) e um usuário assinante.
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from planejamento import MAX_MESES
+
+
+def test_prever_recusa_horizonte_e_periodo_acima_do_limite(cliente):
+    historico = [100.0] * 24
+    resposta = cliente.post("/prever", json={"historico_vendas": historico, "num_meses": 2_000_000})
+    assert resposta.status_code == 400
+    resposta = cliente.post("/prever", json={"historico_vendas": historico, "periodo": 2_000_000})
+    assert resposta.status_code == 400
+
+    resposta = cliente.post("/calcular", json={"historico_vendas": historico, "num_meses": MAX_MESES + 1})
+    assert resposta.status_code == 400
+    assert str(MAX_MESES) in resposta.get_json()["error"]
+    resposta = cliente.post("/calcular", json={"historico_vendas": historico, "previsao": {"periodo": 2_000_000}})
+    assert resposta.status_code == 400
+
+    resposta = cliente.post("/prever", json={"historico_vendas": historico, "num_meses": 12})
+    assert len(resposta.get_json()["previsao_vendas"]) == 12
+
+
+def test_previsao_invalida_e_historico_em_todas_as_rotas(cliente):
+    historico = [float(100 + i % 12) for i in range(36)]
+    for previsao in ({"periodo": "abc"}, {"janela": None}, {"modelo": "outro"}, "holt_winters"):
+        resposta = cliente.post("/calcular", json={"historico_vendas": historico, "previsao": previsao})
+        assert resposta.status_code == 400
+        assert "error" in resposta.get_json()
+
+    # Só com o histórico, as demais rotas usam a mesma previsão do /calcular
+    dados = {"historico_vendas": historico, "num_meses": 6, "saldo_caixa_mes0": 5000}
+    completo = cliente.post("/calcular", json=dados).get_json()
+    assert cliente.post("/calcular/compilar", json=dados).get_json()["resultados"] == completo["resultados"]
+    criado = cliente.post("/cenarios", json={"nome": "Histórico", "dados": dados}).get_json()
+    assert criado["resultados"] == completo
+
+    previsao = cliente.post("/prever", json=dados).get_json()["previsao_vendas"]
+    metas = [
+        cliente.post("/calcular/meta", json=dict(entrada, meta={"valor": 0}, parametro="saldo_caixa_mes0")).get_json()
+        for entrada in (dados, dict(dados, previsao_vendas=previsao))
+    ]
+    assert metas[0]["metrica_atual"] == metas[1]["metrica_atual"]
+
+
+def _dados(**alteracoes):
+    dados = {
+        "num_meses": 6,
+        "venda_mes0": 80000,
+        "saldo_caixa_mes0": 15000,
+        "previsao_vendas": [100000, 110000, 95000, 120000, 105000, 98000],
+        "contas_receber_anteriores": [20000, 10000, 0, 0, 0, 0],
+        "contas_pagar_anteriores": [15000, 5000, 0, 0, 0, 0],
+        "desp_fixas_manuais": [30000] * 6,
+    }
+    dados.update(alteracoes)
+    return dados
+
+
+def test_incremental_igual_ao_calcular_apos_edicao(cliente):
+    # Primeira edição sem plano: o servidor compila; a segunda aplica só as diferenças
+    resposta = cliente.post("/calcular/incremental", json={"seq": 1, "dados": _dados()})
+    plano_id = resposta.get_json()["plano_id"]
+
+    editado = _dados(previsao_vendas=[100000, 150000, 95000, 120000, 105000, 98000], saldo_caixa_mes0=5000)
+    incremental = cliente.post("/calcular/incremental", json={"plano_id": plano_id, "seq": 2, "dados": editado}).get_json()
+    completo = cliente.post("/calcular", json=editado).get_json()
+
+    assert incremental["seq"] == 2
+    assert incremental["plano_id"] == plano_id
+    assert incremental["resultados"] == completo["resultados"]
+    assert incremental["indicadores"] == completo["indicadores"]
+
+
+def test_tarefas_status_cancelamento_e_limite(cliente, monkeypatch):
+    import tarefas
+
+    # A tarefa não chega a ir para o pool de processos: fica "executando" até ser cancelada
+    submetidas = []
+    monkeypatch.setattr(tarefas, "submeter", lambda url, tarefa_id, *args: submetidas.append(tarefa_id))
+
+    resposta = cliente.post("/tarefas", json={"tipo": "calcular", "dados": _dados()})
+    assert resposta.status_code == 202
+    tarefa_id = resposta.get_json()["id"]
+    assert submetidas == [tarefa_id]
+    assert cliente.get(resposta.headers["Location"]).get_json()["status"] == tarefas.EXECUTANDO
+
+    assert cliente.post("/tarefas", json={"tipo": "desconhecido", "dados": {}}).status_code == 400
+
+    cancelada = cliente.post(f"/tarefas/{tarefa_id}/cancelar")
+    assert cancelada.get_json()["status"] == tarefas.CANCELADA
+    assert cliente.post(f"/tarefas/{tarefa_id}/cancelar").status_code == 409
+    assert cliente.get(f"/tarefas/{tarefa_id}").get_json()["status"] == tarefas.CANCELADA
+
+    # Tarefa já terminada: um único evento; a vaga de eventos é liberada ao fechar
+    for _ in range(2):
+        eventos = cliente.get(f"/tarefas/{tarefa_id}/eventos")
+        assert eventos.status_code == 200
+        assert eventos.get_data(as_text=True).count("data: ") == 1
+        eventos.close()
+
+    assert cliente.get("/tarefas?limite=abc").status_code == 400
+    assert len(cliente.get("/tarefas?limite=0").get_json()["tarefas"]) == 1
+    assert cliente.get("/tarefas/inexistente").status_code == 404
+
+
+def test_calcular_usa_cache_e_etag(app, cliente):
+    assert app.test_client().get("/cache_info").status_code == 401
+
+    primeira = cliente.post("/calcular", json=_dados())
+    assert primeira.status_code == 200
+    etag = primeira.headers["ETag"]
+
+    # Payload equivalente (série completada com zeros) cai na mesma entrada do cache
+    segunda = cliente.post("/calcular", json=_dados(desp_fixas_manuais=[30000] * 6 + [0]))
+    assert segunda.headers["ETag"] == etag
+    assert segunda.get_data() == primeira.get_data()
+    estatisticas = cliente.get("/cache_info").get_json()
+    assert (estatisticas["falhas"], estatisticas["acertos"]) == (1, 1)
+
+    nao_modificado = cliente.post("/calcular", json=_dados(), headers={"If-None-Match": etag})
+    assert nao_modificado.status_code == 304
+    assert not nao_modificado.get_data()
+    assert cliente.post("/calcular", json=_dados(saldo_caixa_mes0=0), headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_simulacao_sincrona_limitada(cliente):
+    from simulacao import MAX_SIMULACOES_SINCRONO
+
+    configuracao = {"semente": 1, "previsao_vendas": {"desvio_percentual": 0.5}}
+    resposta = cliente.post("/calcular/simulacao", json=_dados(
+        desp_fixas_manuais=[60000] * 6, simulacao=dict(configuracao, num_simulacoes=3000),
+    ))
+    resultado = resposta.get_json()
+    assert len(resultado["media"]) == 6
+    assert 0 < resultado["probabilidade_saldo_negativo_periodo"] < 1
+    assert resultado["percentis"]["p5"] <= resultado["percentis"]["p95"]
+
+    resposta = cliente.post("/calcular/simulacao", json=_dados(
+        simulacao=dict(configuracao, num_simulacoes=MAX_SIMULACOES_SINCRONO + 1),
+    ))
+    assert resposta.status_code == 400
+
+
+def test_login_limita_falhas_por_email_normalizado(app, monkeypatch):
+    import app as modulo
+    from senhas import LimitadorTentativas
+
+    monkeypatch.setattr(modulo, "falhas_por_email", LimitadorTentativas(3, 300))
+    monkeypatch.setattr(modulo, "falhas_por_ip", LimitadorTentativas(100, 300))
+    cliente = app.test_client()
+    for email in ("user@x.com", "User@X.com", " USER@x.com "):
+        resposta = cliente.post("/login", data={"email": email, "password": "errada"})
+        assert resposta.status_code == 200
+    resposta = cliente.post("/login", data={"email": "uSeR@x.CoM", "password": "errada"})
+    assert resposta.status_code == 429
+    assert cliente.post("/login", data={"email": "outro@x.com", "password": "errada"}).status_code == 200
+
+
+def test_meta_atinge_alvo_e_mantem_valor_atendido(cliente):
+    apertado = _dados(desp_fixas_manuais=[60000] * 6)
+    for parametro in ("saldo_caixa_mes0", "vendas_vista", "vendas_parcelamento", "linha_credito"):
+        resposta = cliente.post("/calcular/meta", json=dict(
+            apertado, meta={"tipo": "saldo_minimo", "valor": 0}, parametro=parametro,
+        )).get_json()
+        assert not resposta["atende_atual"]
+        assert resposta["viavel"], parametro
+        assert resposta["metrica_obtida"] >= resposta["meta"]["valor"], parametro
+
+    # O saldo inicial devolvido, reenviado, já atende a meta
+    resposta = cliente.post("/calcular/meta", json=dict(
+        apertado, meta={"tipo": "saldo_minimo", "valor": 0}, parametro="saldo_caixa_mes0",
+    )).get_json()
+    reenviado = cliente.post("/calcular/meta", json=dict(
+        apertado, saldo_caixa_mes0=resposta["valor_necessario"],
+        meta={"tipo": "saldo_minimo", "valor": 0}, parametro="saldo_caixa_mes0",
+    )).get_json()
+    assert reenviado["atende_atual"]
+
+    for parametro in ("saldo_caixa_mes0", "vendas_vista"):
+        resposta = cliente.post("/calcular/meta", json=_dados(
+            meta={"tipo": "saldo_minimo", "valor": 0}, parametro=parametro,
+        )).get_json()
+        assert resposta["atende_atual"]
+        assert resposta["valor_necessario"] == resposta["valor_atual"]
+
+
+def test_diario_reconcilia_com_mensal_no_calendario_comercial(cliente):
+    resposta = cliente.post("/calcular/diario", json=_dados(desp_variaveis_manuais=[12000])).get_json()
+    assert resposta["num_dias"] == 6 * 30
+    assert resposta["reconciliacao"]["diferenca_maxima"] < 1e-6
+    assert resposta["mensal"]["saldo_final_caixa"] == resposta["reconciliacao"]["saldo_final_caixa_modelo_mensal"]
+
+    # Prazos fora dos múltiplos de 30 dias deslocam os recebimentos dentro do mês
+    deslocado = cliente.post("/calcular/diario", json=_dados(diario={"prazos_recebimento": [15, 45, 75, 105, 135]})).get_json()
+    assert deslocado["reconciliacao"]["diferenca_maxima"] > 1
+
+
+def test_consolidado_e_a_soma_das_empresas(cliente):
+    empresas = [
+        dict(_dados(), id="matriz"),
+        dict(_dados(saldo_caixa_mes0=-8000, desp_fixas_manuais=[50000] * 6), id="filial", setup={"vendas_parcelamento": 3, "cmv": 0.3}),
+    ]
+    resposta = cliente.post("/calcular/consolidado?format=raw", json={"empresas": empresas}).get_json()
+    assert resposta["empresas"] == ["matriz", "filial"]
+    assert resposta["empresas_saldo_negativo"] == ["filial"]
+
+    linhas = resposta["consolidado"]["linhas"]
+    por_empresa = resposta["por_empresa"]
+    for id_linha in por_empresa["ids"]:
+        consolidado = linhas["valores"][linhas["ids"].index(id_linha)]
+        valores = por_empresa["valores"][por_empresa["ids"].index(id_linha)]
+        assert consolidado == pytest.approx([sum(meses) for meses in zip(*valores)], abs=0.02)
+
+    # E cada empresa é o mesmo cálculo do /calcular
+    individuais = [
+        cliente.post("/calcular?format=raw", json=empresa).get_json()["linhas"]
+        for empresa in empresas
+    ]
+    saldo_consolidado = linhas["valores"][linhas["ids"].index("saldo_final_caixa")]
+    soma = [sum(meses) for meses in zip(*(linha["valores"][linha["ids"].index("saldo_final_caixa")] for linha in individuais))]
+    assert saldo_consolidado == pytest.approx(soma, abs=0.02)
+
+
+def test_cenarios_guardam_resultados_e_paginam(cliente):
+    ids = []
+    for saldo in (1000, 2000, 3000):
+        resposta = cliente.post("/cenarios", json={"nome": f"Saldo {saldo}", "dados": _dados(saldo_caixa_mes0=saldo)})
+        assert resposta.status_code == 201
+        criado = resposta.get_json()
+        assert criado["resultados"] == cliente.post("/calcular", json=_dados(saldo_caixa_mes0=saldo)).get_json()
+        ids.append(criado["id"])
+
+    pagina = cliente.get("/cenarios?limite=2").get_json()
+    assert [cenario["id"] for cenario in pagina["cenarios"]] == ids[:0:-1]
+    assert "dados" not in pagina["cenarios"][0]
+    seguinte = cliente.get(f"/cenarios?limite=2&apos={pagina['proximo']}").get_json()
+    assert [cenario["id"] for cenario in seguinte["cenarios"]] == ids[:1]
+    assert seguinte["proximo"] is None
+    assert len(cliente.get("/cenarios?limite=0").get_json()["cenarios"]) == 1
+    assert cliente.get("/cenarios?limite=abc").status_code == 400
+
+    alterado = cliente.put(f"/cenarios/{ids[0]}", json={"dados": _dados(saldo_caixa_mes0=9000)}).get_json()
+    assert alterado["resultados"] == cliente.post("/calcular", json=_dados(saldo_caixa_mes0=9000)).get_json()
+
+    carregados = cliente.post("/cenarios/carregar", json={"ids": [ids[2], ids[0], 999]}).get_json()["cenarios"]
+    assert [cenario["id"] for cenario in carregados] == [ids[2], ids[0]]
+
+    # Guardados em formato numérico; format=raw devolve sem formatar
+    brutos = cliente.post("/cenarios/carregar?format=raw", json={"ids": [ids[1]]}).get_json()["cenarios"][0]
+    assert brutos["resultados"]["formato"] == "raw"
+    saldo = brutos["resultados"]["linhas"]["ids"].index("saldo_final_caixa")
+    calculado = cliente.post("/calcular?format=raw", json=_dados(saldo_caixa_mes0=2000)).get_json()["linhas"]
+    assert brutos["resultados"]["linhas"]["valores"][saldo] == pytest.approx(calculado["valores"][saldo], abs=0.005)
+
+
+def test_lote_isola_previsao_invalida(cliente):
+    historico = [float(100 + i % 12) for i in range(36)]
+    cenarios = [
+        dict(_dados(), id="a"),
+        {"id": "b", "historico_vendas": ["x"]},
+        {"id": "c", "historico_vendas": historico, "num_meses": "muitos"},
+        {"id": "d", "historico_vendas": historico, "previsao": {"modelo": "outro"}},
+        {"id": "e", "historico_vendas": historico},
+    ]
+    resposta = cliente.post("/calcular/lote", json={"cenarios": cenarios})
+    assert resposta.status_code == 200
+    linhas = [json.loads(linha) for linha in resposta.get_data(as_text=True).splitlines()]
+    erros = {linha["indice"] for linha in linhas if "error" in linha}
+    calculados = {linha["id"] for linha in linhas if "resultados" in linha}
+    assert (erros, calculados) == ({1, 2, 3}, {"a", "e"})
+
+
+def test_consultas_de_tarefas_nao_despacham(app, cliente, monkeypatch):
+    import app as modulo
+    import tarefas
+
+    monkeypatch.setattr(tarefas, "submeter", lambda *args: None)
+    orfa = cliente.post("/tarefas", json={"tipo": "calcular", "dados": _dados()}).get_json()["id"]
+    # Sem progresso há dois minutos, acima do limite configurado
+    app.config["TAREFA_SEM_PROGRESSO"] = 60
+    with app.app_context():
+        modulo.Job.query.filter_by(id=orfa).update({"updated_at": datetime.utcnow() - timedelta(seconds=120)})
+        modulo.db.session.commit()
+
+    despachos = []
+    despachar = modulo.despachar_tarefas
+    monkeypatch.setattr(modulo, "despachar_tarefas", lambda user_id: despachos.append(user_id) or despachar(user_id))
+    cliente.get("/tarefas")
+    cliente.get(f"/tarefas/{orfa}")
+    cliente.get(f"/tarefas/{orfa}/eventos").close()
+    assert despachos == []
+    assert cliente.get(f"/tarefas/{orfa}").get_json()["status"] == tarefas.EXECUTANDO
+
+    # A próxima submissão marca a tarefa sem progresso como interrompida
+    nova = cliente.post("/tarefas", json={"tipo": "calcular", "dados": _dados()}).get_json()["id"]
+    assert len(despachos) == 1
+    assert cliente.get(f"/tarefas/{orfa}").get_json()["status"] == tarefas.ERRO
+    assert cliente.get(f"/tarefas/{nova}").get_json()["status"] == tarefas.EXECUTANDO
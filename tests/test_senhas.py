@@ -0,0 +1,22 @@
+# Hash de senha na thread da requisição, limitado pelo semáforo de vagas.
+import pytest
+
+import senhas
+
+
+def test_hash_e_verificacao():
+    password_hash = senhas.gerar_hash("segredo")
+    assert senhas.verificar_senha(password_hash, "segredo")
+    assert not senhas.verificar_senha(password_hash, "outra")
+    assert not senhas.precisa_atualizar(password_hash)
+
+
+def test_sem_vaga_recusa_tentativa(monkeypatch):
+    monkeypatch.setattr(senhas, "_vagas", senhas.threading.BoundedSemaphore(1))
+    monkeypatch.setattr(senhas, "ESPERA_MAXIMA_HASH", 0.01)
+    senhas._vagas.acquire()
+    try:
+        with pytest.raises(senhas.ServicoOcupado):
+            senhas.gerar_hash("segredo")
+    finally:
+        senhas._vagas.release()